@@ -0,0 +1,238 @@
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from flask import Blueprint, abort, current_app, jsonify, request, url_for
+from flask_login import current_user
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload, load_only
+from werkzeug.exceptions import HTTPException
+
+from extensions import db
+from fragment_cache import viewer_role
+from listing import (InvalidCursor, dashboard_branches, dashboard_query, page_size, paginate_changed,
+                     paginate_responses, paginate_tickets, response_to_dict)
+from models import Ticket, User
+from routes import can_view_ticket
+
+# Part of every ETag: bump it when a representation changes shape
+API_VERSION = 'v1'
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+# --- Fields ---
+# name -> (columns to load, relationship to join or None, value from a ticket).
+# Relationships by name: author/agent are backrefs, defined once mappers configure.
+TICKET_FIELDS = {
+    'id': ((), None, lambda ticket: ticket.id),
+    'title': ((Ticket.title,), None, lambda ticket: ticket.title),
+    'description': ((Ticket.description,), None, lambda ticket: ticket.description),
+    'status': ((Ticket.status,), None, lambda ticket: ticket.status),
+    'priority': ((Ticket.priority,), None, lambda ticket: ticket.priority),
+    'category': ((Ticket.category,), None, lambda ticket: ticket.category),
+    'date_posted': ((), None, lambda ticket: ticket.date_posted.isoformat()),
+    'last_updated': ((), None, lambda ticket: ticket.last_updated.isoformat()),
+    'first_response_at': ((Ticket.first_response_at,), None, lambda ticket: _isoformat(ticket.first_response_at)),
+    'author': ((), 'author', lambda ticket: ticket.author.username),
+    'agent_id': ((), None, lambda ticket: ticket.agent_id),
+    'agent': ((), 'agent', lambda ticket: ticket.agent.username if ticket.agent else None),
+}
+# Same as the dashboards' JSON (listing.ticket_to_dict); ask for description explicitly
+LIST_FIELDS = ('id', 'title', 'status', 'priority', 'category', 'date_posted', 'last_updated', 'author', 'agent')
+RESPONSE_FIELDS = ('id', 'ticket_id', 'content', 'author', 'author_is_staff', 'is_internal_note', 'date_posted')
+# Always loaded: keys, access checks, cursors and ETags need them
+BASE_COLUMNS = (Ticket.id, Ticket.user_id, Ticket.agent_id, Ticket.date_posted, Ticket.last_updated)
+
+
+def requested_fields(available, default):
+    """The ?fields=a,b,c the client asked for, in our order; 400 on unknown names."""
+    raw = request.args.get('fields')
+    if not raw:
+        return tuple(default)
+    names = {name.strip() for name in raw.split(',') if name.strip()}
+    unknown = names.difference(available)
+    if unknown:
+        abort(400, f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in available if name in names or name == 'id')
+
+
+def ticket_options(fields):
+    """Load only the columns and joins these fields need."""
+    columns, options = list(BASE_COLUMNS), []
+    for name in fields:
+        field_columns, relationship, _ = TICKET_FIELDS[name]
+        columns.extend(field_columns)
+        if relationship is not None:
+            options.append(joinedload(getattr(Ticket, relationship)).load_only(User.username))
+    return [load_only(*columns)] + options
+
+
+def ticket_to_api(ticket, fields):
+    return {name: TICKET_FIELDS[name][2](ticket) for name in fields}
+
+
+# --- Conditional GET ---
+def etag_for(*parts):
+    raw = ':'.join(str(part) for part in (API_VERSION,) + parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+
+def is_fresh(etag, last_modified=None):
+    """
+    Whether the client's copy is current. If-None-Match wins when both are
+    sent; If-Modified-Since only has one-second resolution, so two changes
+    within the same second can hide the second one from it, never from the
+    ETag.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+
+def conditional_response(etag, last_modified, build):
+    """304 if the client is current, otherwise jsonify(build()); both with validators."""
+    if is_fresh(etag, last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    # Clients may keep a copy but must revalidate it; the body depends on who asks
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def ticket_stamp(ticket_id):
+    """
+    (user_id, agent_id, last_updated) for a ticket the current user may see,
+    by primary key and without loading anything else; 404 otherwise (don't
+    confirm the ticket exists).
+    """
+    stamp = db.session.execute(
+        select(Ticket.user_id, Ticket.agent_id, Ticket.last_updated).where(Ticket.id == ticket_id)
+    ).first()
+    if stamp is None or not can_view_ticket(stamp, current_user):
+        abort(404)
+    return stamp
+
+
+def parse_since(value):
+    """An ISO 8601 timestamp as naive UTC, like the columns it's compared to."""
+    try:
+        since = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        abort(400, 'updated_since must be an ISO 8601 timestamp')
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    return since
+
+
+# --- Hooks ---
+@api.before_request
+def require_login():
+    # Same session cookie as the web pages, but a 401 instead of a redirect to /login
+    if not current_user.is_authenticated:
+        return jsonify(error='Authentication required.'), 401
+
+
+@api.errorhandler(HTTPException)
+def json_error(error):
+    return jsonify(error=error.description), error.code
+
+
+# --- Endpoints ---
+@api.route('/tickets')
+def tickets():
+    """
+    The tickets the caller's dashboard shows, newest first. With
+    ?updated_since=<ISO timestamp>, only those changed at or after it,
+    oldest change first; the last page carries next_updated_since for the
+    next poll.
+    """
+    fields = requested_fields(TICKET_FIELDS, LIST_FIELDS)
+    cursor = request.args.get('cursor')
+    per_page = page_size(request.args.get('per_page'))
+    since = request.args.get('updated_since')
+    try:
+        if since:
+            since = parse_since(since)
+            page = paginate_changed(dashboard_query(current_user), since, cursor, per_page,
+                                    options=ticket_options(fields))
+        else:
+            page = paginate_tickets(dashboard_branches(current_user), cursor, per_page,
+                                    options=ticket_options(fields))
+    except InvalidCursor:
+        abort(400, 'Invalid cursor')
+
+    # A list has no single Last-Modified (a ticket can leave the caller's
+    # scope without anything getting newer), so only an ETag over the page
+    etag = etag_for('tickets', viewer_role(current_user), ','.join(fields), page.has_more,
+                    *(f'{ticket.id}@{ticket.last_updated.isoformat()}' for ticket in page.items))
+
+    def build():
+        body = {
+            'tickets': [ticket_to_api(ticket, fields) for ticket in page.items],
+            'next_cursor': page.next_cursor,
+            'next': url_for('api.tickets', cursor=page.next_cursor, per_page=request.args.get('per_page'),
+                            fields=request.args.get('fields'), updated_since=request.args.get('updated_since'))
+                    if page.has_more else None,
+        }
+        if since and not page.has_more:
+            # Start the next poll a little before the newest change seen:
+            # a write stamped earlier may commit (or reach the replica) later
+            newest = page.items[-1].last_updated if page.items else since
+            overlap = timedelta(seconds=current_app.config.get('API_DELTA_OVERLAP', 30))
+            body['next_updated_since'] = max(since, min(newest, datetime.utcnow() - overlap)).isoformat()
+        return body
+    return conditional_response(etag, None, build)
+
+
+@api.route('/tickets/<int:ticket_id>')
+def ticket(ticket_id):
+    fields = requested_fields(TICKET_FIELDS, TICKET_FIELDS)
+    stamp = ticket_stamp(ticket_id)
+    etag = etag_for('ticket', ticket_id, stamp.last_updated.isoformat(), ','.join(fields))
+
+    def build():
+        row = Ticket.query.options(*ticket_options(fields)).filter(Ticket.id == ticket_id).one()
+        return ticket_to_api(row, fields)
+    return conditional_response(etag, stamp.last_updated, build)
+
+
+@api.route('/tickets/<int:ticket_id>/responses')
+def ticket_responses(ticket_id):
+    """
+    A page of the ticket's responses (?before=<cursor> for older ones).
+    Every new response moves the ticket's last_updated, so an unchanged
+    thread is answered with 304 from the ticket row alone.
+    """
+    fields = requested_fields(RESPONSE_FIELDS, RESPONSE_FIELDS)
+    stamp = ticket_stamp(ticket_id)
+    before = request.args.get('before')
+    per_page = page_size(request.args.get('per_page'), 'RESPONSES_PER_PAGE', 20)
+    # Customers don't see internal notes, so the role is part of the ETag
+    etag = etag_for('responses', ticket_id, stamp.last_updated.isoformat(), viewer_role(current_user),
+                    ','.join(fields), before, per_page)
+
+    def build():
+        try:
+            page = paginate_responses(db.session.get(Ticket, ticket_id), current_user, before=before, per_page=per_page)
+        except InvalidCursor:
+            abort(400, 'Invalid cursor')
+        return {
+            'responses': [{name: value for name, value in response_to_dict(response).items() if name in fields}
+                          for response in page.items],
+            'next_cursor': page.next_cursor,
+            'next': url_for('api.ticket_responses', ticket_id=ticket_id, before=page.next_cursor,
+                            per_page=request.args.get('per_page'), fields=request.args.get('fields'))
+                    if page.has_more else None,
+        }
+    return conditional_response(etag, stamp.last_updated, build)
@@ -0,0 +1,247 @@
+import json
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import click
+from flask import current_app
+from sqlalchemy import DateTime, delete, insert, or_, select
+
+import duplicates
+from bulk import tickets_cli
+from extensions import db
+from identity_cache import get_identity_cache
+from models import (Attachment, ArchivedAttachment, Ticket, TicketArchive, TicketAudit, TicketDuplicate,
+                    TicketResponse, TicketSignature)
+from search import get_search_backend
+
+ARCHIVED_STATUS = 'Closed'
+COMPRESSION_LEVEL = 6
+
+# tickets archived, and the responses and attachments that went with them
+ArchiveResult = namedtuple('ArchiveResult', 'tickets responses attachments')
+# An archived ticket ready for the template, shaped like the live models
+ArchivedView = namedtuple('ArchivedView', 'ticket responses attachments')
+
+
+# --- Payloads ---
+def _dump(table, row):
+    """A table row as JSON-ready values (datetimes as ISO strings)."""
+    return {column.name: row[column.name].isoformat() if isinstance(row[column.name], datetime) else row[column.name]
+            for column in table.columns}
+
+
+def _load(table, values):
+    """The reverse of _dump: insert-ready values for the table."""
+    return {column.name: datetime.fromisoformat(values[column.name])
+            if isinstance(column.type, DateTime) and values.get(column.name) else values.get(column.name)
+            for column in table.columns}
+
+
+def pack(document):
+    return zlib.compress(json.dumps(document, separators=(',', ':')).encode('utf-8'), COMPRESSION_LEVEL)
+
+
+def unpack(payload):
+    return json.loads(zlib.decompress(payload))
+
+
+# --- Archiving ---
+def _by_ticket(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['ticket_id'], []).append(row)
+    return grouped
+
+
+def _archive_batch(ids, cutoff, now):
+    """
+    Archive one batch: every table is read with one query and emptied with
+    one DELETE per table. Tickets reopened or updated since they were picked
+    are skipped by the locking re-read.
+    """
+    tickets = db.session.execute(
+        select(Ticket.__table__)
+        .where(Ticket.id.in_(ids), Ticket.status == ARCHIVED_STATUS, Ticket.last_updated < cutoff)
+        .order_by(Ticket.id).with_for_update()
+    ).mappings().all()
+    if not tickets:
+        return ArchiveResult(0, 0, 0)
+    ids = [ticket['id'] for ticket in tickets]
+    responses = _by_ticket(db.session.execute(
+        select(TicketResponse.__table__).where(TicketResponse.ticket_id.in_(ids)).order_by(TicketResponse.id)
+    ).mappings())
+    files = _by_ticket(db.session.execute(
+        select(Attachment.__table__).where(Attachment.ticket_id.in_(ids)).order_by(Attachment.id)
+    ).mappings())
+    history = _by_ticket(db.session.execute(
+        select(TicketAudit.__table__).where(TicketAudit.ticket_id.in_(ids)).order_by(TicketAudit.id)
+    ).mappings())
+
+    db.session.execute(insert(TicketArchive), [{
+        'ticket_id': ticket['id'], 'user_id': ticket['user_id'], 'agent_id': ticket['agent_id'],
+        'title': ticket['title'], 'status': ticket['status'], 'priority': ticket['priority'],
+        'category': ticket['category'], 'date_posted': ticket['date_posted'],
+        'last_updated': ticket['last_updated'], 'archived_at': now,
+        'payload': pack({
+            'ticket': _dump(Ticket.__table__, ticket),
+            'responses': [_dump(TicketResponse.__table__, row) for row in responses.get(ticket['id'], ())],
+            'attachments': [_dump(Attachment.__table__, row) for row in files.get(ticket['id'], ())],
+            'audit': [_dump(TicketAudit.__table__, row) for row in history.get(ticket['id'], ())],
+        }),
+    } for ticket in tickets])
+    archived_files = [{'id': row['id'], 'ticket_id': row['ticket_id'], 'sha256': row['sha256']}
+                      for rows in files.values() for row in rows]
+    if archived_files:
+        db.session.execute(insert(ArchivedAttachment), archived_files)
+
+    # Children first, for the foreign keys. Signatures and duplicate links
+    # only matter for open tickets; a restore signs the ticket again.
+    for statement in (delete(Attachment).where(Attachment.ticket_id.in_(ids)),
+                      delete(TicketResponse).where(TicketResponse.ticket_id.in_(ids)),
+                      delete(TicketAudit).where(TicketAudit.ticket_id.in_(ids)),
+                      delete(TicketSignature).where(TicketSignature.ticket_id.in_(ids)),
+                      delete(TicketDuplicate).where(or_(TicketDuplicate.ticket_id.in_(ids),
+                                                        TicketDuplicate.duplicate_of_id.in_(ids))),
+                      delete(Ticket).where(Ticket.id.in_(ids))):
+        db.session.execute(statement.execution_options(synchronize_session=False))
+    get_search_backend().remove_tickets(ids)
+    return ArchiveResult(len(ids), sum(len(rows) for rows in responses.values()), len(archived_files))
+
+
+def archive_tickets(older_than_days, batch_size=500, now=None):
+    """
+    Move Closed tickets not updated for `older_than_days` days, with their
+    responses, attachment rows and audit trail, out of the hot tables into
+    ticket_archive. Walks the candidates by primary key and commits per
+    batch of `batch_size`, so it can be stopped and re-run at any point.
+    The ticket counters still count archived tickets (stats.py), and report
+    history (ticket_event) stays where it is.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(days=older_than_days)
+    totals, last_id = ArchiveResult(0, 0, 0), 0
+    while True:
+        # last_updated >= date_posted, so the date_posted bound is implied;
+        # it lets ix_ticket_status_date_posted narrow the scan.
+        ids = db.session.execute(
+            select(Ticket.id)
+            .where(Ticket.status == ARCHIVED_STATUS, Ticket.date_posted < cutoff, Ticket.last_updated < cutoff,
+                   Ticket.id > last_id)
+            .order_by(Ticket.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        result = _archive_batch(ids, cutoff, now)
+        db.session.commit()
+        totals = ArchiveResult(*(total + count for total, count in zip(totals, result)))
+        last_id = ids[-1]
+    return totals
+
+
+def restore_tickets(ticket_ids, now=None):
+    """
+    Put archived tickets back in the hot tables, under their original ids,
+    with their responses, attachments and audit trail. They count as
+    updated `now`, so the next archive run leaves them alone for another
+    full period. Returns the ids restored (the others weren't archived).
+    Commits.
+    """
+    now = now or datetime.utcnow()
+    archived = db.session.execute(
+        select(TicketArchive).where(TicketArchive.ticket_id.in_(list(ticket_ids)))
+        .order_by(TicketArchive.ticket_id).with_for_update()
+    ).scalars().all()
+    if not archived:
+        return []
+    documents = [unpack(row.payload) for row in archived]
+    tickets = [dict(_load(Ticket.__table__, document['ticket']), last_updated=now) for document in documents]
+    responses = [_load(TicketResponse.__table__, row) for document in documents for row in document['responses']]
+    files = [_load(Attachment.__table__, row) for document in documents for row in document['attachments']]
+    history = [_load(TicketAudit.__table__, row) for document in documents for row in document['audit']]
+    db.session.execute(insert(Ticket), tickets)
+    for model, rows in ((TicketResponse, responses), (Attachment, files), (TicketAudit, history)):
+        if rows:
+            db.session.execute(insert(model), rows)
+
+    ids = [row.ticket_id for row in archived]
+    signatures = []
+    for ticket in tickets:
+        keys = duplicates.band_keys(duplicates.ticket_text(ticket['title'], ticket['description']))
+        if keys is not None:
+            signatures.append({'ticket_id': ticket['id'], 'bands': keys.tobytes()})
+    if signatures:
+        db.session.execute(insert(TicketSignature), signatures)
+        duplicates.request_rebuild() # their ids are below every worker's watermark
+    search = get_search_backend()
+    for ticket in tickets:
+        search.index_ticket(SimpleNamespace(**ticket))
+    for response in responses:
+        search.index_response(SimpleNamespace(**response))
+    db.session.execute(delete(ArchivedAttachment).where(ArchivedAttachment.ticket_id.in_(ids)))
+    db.session.execute(delete(TicketArchive).where(TicketArchive.ticket_id.in_(ids)))
+    db.session.commit()
+    return ids
+
+
+# --- Reading ---
+def ticket_view(archived, viewer):
+    """
+    An archived ticket as the detail page shows it: the ticket, its
+    responses (without internal notes for customers) and attachments, with
+    users resolved through the identity cache.
+    """
+    document = unpack(archived.payload)
+    staff = viewer.is_agent or viewer.is_admin
+    users = get_identity_cache()
+    ticket = SimpleNamespace(**_load(Ticket.__table__, document['ticket']), archived_at=archived.archived_at)
+    ticket.author = users.get_user(ticket.user_id)
+    ticket.agent = users.get_user(ticket.agent_id) if ticket.agent_id else None
+    responses = [SimpleNamespace(**values, responder=users.get_user(values['user_id']))
+                 for values in (_load(TicketResponse.__table__, row) for row in document['responses'])
+                 if staff or not values['is_internal_note']]
+    visible = {response.id for response in responses}
+    files = [SimpleNamespace(**values, uploader=users.get_user(values['uploader_id']))
+             for values in (_load(Attachment.__table__, row) for row in document['attachments'])
+             if values['response_id'] is None or values['response_id'] in visible]
+    responses.sort(key=lambda response: (response.date_posted, response.id)) # oldest first, like the live page
+    return ArchivedView(ticket, responses, files)
+
+
+def find_attachment(attachment_id, viewer):
+    """
+    (archived ticket, attachment) for an archived attachment the viewer
+    may download (ticket permissions are the caller's), or None.
+    """
+    row = db.session.get(ArchivedAttachment, attachment_id)
+    if row is None:
+        return None
+    archived = db.session.get(TicketArchive, row.ticket_id)
+    view = ticket_view(archived, viewer)
+    for attachment in view.attachments:
+        if attachment.id == attachment_id:
+            return archived, attachment
+    return None
+
+
+# --- CLI ---
+@tickets_cli.command('archive')
+@click.option('--older-than', type=int, help='Days since the ticket was last updated [default: ARCHIVE_AFTER_DAYS].')
+@click.option('--batch-size', type=int, help='Tickets per transaction [default: ARCHIVE_BATCH_SIZE].')
+def archive_command(older_than, batch_size):
+    """Move old Closed tickets out of the hot tables."""
+    config = current_app.config
+    result = archive_tickets(older_than if older_than is not None else config.get('ARCHIVE_AFTER_DAYS', 365),
+                             batch_size or config.get('ARCHIVE_BATCH_SIZE', 500))
+    click.echo(f"Archived {result.tickets} tickets ({result.responses} responses, "
+               f"{result.attachments} attachments).")
+
+
+@tickets_cli.command('restore')
+@click.argument('ticket_ids', nargs=-1, type=int, required=True)
+def restore_command(ticket_ids):
+    """Move archived tickets back into the hot tables."""
+    restored = restore_tickets(ticket_ids)
+    missing = sorted(set(ticket_ids) - set(restored))
+    click.echo(f"Restored {len(restored)} tickets." + (f" Not archived: {', '.join(map(str, missing))}." if missing else ''))
@@ -0,0 +1,285 @@
+import hashlib
+import mimetypes
+import os
+import tempfile
+import time
+from urllib.parse import quote
+
+import click
+from flask import Response, current_app, send_file, url_for
+from flask.cli import AppGroup
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import ArchivedAttachment, Attachment, TicketResponse
+from replicas import replica_reads
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+attachments_cli = AppGroup('attachments', help='Maintain the attachment store.')
+
+
+class AttachmentError(Exception):
+    """An upload was refused; the message is safe to show the user."""
+
+    status_code = 400
+
+
+class QuotaExceeded(AttachmentError):
+    status_code = 413
+
+
+# --- Storage ---
+class LocalAttachmentStore:
+    """
+    Files on local disk (or a shared mount), named by the SHA-256 of their
+    content: root/ab/cd/abcd.... Uploads are streamed to a temp file in the
+    same filesystem in fixed-size chunks, hashed on the way, then renamed
+    into place, so a half-written upload is never visible and a file that
+    is already stored is simply dropped.
+    """
+
+    def __init__(self, root, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.root = os.path.abspath(root)
+        self.chunk_size = chunk_size
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def relative_path(self, sha256):
+        # Also the tail of the X-Accel-Redirect URL, hence always '/'
+        return f'{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+    def path(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def save(self, stream, max_bytes):
+        """
+        Copy `stream` into the store. Returns (sha256, size). Raises
+        QuotaExceeded as soon as more than max_bytes have been read, without
+        reading the rest.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        handle, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(handle, 'wb') as out:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise QuotaExceeded(f'File is larger than the {format_size(max_bytes)} you have left.')
+                    digest.update(chunk)
+                    out.write(chunk)
+            sha256 = digest.hexdigest()
+            final_path = self.path(sha256)
+            if os.path.exists(final_path):
+                # Duplicate: keep the stored copy, but mark it recently used so
+                # gc's grace period covers the row we are about to commit
+                os.utime(final_path)
+            else:
+                os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                os.replace(tmp_path, final_path)
+                tmp_path = None
+            return sha256, size
+        finally:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, sha256):
+        try:
+            os.remove(self.path(sha256))
+        except FileNotFoundError:
+            pass
+
+    def stored(self):
+        """Yield (sha256, mtime) for every stored file."""
+        for directory, subdirectories, files in os.walk(self.root):
+            if directory == self.tmp_dir:
+                subdirectories[:] = []
+                continue
+            for name in files:
+                if len(name) == 64:
+                    yield name, os.path.getmtime(os.path.join(directory, name))
+
+
+def get_attachment_store():
+    store = current_app.extensions.get('attachment_store')
+    if store is None:
+        config = current_app.config
+        store = LocalAttachmentStore(config.get('ATTACHMENT_ROOT') or os.path.join(current_app.instance_path, 'attachments'),
+                                     chunk_size=config.get('ATTACHMENT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE))
+        current_app.extensions['attachment_store'] = store
+    return store
+
+
+def format_size(size):
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'bytes' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+# --- Quotas ---
+def remaining_quota(ticket, uploader):
+    """Bytes this user may still add to this ticket: the smallest of the file, ticket and user limits."""
+    config = current_app.config
+    ticket_used, user_used = db.session.execute(
+        select(
+            select(func.coalesce(func.sum(Attachment.size), 0)).where(Attachment.ticket_id == ticket.id).scalar_subquery(),
+            select(func.coalesce(func.sum(Attachment.size), 0)).where(Attachment.uploader_id == uploader.id).scalar_subquery(),
+        )
+    ).one()
+    return min(config.get('ATTACHMENT_MAX_SIZE', 512 * 2 ** 20),
+               config.get('ATTACHMENT_TICKET_QUOTA', 2 * 2 ** 30) - int(ticket_used),
+               config.get('ATTACHMENT_USER_QUOTA', 10 * 2 ** 30) - int(user_used))
+
+
+# --- Uploads (request side) ---
+def save_upload(stream, filename, ticket, uploader, response=None, content_length=None):
+    """
+    Stream one upload into the store and add its Attachment row to the
+    session (the caller commits). `stream` is anything with read(n): a
+    FileStorage from a form, or request.stream for raw uploads.
+    """
+    filename = os.path.basename((filename or '').replace('\\', '/')).strip()[:255]
+    if not filename:
+        raise AttachmentError('The file needs a name.')
+    allowance = remaining_quota(ticket, uploader)
+    if allowance <= 0:
+        raise QuotaExceeded('The attachment quota for this ticket or account is used up.')
+    if content_length is not None and content_length > allowance:
+        raise QuotaExceeded(f'File is larger than the {format_size(allowance)} you have left.')
+    sha256, size = get_attachment_store().save(stream, allowance)
+    if size == 0:
+        raise AttachmentError(f'{filename} is empty.')
+    attachment = Attachment(ticket_id=ticket.id, response_id=response.id if response else None,
+                            uploader_id=uploader.id, filename=filename, size=size, sha256=sha256,
+                            content_type=(mimetypes.guess_type(filename)[0] or 'application/octet-stream')[:100])
+    db.session.add(attachment)
+    return attachment
+
+
+def attachment_to_dict(attachment):
+    return {
+        'id': attachment.id,
+        'ticket_id': attachment.ticket_id,
+        'response_id': attachment.response_id,
+        'filename': attachment.filename,
+        'content_type': attachment.content_type,
+        'size': attachment.size,
+        'sha256': attachment.sha256,
+        'created_at': attachment.created_at.isoformat() if attachment.created_at else None,
+        'url': url_for('main.download_attachment', attachment_id=attachment.id, filename=attachment.filename),
+    }
+
+
+def visible_attachments(ticket, viewer):
+    """The ticket's attachments, without those on internal notes for customers."""
+    query = Attachment.query.options(joinedload(Attachment.uploader)).filter(Attachment.ticket_id == ticket.id)
+    if not (viewer.is_agent or viewer.is_admin):
+        query = query.outerjoin(TicketResponse, TicketResponse.id == Attachment.response_id).filter(
+            or_(Attachment.response_id.is_(None), TicketResponse.is_internal_note == False))
+    return query.order_by(Attachment.created_at, Attachment.id).all()
+
+
+def can_view_attachment(attachment, viewer):
+    if attachment.response_id is not None and attachment.response.is_internal_note:
+        return viewer.is_agent or viewer.is_admin
+    return True
+
+
+# --- Downloads ---
+def _content_disposition(filename):
+    ascii_name = filename.encode('ascii', 'ignore').decode('ascii').replace('"', '') or 'download'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def download_response(attachment):
+    """
+    Send an attachment. By default Flask streams the file itself, with
+    Range and conditional-GET support (the SHA-256 is a perfect ETag). With
+    ATTACHMENT_SENDFILE = 'x-accel' or 'x-sendfile' the worker only sets a
+    header and nginx/Apache send the bytes.
+    """
+    config = current_app.config
+    store = get_attachment_store()
+    mode = config.get('ATTACHMENT_SENDFILE')
+    if mode in ('x-accel', 'x-sendfile'):
+        response = Response(mimetype=attachment.content_type)
+        if mode == 'x-accel':
+            prefix = config.get('ATTACHMENT_ACCEL_PREFIX', '/protected-attachments/').rstrip('/')
+            response.headers['X-Accel-Redirect'] = f"{prefix}/{store.relative_path(attachment.sha256)}"
+        else:
+            response.headers['X-Sendfile'] = store.path(attachment.sha256)
+        response.headers['Content-Disposition'] = _content_disposition(attachment.filename)
+        response.set_etag(attachment.sha256)
+    else:
+        response = send_file(store.path(attachment.sha256), mimetype=attachment.content_type,
+                             as_attachment=True, download_name=attachment.filename,
+                             etag=attachment.sha256, last_modified=attachment.created_at, conditional=True)
+    # Content never changes under a given URL, but it is private to the ticket
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+
+# --- Maintenance ---
+def collect_garbage(grace_seconds=3600, dry_run=False):
+    """
+    Delete stored files no attachment row refers to, live or archived. Files
+    touched within `grace_seconds` are kept: their row may not be committed yet.
+    Returns (files removed, bytes freed).
+    """
+    store = get_attachment_store()
+    cutoff = time.time() - grace_seconds
+    removed = freed = 0
+    candidates = {}
+    for sha256, mtime in store.stored():
+        if mtime < cutoff:
+            candidates[sha256] = None
+        if len(candidates) >= 1000:
+            removed, freed = _collect(store, candidates, removed, freed, dry_run)
+            candidates = {}
+    return _collect(store, candidates, removed, freed, dry_run)
+
+
+def _collect(store, candidates, removed, freed, dry_run):
+    if not candidates:
+        return removed, freed
+    referenced = set(db.session.execute(
+        select(Attachment.sha256).where(Attachment.sha256.in_(candidates))
+        .union(select(ArchivedAttachment.sha256).where(ArchivedAttachment.sha256.in_(candidates)))
+    ).scalars())
+    for sha256 in candidates.keys() - referenced:
+        freed += os.path.getsize(store.path(sha256))
+        removed += 1
+        if not dry_run:
+            store.delete(sha256)
+    return removed, freed
+
+
+@attachments_cli.command('gc')
+@click.option('--grace', type=int, default=3600, show_default=True, help='Keep files touched this many seconds ago.')
+@click.option('--dry-run', is_flag=True, help='Only report what would be deleted.')
+def gc_command(grace, dry_run):
+    """Delete stored files no attachment refers to any more."""
+    removed, freed = collect_garbage(grace, dry_run)
+    click.echo(f"{'Would remove' if dry_run else 'Removed'} {removed} files ({format_size(freed)}).")
+
+
+@attachments_cli.command('usage')
+def usage_command():
+    """Show uploaded vs stored bytes (what dedup saves)."""
+    per_file = select(func.max(Attachment.size).label('size')).group_by(Attachment.sha256).subquery()
+    with replica_reads(): # two scans of the whole table
+        count, uploaded = db.session.execute(
+            select(func.count(Attachment.id), func.coalesce(func.sum(Attachment.size), 0))
+        ).one()
+        files, stored = db.session.execute(
+            select(func.count(), func.coalesce(func.sum(per_file.c.size), 0)).select_from(per_file)
+        ).one()
+    click.echo(f"{count} attachments, {format_size(int(uploaded))} uploaded; "
+               f"{files} files, {format_size(int(stored))} stored.")
@@ -0,0 +1,63 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import insert, select
+
+from extensions import db
+from models import TicketAudit, User
+
+# Fields whose values are user ids, shown as usernames
+USER_FIELDS = ('agent',)
+
+# One line of a ticket's history, ready for the template
+AuditEntry = namedtuple('AuditEntry', 'created_at actor field old_value new_value batch_id')
+
+
+def _text(value):
+    return None if value is None else str(value)[:50]
+
+
+def audit_row(ticket_id, actor_id, field, old_value, new_value, now, batch_id=None):
+    """A ticket_audit row as a dict, for record_changes()."""
+    return {'ticket_id': ticket_id, 'actor_id': actor_id, 'field': field, 'old_value': _text(old_value),
+            'new_value': _text(new_value), 'batch_id': batch_id, 'created_at': now}
+
+
+# --- Hooks called from routes.py, inside the same transaction as the change ---
+def record_change(ticket, actor, field, old_value, new_value, now=None):
+    """One field of one ticket changed; `actor` is None for the system."""
+    if old_value == new_value:
+        return
+    db.session.add(TicketAudit(**audit_row(ticket.id, actor.id if actor is not None else None, field,
+                                           old_value, new_value, now or ticket.last_updated or datetime.utcnow())))
+
+
+def record_changes(rows):
+    """Many audit_row()s in one INSERT (batch operations)."""
+    if rows:
+        db.session.execute(insert(TicketAudit), rows)
+
+
+# --- Reading ---
+def ticket_history(ticket_id, limit=50):
+    """The ticket's newest `limit` changes, with user ids resolved to usernames in one query."""
+    rows = db.session.execute(
+        select(TicketAudit).where(TicketAudit.ticket_id == ticket_id)
+        .order_by(TicketAudit.created_at.desc(), TicketAudit.id.desc()).limit(limit)
+    ).scalars().all()
+    user_ids = {row.actor_id for row in rows if row.actor_id is not None}
+    for row in rows:
+        if row.field in USER_FIELDS:
+            user_ids.update(int(value) for value in (row.old_value, row.new_value) if value and value.isdigit())
+    names = dict(db.session.execute(select(User.id, User.username).where(User.id.in_(user_ids))).all()) if user_ids else {}
+
+    def shown(field, value):
+        if field in USER_FIELDS:
+            return names.get(int(value), f'#{value}') if value and value.isdigit() else 'Unassigned'
+        if field in ('merged_into', 'merged'):
+            return f'#{value}' if value else None
+        return value
+
+    return [AuditEntry(row.created_at, names.get(row.actor_id, 'system') if row.actor_id else 'system', row.field,
+                       shown(row.field, row.old_value), shown(row.field, row.new_value), row.batch_id)
+            for row in rows]
@@ -0,0 +1,215 @@
+import uuid
+from collections import namedtuple
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import current_app
+from sqlalchemy import case, null, update
+from sqlalchemy.orm import joinedload
+
+import audit
+import events
+import notifications
+import reports
+import routing
+import sla
+import stats
+from bulk import batched
+from extensions import db
+from listing import dashboard_query
+from models import Attachment, Ticket, TicketResponse, User
+from search import get_search_backend
+
+# Passed as agent_id to leave the assignment alone (None means unassign)
+UNCHANGED = object()
+MERGED_STATUS = 'Closed'
+# Ticket columns -> audit field names
+AUDITED = {'agent_id': 'agent', 'status': 'status', 'priority': 'priority', 'merged_into_id': 'merged_into'}
+
+# changed: tickets updated; unchanged: selected but already had the new
+# values; refused: ids the actor may not change (or that don't exist).
+# moved: responses moved to the canonical ticket (merges only).
+BatchResult = namedtuple('BatchResult', 'changed unchanged refused moved')
+
+
+class BatchError(ValueError):
+    """A batch was refused as a whole; the message is safe to show the user."""
+
+
+def _ticket_ids(ticket_ids):
+    ids = sorted({int(ticket_id) for ticket_id in ticket_ids})
+    limit = current_app.config.get('BATCH_MAX_TICKETS', 1000)
+    if not ids:
+        raise BatchError('Select at least one ticket.')
+    if len(ids) > limit:
+        raise BatchError(f'Select at most {limit} tickets at a time.')
+    return ids
+
+
+def _lock(ids, actor):
+    """
+    The tickets in `ids` the actor's dashboard shows, locked FOR UPDATE in
+    id order (so two batches over the same tickets queue instead of
+    deadlocking), with what the hooks need and nothing else.
+    """
+    rows = (dashboard_query(actor)
+            .join(User, User.id == Ticket.user_id)
+            .with_entities(Ticket.id, Ticket.user_id, Ticket.agent_id, Ticket.status, Ticket.priority,
+                           Ticket.category, Ticket.title, Ticket.date_posted, Ticket.merged_into_id,
+                           User.email.label('author_email'))
+            .filter(Ticket.id.in_(ids))
+            .order_by(Ticket.id)
+            .with_for_update(of=Ticket)
+            .all())
+    return [row._asdict() for row in rows]
+
+
+def _apply(changes, values, actor, now, batch_id):
+    """
+    Write one chunk: a single UPDATE ... WHERE id IN (...) for the changed
+    tickets, then every derived table with its bulk hook, so counters, loads,
+    SLA deadlines, report history and the audit trail move in the same
+    transaction. `changes` are (row, {column: new value}) pairs, only for
+    columns whose value actually differs.
+    """
+    ids = [row['id'] for row, diff in changes]
+    pairs = [(row, {**row, **values, 'last_updated': now}) for row, diff in changes]
+    update_values = dict(values, last_updated=now)
+
+    # Staff acted: restart the SLA clock of every ticket whose status or
+    # priority moved (as sla.record_status_change does for one ticket). The
+    # deadline depends on priority and category, so it is a CASE over the
+    # few distinct deadlines in the chunk rather than one UPDATE per ticket.
+    deadlines = {}
+    for (row, diff), (before, after) in zip(changes, pairs):
+        if 'status' in diff or 'priority' in diff:
+            due = sla.due_at(after['priority'], after['category'], after['status'], now)
+            deadlines.setdefault(due, []).append(row['id'])
+    if deadlines:
+        restarted = [ticket_id for group in deadlines.values() for ticket_id in group]
+        update_values['sla_due_at'] = case(
+            *((Ticket.id.in_(group), null() if due is None else due) for due, group in deadlines.items()),
+            else_=Ticket.sla_due_at)
+        update_values['sla_level'] = case((Ticket.id.in_(restarted), 0), else_=Ticket.sla_level)
+
+    db.session.execute(update(Ticket).where(Ticket.id.in_(ids)).values(**update_values)
+                       .execution_options(synchronize_session=False))
+
+    stats.record_bulk_changes(pairs)
+    routing.record_bulk_changes(pairs)
+    status_changes = [(SimpleNamespace(**after), before['status']) for before, after in pairs
+                      if before['status'] != after['status']]
+    reports.record_status_changes(status_changes, now)
+    notifications.enqueue_status_changes(
+        [(ticket, old_status, ticket.author_email) for ticket, old_status in status_changes], actor)
+    audit.record_changes([audit.audit_row(row['id'], actor.id, AUDITED[column], row[column], value, now, batch_id)
+                          for row, diff in changes for column, value in diff.items()])
+
+
+def _publish(ids, previous_agents):
+    """After the commit: tell open pages, a chunk of tickets per query."""
+    for chunk in batched(ids, current_app.config.get('BATCH_CHUNK_SIZE', 500)):
+        tickets = (Ticket.query.options(joinedload(Ticket.author), joinedload(Ticket.agent))
+                   .filter(Ticket.id.in_(chunk)).all())
+        for ticket in tickets:
+            previous_agent_id = previous_agents.get(ticket.id, ticket.agent_id)
+            if previous_agent_id != ticket.agent_id:
+                events.publish_ticket_event(events.ASSIGNED, ticket, previous_agent_id=previous_agent_id)
+            else:
+                events.publish_ticket_event(events.STATUS_CHANGED, ticket)
+
+
+def update_tickets(ticket_ids, actor, agent_id=UNCHANGED, status=None, priority=None, now=None):
+    """
+    Assign, set the status of, and/or set the priority of many tickets in one
+    transaction, BATCH_CHUNK_SIZE tickets per UPDATE. Tickets outside the
+    actor's dashboard are refused and those that already have the new values
+    are left alone (no last_updated bump, no audit row). Commits.
+    """
+    values = {}
+    if agent_id is not UNCHANGED:
+        values['agent_id'] = agent_id
+    if status:
+        values['status'] = status
+    if priority:
+        values['priority'] = priority
+    if not values:
+        raise BatchError('Choose an agent, status or priority to apply.')
+    ids = _ticket_ids(ticket_ids)
+    now = now or datetime.utcnow()
+    batch_id = uuid.uuid4().hex
+    changed, unchanged, previous_agents = [], 0, {}
+    for chunk in batched(ids, current_app.config.get('BATCH_CHUNK_SIZE', 500)):
+        rows = _lock(chunk, actor)
+        changes = []
+        for row in rows:
+            diff = {column: value for column, value in values.items() if row[column] != value}
+            if diff:
+                changes.append((row, diff))
+        unchanged += len(rows) - len(changes)
+        if changes:
+            _apply(changes, values, actor, now, batch_id)
+            changed.extend(row['id'] for row, diff in changes)
+            previous_agents.update((row['id'], row['agent_id']) for row, diff in changes)
+    db.session.commit()
+    _publish(changed, previous_agents)
+    return BatchResult(len(changed), unchanged, len(ids) - len(changed) - unchanged, 0)
+
+
+def merge_tickets(canonical_id, duplicate_ids, actor, now=None):
+    """
+    Merge duplicates into a canonical ticket in one transaction: their
+    responses and attachments move over with one UPDATE per chunk each, and
+    the duplicates are closed with merged_into_id pointing at it (through
+    the same bulk hooks as update_tickets). Only tickets filed by the
+    canonical ticket's author can be merged into it: moving another
+    customer's thread would show it to them and hide it from its author.
+    Commits.
+    """
+    ids = [ticket_id for ticket_id in _ticket_ids(duplicate_ids) if ticket_id != canonical_id]
+    if not ids:
+        raise BatchError('Select the duplicates to merge, besides the ticket they merge into.')
+    now = now or datetime.utcnow()
+    # Lock the canonical ticket first: a merge into it can't race one out of it
+    canonical = _lock([canonical_id], actor)
+    if not canonical:
+        raise BatchError(f'Ticket #{canonical_id} was not found.')
+    if canonical[0]['merged_into_id'] is not None:
+        raise BatchError(f"Ticket #{canonical_id} was itself merged into #{canonical[0]['merged_into_id']}.")
+    values = {'status': MERGED_STATUS, 'merged_into_id': canonical_id}
+    batch_id = uuid.uuid4().hex
+    search = get_search_backend()
+    merged, unchanged, moved, previous_agents = [], 0, 0, {}
+    for chunk in batched(ids, current_app.config.get('BATCH_CHUNK_SIZE', 500)):
+        rows = _lock(chunk, actor)
+        duplicates = [row for row in rows if row['merged_into_id'] is None]
+        others = [row['id'] for row in duplicates if row['user_id'] != canonical[0]['user_id']]
+        if others:
+            raise BatchError(f"Ticket{'s' if len(others) > 1 else ''} {', '.join(f'#{ticket_id}' for ticket_id in others)} "
+                             f"{'were' if len(others) > 1 else 'was'} filed by a different customer than "
+                             f"#{canonical_id}; only one customer's tickets can be merged.")
+        unchanged += len(rows) - len(duplicates)
+        if not duplicates:
+            continue
+        duplicate_ids = [row['id'] for row in duplicates]
+        moved += db.session.execute(
+            update(TicketResponse).where(TicketResponse.ticket_id.in_(duplicate_ids))
+            .values(ticket_id=canonical_id).execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.execute(
+            update(Attachment).where(Attachment.ticket_id.in_(duplicate_ids))
+            .values(ticket_id=canonical_id).execution_options(synchronize_session=False))
+        search.move_responses(duplicate_ids, canonical_id)
+        _apply([(row, {column: value for column, value in values.items() if row[column] != value})
+                for row in duplicates], values, actor, now, batch_id)
+        audit.record_changes([audit.audit_row(canonical_id, actor.id, 'merged', None, ticket_id, now, batch_id)
+                              for ticket_id in duplicate_ids])
+        merged.extend(duplicate_ids)
+        previous_agents.update((row['id'], row['agent_id']) for row in duplicates)
+    if merged:
+        # Its thread changed: new ETags, fragment cache keys and API deltas
+        db.session.execute(update(Ticket).where(Ticket.id == canonical_id).values(last_updated=now)
+                           .execution_options(synchronize_session=False))
+    db.session.commit()
+    _publish(merged + ([canonical_id] if merged else []), previous_agents)
+    return BatchResult(len(merged), unchanged, len(ids) - len(merged) - unchanged, moved)
@@ -0,0 +1 @@
+"""Benchmarks for the ticketing app. Run modules with `python -m benchmarks.<name>`."""
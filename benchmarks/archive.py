@@ -0,0 +1,110 @@
+"""
+Archival: what `flask tickets archive` costs and what it takes off the hot
+tables.
+
+Generates tickets spread over --days into a throwaway SQLite database,
+then archives the Closed ones older than --older-than days and reports:
+- the job: wall time and tickets per second;
+- hot table rows (tickets, responses) before and after;
+- payload size: compressed bytes per archived ticket against its JSON;
+- reads: a status-filtered count over the hot tables before and after
+  (what table and index size cost), and opening an archived ticket
+  (archive.ticket_view) against opening a live one;
+- restoring one ticket.
+
+    python -m benchmarks.archive --tickets 50000 --responses 5 --days 1095
+"""
+import argparse
+import os
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+from benchmarks.common import build_app, environment, sqlite_url, summarize, write_results
+from benchmarks.generate import generate, refresh_derived
+
+END = datetime(2025, 1, 1)
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, percentiles=(50, 95))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, default=50000)
+    parser.add_argument('--responses', type=float, default=5, help='mean responses per ticket')
+    parser.add_argument('--days', type=int, default=1095, help='spread ticket dates over this many days')
+    parser.add_argument('--older-than', type=int, default=365, help='archive Closed tickets older than this')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=50, help='timed runs per read')
+    parser.add_argument('--out', help='write a JSON summary to this file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, db = build_app(sqlite_url(os.path.join(tmp, 'archive.db')))
+        import archive
+        from models import Ticket, TicketArchive, TicketResponse, User
+        with app.app_context(), app.test_request_context():
+            db.create_all()
+            rows = generate(db, users=max(100, args.tickets // 20), tickets=args.tickets, responses=args.responses,
+                            days=args.days, now=END)
+            refresh_derived(db)
+            admin = User.query.filter_by(is_admin=True).first()
+
+            def hot_rows():
+                return {'tickets': db.session.query(Ticket).count(),
+                        'responses': db.session.query(TicketResponse).count()}
+
+            def open_count():
+                return db.session.query(Ticket).filter(Ticket.status == 'Open').count()
+
+            def live_view(ticket_id):
+                ticket = db.session.get(Ticket, ticket_id)
+                return ticket, ticket.responses.all()
+
+            before = {'rows': hot_rows(), 'open_count': timed(open_count, args.repeat)}
+            live_id = db.session.query(Ticket.id).filter(Ticket.status != 'Closed').first()[0]
+            started = time.perf_counter()
+            result = archive.archive_tickets(args.older_than, args.batch_size, now=END)
+            archive_s = time.perf_counter() - started
+            after = {'rows': hot_rows(), 'open_count': timed(open_count, args.repeat)}
+
+            payloads = db.session.query(TicketArchive.payload).all()
+            compressed = sum(len(payload) for payload, in payloads)
+            raw = sum(len(zlib.decompress(payload)) for payload, in payloads)
+            archived_id = db.session.query(TicketArchive.ticket_id).order_by(TicketArchive.ticket_id.desc()).first()[0]
+            reads = {
+                'live_ticket': timed(lambda: (live_view(live_id), db.session.rollback()), args.repeat),
+                'archived_ticket': timed(lambda: (archive.ticket_view(db.session.get(TicketArchive, archived_id), admin),
+                                                  db.session.rollback()), args.repeat),
+            }
+            started = time.perf_counter()
+            archive.restore_tickets([archived_id])
+            restore_s = time.perf_counter() - started
+
+    write_results({
+        'benchmark': 'archive',
+        'environment': environment(),
+        'params': vars(args),
+        'rows': rows,
+        'archive': dict(result._asdict(), wall_s=round(archive_s, 2),
+                        tickets_per_s=round(result.tickets / archive_s) if archive_s else None),
+        'hot_before': before,
+        'hot_after': after,
+        'payload': {'tickets': len(payloads), 'compressed_bytes_per_ticket': round(compressed / max(len(payloads), 1)),
+                    'json_bytes_per_ticket': round(raw / max(len(payloads), 1)),
+                    'ratio': round(raw / compressed, 2) if compressed else None},
+        'reads': reads,
+        'restore_one_s': round(restore_s, 4),
+    }, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""Helpers shared by the benchmark modules: building the app, timing, RSS and JSON output."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError: # Windows: peak RSS is reported as None
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples, percentiles=(50, 95, 99)):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    summary = {'count': len(samples)}
+    for pct in percentiles:
+        summary[f'p{pct}_ms'] = round(percentile(samples, pct) * 1000, 2) if samples else None
+    summary['mean_ms'] = round(statistics.mean(samples) * 1000, 2) if samples else None
+    return summary
+
+
+def build_app(database_url, **config):
+    """
+    Build the app against `database_url`, with CSRF off so scripts can post
+    forms and rate limiting off since every virtual user shares one address.
+    """
+    config.setdefault('RATE_LIMIT_ENABLED', False)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    from app import create_app
+    from extensions import db
+    app = create_app('production', SECRET_KEY='benchmark', SQLALCHEMY_DATABASE_URI=database_url,
+                     WTF_CSRF_ENABLED=False, TESTING=True, **config)
+    return app, db
+
+
+def sqlite_url(path):
+    return f'sqlite:///{os.path.abspath(path)}'
+
+
+# --- Measurements ---
+def rss_mb():
+    """(current, peak) resident set size of this process in MB."""
+    current = peak = None
+    try:
+        with open('/proc/self/statm') as handle:
+            current = int(handle.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports KB, macOS bytes
+        peak = peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+    return (round(current, 1) if current else None, round(peak, 1) if peak else None)
+
+
+class QueryCounter:
+    """
+    Counts SQL statements per thread by listening to the engine's cursor
+    events. Wrap each request in `with counter.measure() as result:` and read
+    result['queries'] afterwards.
+    """
+
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self._local = threading.local()
+        event.listen(engine, 'before_cursor_execute', self._before)
+
+    def _before(self, *args):
+        if getattr(self._local, 'count', None) is not None:
+            self._local.count += 1
+
+    class _Measure:
+        def __init__(self, local):
+            self._local = local
+            self.result = {}
+
+        def __enter__(self):
+            self._local.count = 0
+            return self.result
+
+        def __exit__(self, *exc_info):
+            self.result['queries'] = self._local.count
+            self._local.count = None
+
+    def measure(self):
+        return self._Measure(self._local)
+
+
+# --- Results ---
+def environment():
+    """Enough context to tell two result files apart."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+def write_results(results, path=None):
+    output = json.dumps(results, indent=2, sort_keys=False)
+    if path:
+        with open(path, 'w') as handle:
+            handle.write(output + '\n')
+    print(output)
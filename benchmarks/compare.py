@@ -0,0 +1,73 @@
+"""
+Diff two benchmarks.load result files, e.g. from before and after a change.
+
+    python -m benchmarks.compare before.json after.json --threshold 15
+
+Prints one line per scenario with the change in p50/p95/p99 and queries per
+request. Exits with status 1 if any scenario got slower than --threshold
+percent at p95, or started running more queries per request, so it can gate
+a CI job.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_mean')
+
+
+def _change(old, new):
+    if old in (None, 0) or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(before, after, threshold):
+    """Returns (rows, regressions): rows for printing, names of regressed scenarios."""
+    rows = []
+    regressions = []
+    old_scenarios = before.get('scenarios', {})
+    for name, new in after.get('scenarios', {}).items():
+        old = old_scenarios.get(name)
+        if old is None:
+            rows.append((name, ['new'] * len(METRICS)))
+            continue
+        cells = []
+        for metric in METRICS:
+            change = _change(old.get(metric), new.get(metric))
+            cells.append(f"{old.get(metric)} -> {new.get(metric)}" +
+                         (f" ({change:+.0f}%)" if change is not None else ''))
+        rows.append((name, cells))
+        slower = _change(old.get('p95_ms'), new.get('p95_ms'))
+        more_queries = (new.get('queries_mean') or 0) > (old.get('queries_mean') or 0) + 0.5
+        if (slower is not None and slower > threshold) or more_queries or new.get('errors', 0) > old.get('errors', 0):
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed p95 slowdown in percent')
+    args = parser.parse_args(argv)
+
+    with open(args.before) as handle:
+        before = json.load(handle)
+    with open(args.after) as handle:
+        after = json.load(handle)
+
+    commits = (before.get('environment', {}).get('commit'), after.get('environment', {}).get('commit'))
+    print(f"{commits[0] or 'before'} -> {commits[1] or 'after'}")
+    rows, regressions = compare(before, after, args.threshold)
+    width = max([len(name) for name, _ in rows] + [8])
+    print(f"{'scenario':<{width}}  " + '  '.join(f"{metric:<26}" for metric in METRICS))
+    for name, cells in rows:
+        marker = ' !' if name in regressions else ''
+        print(f"{name:<{width}}  " + '  '.join(f"{cell:<26}" for cell in cells) + marker)
+    if regressions:
+        print(f"\nRegressed: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""
+Duplicate detection cost: signing tickets, the per-worker LSH index at a
+million tickets, and the submit hook end to end.
+
+- signatures: duplicates.band_keys over generated ticket texts;
+- index: loading --index-tickets signatures (random band keys, which is
+  what real ones look like to the index), its size and the worker's RSS
+  growth, then candidate lookups and incremental adds (every 1024th also
+  merges the pending tickets into the arrays, which shows in the mean);
+- submit: duplicates.record_ticket_created on a generated database of
+  --tickets tickets, half of them re-submitting an existing ticket with a
+  word changed, so both the miss and the verify-and-record paths count;
+  'hook' is the call alone, 'submit' adds the INSERT and the commit.
+
+    python -m benchmarks.duplicates --index-tickets 1000000 --tickets 20000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import build_app, environment, rss_mb, sqlite_url, summarize, write_results
+from benchmarks.generate import generate, refresh_derived
+
+
+def timed_each(function, items):
+    samples = []
+    for item in items:
+        started = time.perf_counter()
+        function(item)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def reworded(text, rng):
+    words = text.split()
+    words[rng.randrange(len(words))] = 'something'
+    return ' '.join(words)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index-tickets', type=int, default=1000000, help='signatures loaded into the index')
+    parser.add_argument('--tickets', type=int, default=20000, help='tickets in the generated database')
+    parser.add_argument('--queries', type=int, default=2000, help='timed lookups, adds and signatures')
+    parser.add_argument('--submits', type=int, default=500, help='timed submit hooks')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write a JSON summary to this file')
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, db = build_app(sqlite_url(os.path.join(tmp, 'duplicates.db')))
+        import numpy as np
+        import duplicates
+        from models import Ticket
+        with app.app_context():
+            db.create_all()
+            rows = generate(db, users=max(100, args.tickets // 20), tickets=args.tickets, responses=0)
+            refresh_derived(db)
+            samples = db.session.execute(db.select(Ticket.title, Ticket.description).limit(args.queries)).all()
+            texts = [duplicates.ticket_text(title, description) for title, description in samples]
+
+            signatures = timed_each(duplicates.band_keys, texts)
+
+            # The index at scale, without a database behind it
+            keys = np.random.default_rng(args.seed).integers(0, 2 ** 32, size=(args.index_tickets, duplicates.BANDS),
+                                                             dtype=np.uint32)
+            rss_before = rss_mb()[0]
+            index = duplicates.DuplicateIndex()
+            started = time.perf_counter()
+            index.load(np.arange(1, args.index_tickets + 1), keys, args.index_tickets)
+            load_s = time.perf_counter() - started
+            rss_after = rss_mb()[0]
+            probes = [keys[rng.randrange(args.index_tickets)] for _ in range(args.queries)]
+            lookups = timed_each(index.candidates, probes)
+            text_probes = [duplicates.band_keys(text) for text in texts]
+            next_id = iter(range(args.index_tickets + 1, args.index_tickets + 1 + len(text_probes)))
+            adds = timed_each(lambda band_keys: index.add(next(next_id), band_keys), text_probes)
+            index_summary = {
+                'tickets': len(index), 'load_s': round(load_s, 2), 'bytes': index.nbytes(),
+                'bytes_per_ticket': round(index.nbytes() / len(index), 1),
+                'rss_growth_mb': round(rss_after - rss_before, 1) if rss_before and rss_after else None,
+                'lookup': lookups, 'add': adds,
+            }
+            del index, keys
+
+            # The submit hook against the generated database
+            started = time.perf_counter()
+            signed = duplicates.backfill_signatures(batch_size=5000)
+            backfill_s = time.perf_counter() - started
+            duplicates.sync(duplicates.get_duplicate_index())
+            author_id = db.session.execute(db.select(Ticket.user_id).limit(1)).scalar()
+            found, hook = [], []
+
+            def submit(sample):
+                title, description = sample
+                ticket = Ticket(title=title, description=description, category='Technical Issue',
+                                priority='Low', user_id=author_id)
+                db.session.add(ticket)
+                db.session.flush()
+                started = time.perf_counter()
+                found.append(len(duplicates.record_ticket_created(ticket)))
+                hook.append(time.perf_counter() - started)
+                db.session.commit()
+
+            submits = []
+            for i in range(args.submits):
+                title, description = rng.choice(samples)
+                if i % 2:
+                    submits.append((title, reworded(description, rng)))
+                else: # same words, new pairs: a near miss for the index
+                    submits.append((f'Fresh ticket {i}', ' '.join(description.split()[::-1])))
+            submits = timed_each(submit, submits)
+
+    write_results({
+        'benchmark': 'duplicates',
+        'environment': environment(),
+        'params': vars(args),
+        'rows': rows,
+        'signatures': signatures,
+        'index': index_summary,
+        'backfill': {'signed': signed, 'wall_s': round(backfill_s, 2)},
+        'hook': dict(summarize(hook), with_matches=sum(1 for count in found if count)),
+        'submit': submits,
+    }, args.out)
+
+
+if __name__ == '__main__':
+    main()
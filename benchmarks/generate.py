@@ -0,0 +1,201 @@
+"""
+Synthetic data generator: fills User/Ticket/TicketResponse with a seeded,
+reproducible data set so benchmark numbers can be compared between commits.
+
+Rows are built in Python and written with executemany INSERTs, one commit
+per batch, so memory stays flat from 10k to several million rows. Works
+against SQLite or a local MySQL database.
+
+    python -m benchmarks.generate --database-url sqlite:///bench.db --tickets 100000
+    python -m benchmarks.generate --database-url mysql+pymysql://root:pw@localhost/bench \\
+        --users 50000 --agents 200 --tickets 1000000 --responses 8
+
+Every account's password is 'password'. Logins are customer{i}@example.com,
+agent{i}@example.com and admin@example.com.
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import build_app, environment, write_results
+
+PASSWORD = 'password'
+WORDS = ('printer login password email network slow error crash invoice refund account vpn '
+         'laptop screen update install license access server timeout report export sync').split()
+
+
+def customer_email(index):
+    return f'customer{index}@example.com'
+
+
+def agent_email(index):
+    return f'agent{index}@example.com'
+
+
+def _choices(field):
+    return [value for value, label in field.kwargs['choices']]
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+
+def _batched_insert(db, model, rows, batch_size):
+    from sqlalchemy import insert
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            db.session.execute(insert(model), batch)
+            db.session.commit()
+            count += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+        db.session.commit()
+        count += len(batch)
+    return count
+
+
+def _next_id(db, model):
+    from sqlalchemy import func, select
+    return (db.session.execute(select(func.max(model.id))).scalar() or 0) + 1
+
+
+def generate(db, users=1000, agents=20, tickets=10000, responses=5, days=365,
+             seed=1, batch_size=5000, rounds=4, now=None):
+    """
+    Insert `users` customers, `agents` agents, one admin, `tickets` tickets and
+    on average `responses` responses per ticket. Returns the row counts.
+    Call inside an app context on an empty database.
+    """
+    from forms import ChangeStatusForm, TicketForm
+    from models import Ticket, TicketResponse, User
+    from passwords import PasswordHasher
+
+    # Same values the web forms offer, so generated tickets look like real ones
+    categories = _choices(TicketForm.category)
+    priorities = _choices(TicketForm.priority)
+    statuses = _choices(ChangeStatusForm.status)
+
+    rng = random.Random(seed)
+    now = now or datetime(2025, 1, 1)
+    hashed = PasswordHasher(rounds=rounds, pool_size=0).hash(PASSWORD)
+
+    # Explicit ids so tickets and responses can reference rows we haven't read back
+    admin_id = _next_id(db, User)
+    agent_ids = list(range(admin_id + 1, admin_id + 1 + agents))
+    customer_ids = list(range(admin_id + 1 + agents, admin_id + 1 + agents + users))
+
+    def user_rows():
+        yield dict(id=admin_id, username='admin', email='admin@example.com', password=hashed,
+                   is_admin=True, is_agent=False)
+        for index, user_id in enumerate(agent_ids):
+            yield dict(id=user_id, username=f'agent{index}', email=agent_email(index), password=hashed,
+                       is_admin=False, is_agent=True)
+        for index, user_id in enumerate(customer_ids):
+            yield dict(id=user_id, username=f'customer{index}', email=customer_email(index), password=hashed,
+                       is_admin=False, is_agent=False)
+
+    span = timedelta(days=days).total_seconds()
+    next_response = [_next_id(db, TicketResponse)]
+
+    def ticket_with_thread(ticket_id):
+        posted = now - timedelta(seconds=rng.random() * span)
+        ticket = dict(
+            id=ticket_id,
+            title=_sentence(rng, rng.randint(3, 8)),
+            description=_sentence(rng, rng.randint(10, 60)),
+            date_posted=posted,
+            last_updated=posted,
+            status=rng.choice(statuses),
+            category=rng.choice(categories),
+            priority=rng.choice(priorities),
+            user_id=rng.choice(customer_ids),
+            # Most tickets are assigned; the rest sit in the unassigned queue
+            agent_id=rng.choice(agent_ids) if agent_ids and rng.random() < 0.7 else None,
+        )
+        thread = []
+        # Long-tailed: most threads are short, a few run to hundreds of responses
+        length = int(rng.expovariate(1.0 / responses)) if responses else 0
+        for _ in range(length):
+            posted += timedelta(minutes=rng.randint(1, 600))
+            staff = ticket['agent_id'] is not None and rng.random() < 0.5
+            thread.append(dict(
+                id=next_response[0],
+                ticket_id=ticket_id,
+                user_id=ticket['agent_id'] if staff else ticket['user_id'],
+                content=_sentence(rng, rng.randint(5, 40)),
+                is_internal_note=staff and rng.random() < 0.2,
+                date_posted=posted,
+            ))
+            next_response[0] += 1
+        if thread:
+            ticket['last_updated'] = posted
+        return ticket, thread
+
+    counts = {'users': _batched_insert(db, User, user_rows(), batch_size), 'tickets': 0, 'responses': 0}
+    first_ticket = _next_id(db, Ticket)
+    for start in range(first_ticket, first_ticket + tickets, batch_size):
+        ticket_batch, response_batch = [], []
+        for ticket_id in range(start, min(start + batch_size, first_ticket + tickets)):
+            ticket, thread = ticket_with_thread(ticket_id)
+            ticket_batch.append(ticket)
+            response_batch.extend(thread)
+        counts['tickets'] += _batched_insert(db, Ticket, ticket_batch, batch_size)
+        counts['responses'] += _batched_insert(db, TicketResponse, response_batch, batch_size)
+    return counts
+
+
+def refresh_derived(db, reindex=False):
+    """Rebuild the denormalised tables bulk inserts bypass."""
+    from routing import rebuild_agent_load
+    from sla import rebuild_sla
+    from stats import rebuild_ticket_stats
+    rebuild_ticket_stats()
+    rebuild_agent_load()
+    rebuild_sla()
+    if reindex:
+        from search import get_search_backend
+        get_search_backend().rebuild()
+    db.session.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', required=True, help='SQLAlchemy URL of an empty database')
+    parser.add_argument('--users', type=int, default=1000, help='customer accounts')
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--tickets', type=int, default=10000)
+    parser.add_argument('--responses', type=float, default=5, help='mean responses per ticket')
+    parser.add_argument('--days', type=int, default=365, help='spread ticket dates over this many days')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=4, help='bcrypt cost for the shared password hash')
+    parser.add_argument('--reindex', action='store_true', help='also rebuild the search index (slow at scale)')
+    parser.add_argument('--out', help='write a JSON summary to this file')
+    args = parser.parse_args(argv)
+
+    app, db = build_app(args.database_url)
+    started = time.perf_counter()
+    with app.app_context():
+        db.create_all()
+        counts = generate(db, users=args.users, agents=args.agents, tickets=args.tickets,
+                          responses=args.responses, days=args.days, seed=args.seed,
+                          batch_size=args.batch_size, rounds=args.rounds)
+        refresh_derived(db, reindex=args.reindex)
+    elapsed = time.perf_counter() - started
+    write_results({
+        'benchmark': 'generate',
+        'environment': environment(),
+        'params': vars(args),
+        'rows': counts,
+        'wall_s': round(elapsed, 2),
+        'rows_per_s': round(sum(counts.values()) / elapsed) if elapsed else None,
+    }, args.out)
+
+
+if __name__ == '__main__':
+    main()
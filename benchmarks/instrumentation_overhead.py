@@ -0,0 +1,107 @@
+"""
+Cost of leaving the request/SQL instrumentation (instrumentation.py) on.
+
+Two measurements against a throwaway SQLite database:
+- per statement: a tight loop of `SELECT 1` inside a request context, with
+  and without the cursor hooks, giving the added microseconds per query;
+- per request: the benchmarks.load mix with instrumentation off and on,
+  interleaved over several rounds so drift affects both sides equally.
+
+    python -m benchmarks.instrumentation_overhead --statements 20000 --requests 1000 --rounds 3
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.common import build_app, environment, sqlite_url, write_results
+from benchmarks.generate import generate, refresh_derived
+from benchmarks.load import DEFAULT_MIX, run_load, virtual_users
+
+
+def per_statement(app, db, statements):
+    from flask import g
+    from sqlalchemy import text
+    from instrumentation import RequestStats, get_instrumentation
+
+    results = {}
+    with app.test_request_context('/'):
+        instrumentation = get_instrumentation()
+        connection = db.session.connection()
+        select_one = text('SELECT 1')
+        for mode in ('off', 'on', 'off', 'on'):
+            if mode == 'on':
+                instrumentation.enable()
+                g._request_stats = RequestStats()
+            else:
+                instrumentation.disable()
+                g.pop('_request_stats', None)
+            started = time.perf_counter()
+            for _ in range(statements):
+                connection.execute(select_one)
+            elapsed = time.perf_counter() - started
+            # Keep the better of the two runs per mode
+            results[mode] = min(results.get(mode, elapsed), elapsed)
+        g.pop('_request_stats', None)
+        instrumentation.enable()
+    off_us = results['off'] / statements * 1e6
+    on_us = results['on'] / statements * 1e6
+    return {'statements': statements, 'off_us': round(off_us, 2), 'on_us': round(on_us, 2),
+            'added_us_per_query': round(on_us - off_us, 2)}
+
+
+def per_request(app, db, requests, rounds, concurrency, seed):
+    from instrumentation import get_instrumentation
+    with app.app_context():
+        instrumentation = get_instrumentation()
+    users = virtual_users(app, db, concurrency, seed)
+    runs = {'off': [], 'on': []}
+    for round_number in range(rounds):
+        for mode in ('off', 'on'):
+            if mode == 'on':
+                instrumentation.enable()
+            else:
+                instrumentation.disable()
+            result = run_load(app, db, users, requests, DEFAULT_MIX, seed + round_number)
+            runs[mode].append(result['overall'])
+    instrumentation.enable()
+
+    def best(metric, mode):
+        return min(run[metric] for run in runs[mode])
+
+    summary = {}
+    for metric in ('p50_ms', 'p95_ms', 'mean_ms'):
+        off, on = best(metric, 'off'), best(metric, 'on')
+        summary[metric] = {'off': off, 'on': on, 'overhead_pct': round((on - off) / off * 100, 1) if off else None}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--statements', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=1000, help='requests per round and mode')
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--tickets', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, db = build_app(sqlite_url(os.path.join(tmp, 'bench.db')), BCRYPT_LOG_ROUNDS=4)
+        with app.app_context():
+            db.create_all()
+            generate(db, users=200, agents=10, tickets=args.tickets, seed=args.seed)
+            refresh_derived(db)
+        results = {
+            'benchmark': 'instrumentation_overhead',
+            'environment': environment(),
+            'params': vars(args),
+            'per_statement': per_statement(app, db, args.statements),
+            'per_request': per_request(app, db, args.requests, args.rounds, args.concurrency, args.seed),
+        }
+    write_results(results, args.out)
+
+
+if __name__ == '__main__':
+    main()
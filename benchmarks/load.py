@@ -0,0 +1,265 @@
+"""
+Concurrent load scenarios against the app: login, the three dashboards,
+view_ticket, responses (reading older pages and posting), status changes,
+and (opt-in) submitting and claiming tickets.
+
+Each virtual user is a thread with its own logged-in test clients (a
+customer, an agent and the admin), so requests go through the whole WSGI
+stack, sessions and Flask-Login included, without a network in between.
+Requests are drawn from a weighted, seeded mix and the report gives
+p50/p95/p99 latency and SQL queries per request for every scenario, plus
+throughput and RSS. Write it to JSON with --out and diff two runs with
+`python -m benchmarks.compare`.
+
+    python -m benchmarks.load --requests 2000 --concurrency 8 --out before.json
+    python -m benchmarks.load --database-url sqlite:///bench.db --mix view_ticket=5,responses=1
+"""
+import argparse
+import os
+import queue
+import random
+import statistics
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.common import QueryCounter, build_app, environment, rss_mb, sqlite_url, summarize, write_results
+from benchmarks.generate import PASSWORD, generate, refresh_derived
+
+DEFAULT_MIX = {
+    'login': 1,
+    'user_dashboard': 4,
+    'agent_dashboard': 4,
+    'admin_dashboard': 1,
+    'view_ticket': 6,
+    'responses': 2,
+    'post_response': 1,
+    'status_change': 1,
+}
+
+
+# --- Scenarios ---
+# Each takes the virtual user and its rng and returns the response. Anything
+# other than 200/302 counts as an error.
+def login(user, rng):
+    client = user.app.test_client()
+    return client.post('/login', data={'email': user.customer_email, 'password': PASSWORD})
+
+
+def user_dashboard(user, rng):
+    return user.customer.get('/user_dashboard')
+
+
+def agent_dashboard(user, rng):
+    return user.agent.get('/agent_dashboard')
+
+
+def admin_dashboard(user, rng):
+    return user.admin.get('/admin_dashboard')
+
+
+def view_ticket(user, rng):
+    return user.customer.get(f'/ticket/{rng.choice(user.customer_tickets)}')
+
+
+def responses(user, rng):
+    # What "Load older responses" fetches: the page after the newest one
+    ticket_id = rng.choice(user.agent_tickets)
+    first = user.agent.get(f'/ticket/{ticket_id}/responses').get_json()
+    return user.agent.get(first['next'] or f'/ticket/{ticket_id}/responses')
+
+
+def post_response(user, rng):
+    return user.customer.post(f'/ticket/{rng.choice(user.customer_tickets)}',
+                              data={'content': f'Benchmark reply {rng.random()}'})
+
+
+def status_change(user, rng):
+    return user.agent.post(f'/ticket/{rng.choice(user.agent_tickets)}/status',
+                           data={'status': rng.choice(['Open', 'In Progress', 'Resolved'])})
+
+
+# Not in DEFAULT_MIX (so older results stay comparable); exercise routing
+# with e.g. --mix submit_ticket=1,claim_ticket=1
+def submit_ticket(user, rng):
+    return user.customer.post('/submit_ticket', data={
+        'title': f'Benchmark ticket {rng.random()}', 'description': 'Generated by benchmarks.load',
+        'category': rng.choice(['Technical Issue', 'Billing Inquiry', 'Feature Request', 'Other']),
+        'priority': rng.choice(['Low', 'Medium', 'High', 'Urgent'])})
+
+
+def claim_ticket(user, rng):
+    return user.agent.post('/tickets/claim')
+
+
+SCENARIOS = {fn.__name__: fn for fn in (login, user_dashboard, agent_dashboard, admin_dashboard,
+                                       view_ticket, responses, post_response, status_change,
+                                       submit_ticket, claim_ticket)}
+
+
+class VirtualUser:
+    """One simulated browser session per role, logged in before timing starts."""
+
+    def __init__(self, app, customer_email, customer_tickets, agent_email, agent_tickets):
+        self.app = app
+        self.customer_email = customer_email
+        self.customer_tickets = customer_tickets
+        self.agent_tickets = agent_tickets
+        self.customer = self._login(customer_email)
+        self.agent = self._login(agent_email)
+        self.admin = self._login('admin@example.com')
+
+    def _login(self, email):
+        client = self.app.test_client()
+        response = client.post('/login', data={'email': email, 'password': PASSWORD})
+        if response.status_code != 302:
+            raise RuntimeError(f'could not log in as {email} ({response.status_code})')
+        return client
+
+
+def virtual_users(app, db, count, seed):
+    """Pick `count` customer/agent pairs that each own or hold some tickets."""
+    from sqlalchemy import func, select
+    from models import Ticket, User
+    rng = random.Random(seed)
+    with app.app_context():
+        customers = db.session.execute(
+            select(Ticket.user_id).group_by(Ticket.user_id).order_by(func.count().desc()).limit(count * 4)
+        ).scalars().all()
+        agents = db.session.execute(
+            select(Ticket.agent_id).where(Ticket.agent_id.isnot(None)).group_by(Ticket.agent_id)
+        ).scalars().all()
+        if not customers or not agents:
+            raise SystemExit('The database needs tickets, some of them assigned; run benchmarks.generate first.')
+        emails = dict(db.session.execute(select(User.id, User.email).where(User.id.in_(customers + agents))).all())
+
+        def ticket_ids(column, user_id):
+            return db.session.execute(select(Ticket.id).where(column == user_id).limit(200)).scalars().all()
+
+        pairs = []
+        for index in range(count):
+            customer_id = rng.choice(customers)
+            agent_id = agents[index % len(agents)]
+            pairs.append((emails[customer_id], ticket_ids(Ticket.user_id, customer_id),
+                          emails[agent_id], ticket_ids(Ticket.agent_id, agent_id)))
+    return [VirtualUser(app, *pair) for pair in pairs]
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def run_load(app, db, users, requests, mix, seed):
+    """Run `requests` requests from the mix across the virtual users' threads."""
+    rng = random.Random(seed)
+    names = list(mix)
+    jobs = queue.Queue()
+    for name in rng.choices(names, weights=[mix[name] for name in names], k=requests):
+        jobs.put(name)
+
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+    samples = defaultdict(list)
+    queries = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    start = threading.Barrier(len(users) + 1)
+
+    def worker(user, worker_seed):
+        worker_rng = random.Random(worker_seed)
+        start.wait()
+        while True:
+            try:
+                name = jobs.get_nowait()
+            except queue.Empty:
+                return
+            with counter.measure() as measured:
+                began = time.perf_counter()
+                response = SCENARIOS[name](user, worker_rng)
+                elapsed = time.perf_counter() - began
+            with lock:
+                samples[name].append(elapsed)
+                queries[name].append(measured['queries'])
+                if response.status_code not in (200, 302):
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(user, seed + index)) for index, user in enumerate(users)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - began
+
+    scenarios = {}
+    for name in names:
+        scenarios[name] = summarize(samples[name])
+        scenarios[name]['queries_mean'] = round(statistics.mean(queries[name]), 2) if queries[name] else None
+        scenarios[name]['queries_max'] = max(queries[name]) if queries[name] else None
+        scenarios[name]['errors'] = errors[name]
+    every = [sample for name in names for sample in samples[name]]
+    return {
+        'wall_s': round(wall, 3),
+        'throughput_rps': round(len(every) / wall, 1) if wall else None,
+        'overall': summarize(every),
+        'scenarios': scenarios,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database-url', help='use an existing generated database instead of a throwaway SQLite one')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8, help='virtual users (threads)')
+    parser.add_argument('--mix', help=f"weights, e.g. view_ticket=5,login=1 (default: {DEFAULT_MIX})")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--rounds', type=int, default=4,
+                        help='bcrypt cost the data was generated with (avoids rehash-on-login)')
+    group = parser.add_argument_group('throwaway database size')
+    group.add_argument('--users', type=int, default=500)
+    group.add_argument('--agents', type=int, default=20)
+    group.add_argument('--tickets', type=int, default=10000)
+    group.add_argument('--responses', type=float, default=5)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+    mix = parse_mix(args.mix)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or sqlite_url(os.path.join(tmp, 'bench.db'))
+        app, db = build_app(database_url, BCRYPT_LOG_ROUNDS=args.rounds)
+        if not args.database_url:
+            with app.app_context():
+                db.create_all()
+                generate(db, users=args.users, agents=args.agents, tickets=args.tickets,
+                         responses=args.responses, seed=args.seed, rounds=args.rounds)
+                refresh_derived(db)
+        rss_before = rss_mb()
+        users = virtual_users(app, db, args.concurrency, args.seed)
+        results = run_load(app, db, users, args.requests, mix, args.seed)
+        rss_after = rss_mb()
+
+    params = vars(args)
+    params['mix'] = mix
+    results = {
+        'benchmark': 'load',
+        'environment': environment(),
+        'params': params,
+        **results,
+        'rss_mb': {'before': rss_before[0], 'after': rss_after[0], 'peak': rss_after[1]},
+    }
+    write_results(results, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Login storm benchmark: how password hashing affects login latency and the
+latency of unrelated dashboard requests served by the same worker.
+
+Runs the app in-process against a throwaway SQLite database. A fixed pool
+of threads stands in for the WSGI worker's request threads; we fire a burst
+of logins mixed with dashboard loads and report p50/p95/p99 for both, first
+with hashing inline on the request thread, then through the process
+pool, and then through the pool with the rate limiter on (the storm comes
+from one address, as a credential-stuffing script would).
+
+    python -m benchmarks.password_hashing --logins 200 --dashboards 200 --threads 8
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import build_app, environment, sqlite_url, summarize, write_results
+
+
+def seed(app, db, rounds, users):
+    from models import User, Ticket
+    from passwords import PasswordHasher
+    hashed = PasswordHasher(rounds=rounds, pool_size=0).hash('password')
+    with app.app_context():
+        db.create_all()
+        accounts = [User(username=f'user{i}', email=f'user{i}@example.com', password=hashed)
+                    for i in range(users)]
+        db.session.add_all(accounts)
+        db.session.flush()
+        for i in range(users * 5):
+            db.session.add(Ticket(title=f'Benchmark ticket {i}', description='Seeded by benchmark',
+                                  user_id=accounts[i % users].id))
+        db.session.commit()
+
+
+def jobs_for(args):
+    jobs = ['login'] * args.logins + ['dashboard'] * args.dashboards
+    random.Random(args.seed).shuffle(jobs)
+    return jobs
+
+
+def run_storm(app, mode, args):
+    from passwords import PasswordHasher
+    from ratelimit import MemoryRateLimitBackend
+    with app.app_context():
+        old = app.extensions.pop('password_hasher', None)
+        if old:
+            old.shutdown()
+        if mode == 'before':
+            hasher = PasswordHasher(rounds=args.rounds, pool_size=0, max_pending=len(jobs_for(args)))
+        else:
+            hasher = PasswordHasher(rounds=args.rounds, pool_size=args.pool_size, max_pending=args.max_pending)
+        app.extensions['password_hasher'] = hasher
+    limiter = app.extensions['rate_limiter']
+    limiter.enabled = False
+
+    # Dashboard clients log in before the clock starts
+    dashboard_clients = []
+    for i in range(args.threads):
+        client = app.test_client()
+        client.post('/login', data={'email': f'user{i % args.users}@example.com', 'password': 'password'})
+        dashboard_clients.append(client)
+    if mode == 'rate_limited':
+        # Fresh buckets, switched on after the dashboard clients logged in
+        limiter.backend = MemoryRateLimitBackend()
+        limiter.enabled = True
+
+    jobs = jobs_for(args)
+    latencies = {'login': [], 'dashboard': []}
+    rejected = [0]
+    limited = [0]
+
+    def run(job, index, queued_at):
+        if job == 'login':
+            client = app.test_client()
+            response = client.post('/login', data={
+                'email': f'user{index % args.users}@example.com', 'password': 'password'})
+            if response.status_code == 503:
+                rejected[0] += 1
+            elif response.status_code == 429:
+                limited[0] += 1
+        else:
+            dashboard_clients[index % len(dashboard_clients)].get('/user_dashboard')
+        # Includes time spent waiting for a free request thread
+        latencies[job].append(time.perf_counter() - queued_at)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        for index, job in enumerate(jobs):
+            executor.submit(run, job, index, time.perf_counter())
+    elapsed = time.perf_counter() - started
+
+    limiter.enabled = False
+    with app.app_context():
+        app.extensions.pop('password_hasher').shutdown()
+    return {
+        'mode': mode,
+        'wall_s': round(elapsed, 3),
+        'login': summarize(latencies['login']),
+        'dashboard': summarize(latencies['dashboard']),
+        'logins_rejected_503': rejected[0],
+        'logins_rate_limited_429': limited[0],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--dashboards', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8, help='request threads in the simulated worker')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt cost (BCRYPT_LOG_ROUNDS)')
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, db = build_app(sqlite_url(os.path.join(tmp, 'bench.db')))
+        seed(app, db, args.rounds, args.users)
+        results = {
+            'benchmark': 'password_hashing',
+            'environment': environment(),
+            'params': vars(args),
+            'runs': [run_storm(app, mode, args) for mode in ('before', 'after', 'rate_limited')],
+        }
+
+    write_results(results, args.out)
+
+
+if __name__ == '__main__':
+    main()
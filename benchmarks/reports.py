@@ -0,0 +1,116 @@
+"""
+Report cost: serving the dashboard reports from report_rollup versus
+computing the same numbers from the raw ticket/response rows.
+
+Generates a year of tickets into a throwaway SQLite database, times the
+one-off event backfill and the rollup job, then times each report over the
+whole year both ways:
+- rollup: reports.build_report, what /reports/<name> serves;
+- raw: the query a report would need without the rollups (first-response
+  times need every ticket joined to its first response, grouped per day).
+
+    python -m benchmarks.reports --tickets 20000 --responses 5 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import build_app, environment, sqlite_url, summarize, write_results
+from benchmarks.generate import generate, refresh_derived
+
+END = datetime(2025, 1, 1)
+
+
+def raw_first_response(db, start, end):
+    """Median first-response seconds per day, straight from tickets and responses."""
+    from sqlalchemy import func, select
+    from models import Ticket, TicketResponse
+    first = (select(TicketResponse.ticket_id, func.min(TicketResponse.date_posted).label('answered'))
+             .group_by(TicketResponse.ticket_id).subquery())
+    rows = db.session.execute(
+        select(Ticket.date_posted, first.c.answered)
+        .join(first, first.c.ticket_id == Ticket.id)
+        .where(first.c.answered >= start, first.c.answered < end)
+    ).all()
+    days = {}
+    for posted, answered in rows:
+        days.setdefault(answered.date(), []).append((answered - posted).total_seconds())
+    return {day: statistics.median(seconds) for day, seconds in days.items()}
+
+
+def raw_tickets_by_category(db, start, end):
+    from sqlalchemy import func, select
+    from models import Ticket
+    day = func.date(Ticket.date_posted)
+    return db.session.execute(
+        select(day, Ticket.category, func.count())
+        .where(Ticket.date_posted >= start, Ticket.date_posted < end)
+        .group_by(day, Ticket.category)
+    ).all()
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples, percentiles=(50,))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickets', type=int, default=20000)
+    parser.add_argument('--responses', type=float, default=5, help='mean responses per ticket')
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per report')
+    parser.add_argument('--out', help='write a JSON summary to this file')
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, db = build_app(sqlite_url(os.path.join(tmp, 'reports.db')))
+        import reports
+        with app.app_context():
+            db.create_all()
+            rows = generate(db, users=max(100, args.tickets // 20), agents=args.agents, tickets=args.tickets,
+                            responses=args.responses, days=365, now=END)
+            refresh_derived(db)
+
+            started = time.perf_counter()
+            events = reports.backfill_events()
+            backfill_s = time.perf_counter() - started
+
+            started = time.perf_counter()
+            read = written = 0
+            while True:
+                batch_read, batch_written = reports.run_rollup(now=END + timedelta(days=1))
+                if not batch_read:
+                    break
+                read, written = read + batch_read, written + batch_written
+            rollup_s = time.perf_counter() - started
+
+            start, end = END - timedelta(days=365), END
+            served = {name: timed(lambda name=name: reports.build_report(name, 'day', start, end), args.repeat)
+                      for name in reports.REPORTS}
+            raw = {
+                'first_response': timed(lambda: raw_first_response(db, start, end), args.repeat),
+                'tickets_by_category': timed(lambda: raw_tickets_by_category(db, start, end), args.repeat),
+            }
+
+    write_results({
+        'benchmark': 'reports',
+        'environment': environment(),
+        'params': vars(args),
+        'rows': rows,
+        'backfill': {'events': events, 'wall_s': round(backfill_s, 2)},
+        'rollup': {'events': read, 'rows_written': written, 'wall_s': round(rollup_s, 2)},
+        'report_rollup': served,
+        'report_raw': raw,
+    }, args.out)
+
+
+if __name__ == '__main__':
+    main()
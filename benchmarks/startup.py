@@ -0,0 +1,170 @@
+"""
+Worker cold start: how long a fresh interpreter takes to import the app,
+build it, prewarm it and answer its first request.
+
+Each run is a new `python` process (nothing cached but the bytecode):
+- time to first 200: from spawning the process to the first GET /login
+  returning 200, and the same request again once warm;
+- the split: import app, create_app(), prewarm() and the first request;
+- which modules the serving path imported that it shouldn't (--forbid:
+  Alembic/Flask-Migrate, redis and pandas are for the CLI, the Redis
+  backends and the rollup job only; NumPy is expected once prewarm builds
+  the duplicate index, so pass --no-prewarm to check it stays out).
+
+One extra run under `python -X importtime` lists what the script, app.py
+and create_app() import, by cumulative time.
+
+    python -m benchmarks.startup --runs 5 --budget-ms 1500
+
+Exits with status 1 if the median time to first 200 is over --budget-ms or
+a forbidden module was imported, so it can gate a CI job;
+tests/test_startup.py runs the same check in the test suite.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import ROOT, build_app, environment, sqlite_url, write_results
+
+FORBIDDEN = ('alembic', 'flask_migrate', 'redis', 'pandas')
+
+# Run in the fresh interpreter; prints one JSON line
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {root!r})
+import app as module
+imported = time.perf_counter()
+app = module.create_app('production', SECRET_KEY='benchmark', SQLALCHEMY_DATABASE_URI={url!r})
+created = time.perf_counter()
+if {prewarm!r}:
+    module.prewarm(app)
+warmed = time.perf_counter()
+client = app.test_client()
+status = client.get('/login').status_code
+first = time.perf_counter()
+first_wall = time.time()
+client.get('/login')
+second = time.perf_counter()
+print(json.dumps({{
+    'status': status, 'first_200_at': first_wall, 'import_s': imported - started, 'create_app_s': created - imported,
+    'prewarm_s': warmed - created, 'first_request_s': first - warmed, 'warm_request_s': second - first,
+    'modules': sorted(name for name in sys.modules if '.' not in name),
+}}))
+"""
+
+
+def run_once(url, prewarm, extra_args=()):
+    code = CHILD.format(root=ROOT, url=url, prewarm=prewarm)
+    spawned = time.time()
+    result = subprocess.run([sys.executable, *extra_args, '-c', code], cwd=ROOT, capture_output=True, text=True,
+                            timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f'startup run failed:\n{result.stderr}')
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample['first_200_s'] = sample.pop('first_200_at') - spawned
+    return sample, result.stderr
+
+
+def import_report(stderr, top, depth=2):
+    """
+    Imports at most `depth` levels down (1: by the script itself, 2: by
+    what it imported, e.g. app.py and routes.py) by cumulative time.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        # One space of indent at the top level, two more per level
+        if (len(name) - len(name.lstrip()) + 1) // 2 <= depth:
+            rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return [{'module': name, 'cumulative_ms': round(us / 1000, 1)} for us, name in rows[:top]]
+
+
+def summarize_runs(samples):
+    summary = {}
+    for key in ('first_200_s', 'import_s', 'create_app_s', 'prewarm_s', 'first_request_s', 'warm_request_s'):
+        values = [sample[key] for sample in samples]
+        summary[key[:-2] + '_ms'] = {
+            'median': round(statistics.median(values) * 1000, 1),
+            'min': round(min(values) * 1000, 1),
+            'max': round(max(values) * 1000, 1),
+        }
+    return summary
+
+
+def measure(runs, prewarm=True, importtime=False):
+    """
+    `runs` cold starts, and the -X importtime output of one more if `importtime`.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        url = sqlite_url(os.path.join(tmp, 'bench.db'))
+        # An empty schema, as after `flask db upgrade`: prewarm reads it
+        app, db = build_app(url)
+        with app.app_context():
+            db.create_all()
+            db.engine.dispose()
+        samples = [run_once(url, prewarm)[0] for _ in range(runs)]
+        report = run_once(url, prewarm, ('-X', 'importtime'))[1] if importtime else None
+    return samples, report
+
+
+def failures(samples, budget_ms, forbid=FORBIDDEN):
+    """What is wrong with these runs against the budget, as messages (none: all good)."""
+    found = []
+    median_ms = round(statistics.median(sample['first_200_s'] for sample in samples) * 1000, 1)
+    if median_ms > budget_ms:
+        found.append(f"median time to first 200 {median_ms} ms > budget {budget_ms} ms")
+    forbidden = forbidden_imported(samples, forbid)
+    if forbidden:
+        found.append(f"serving path imported {', '.join(forbidden)}")
+    statuses = sorted({sample['status'] for sample in samples})
+    if statuses != [200]:
+        found.append(f"GET /login answered {statuses}")
+    return found
+
+
+def forbidden_imported(samples, forbid=FORBIDDEN):
+    return sorted(set(forbid).intersection(samples[0]['modules']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--no-prewarm', action='store_true', help='measure without app.prewarm()')
+    parser.add_argument('--budget-ms', type=float, default=1500.0, help='allowed median time to first 200')
+    parser.add_argument('--forbid', default=','.join(FORBIDDEN),
+                        help='comma-separated top-level modules the serving path must not import')
+    parser.add_argument('--top', type=int, default=15, help='imports to list from the -X importtime run')
+    parser.add_argument('--out', help='write results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    forbid = tuple(filter(None, args.forbid.split(',')))
+    samples, importtime = measure(args.runs, prewarm=not args.no_prewarm, importtime=True)
+    summary = summarize_runs(samples)
+    results = {
+        'benchmark': 'startup',
+        'environment': environment(),
+        'params': vars(args),
+        'status': sorted({sample['status'] for sample in samples}),
+        'summary': summary,
+        'forbidden_imported': forbidden_imported(samples, forbid),
+        'imports': import_report(importtime, args.top),
+    }
+    write_results(results, args.out)
+
+    found = failures(samples, args.budget_ms, forbid)
+    for failure in found:
+        print(f'FAIL: {failure}', file=sys.stderr)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
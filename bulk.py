@@ -0,0 +1,351 @@
+import contextlib
+import csv
+import io
+import json
+import sys
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from werkzeug.datastructures import MultiDict
+
+import sla
+from extensions import db
+from forms import ChangeStatusForm, TicketForm, TicketResponseForm
+from models import Ticket, TicketResponse, User
+
+tickets_cli = AppGroup('tickets', help='Bulk ticket operations.')
+
+TICKET_FIELDS = ['id', 'title', 'description', 'category', 'priority', 'status',
+                 'author_email', 'agent_email', 'date_posted', 'last_updated']
+RESPONSE_FIELDS = ['id', 'ticket_id', 'author_email', 'content', 'is_internal_note', 'date_posted']
+STATUSES = [value for value, label in ChangeStatusForm.status.kwargs['choices']]
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't')
+
+
+class RowError(ValueError):
+    """A single input row failed validation."""
+
+
+# --- Readers/writers (generators, one row at a time) ---
+def read_rows(stream, fmt):
+    # JSONL lines are yielded unparsed: import_rows parses them, so a bad
+    # line is reported as a row error instead of ending the import.
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def write_rows(stream, fmt, fields, rows):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=fields)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+    else:
+        for row in rows:
+            stream.write(json.dumps(row) + '\n')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _parse_datetime(value, field):
+    if _blank(value):
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        raise RowError(f"{field}: not an ISO 8601 datetime")
+
+
+def _form_errors(form):
+    return '; '.join(f"{name}: {', '.join(errors)}" for name, errors in form.errors.items())
+
+
+# --- Validation ---
+def parse_row(row):
+    """A row from read_rows as a dict: CSV rows already are, JSONL lines must decode to an object."""
+    if isinstance(row, str):
+        try:
+            row = json.loads(row)
+        except ValueError as error:
+            raise RowError(f"not valid JSON: {error}")
+    if not isinstance(row, dict):
+        raise RowError('not a JSON object')
+    return row
+
+
+# Rows go through the same WTForms classes the web forms use, so the import
+# can't accept a ticket submit_ticket would have rejected.
+def validate_ticket(row):
+    form = TicketForm(formdata=MultiDict({
+        'title': row.get('title') or '',
+        'description': row.get('description') or '',
+        'category': row.get('category') or '',
+        'priority': row.get('priority') or '',
+    }), meta={'csrf': False})
+    if not form.validate():
+        raise RowError(_form_errors(form))
+    status = row.get('status') or 'Open'
+    if status not in STATUSES:
+        raise RowError(f"status: must be one of {', '.join(STATUSES)}")
+    if _blank(row.get('author_email')):
+        raise RowError('author_email: required')
+    values = {
+        'title': form.title.data,
+        'description': form.description.data,
+        'category': form.category.data,
+        'priority': form.priority.data,
+        'status': status,
+        'author_email': row['author_email'].strip(),
+        'agent_email': None if _blank(row.get('agent_email')) else row['agent_email'].strip(),
+    }
+    posted = _parse_datetime(row.get('date_posted'), 'date_posted') or datetime.utcnow()
+    values['date_posted'] = posted
+    values['last_updated'] = _parse_datetime(row.get('last_updated'), 'last_updated') or posted
+    if not _blank(row.get('id')):
+        values['id'] = int(row['id'])
+    return values
+
+
+def validate_response(row):
+    form = TicketResponseForm(formdata=MultiDict({'content': row.get('content') or ''}), meta={'csrf': False})
+    if not form.validate():
+        raise RowError(_form_errors(form))
+    if _blank(row.get('ticket_id')):
+        raise RowError('ticket_id: required')
+    if _blank(row.get('author_email')):
+        raise RowError('author_email: required')
+    internal = row.get('is_internal_note')
+    values = {
+        'content': form.content.data,
+        'ticket_id': int(row['ticket_id']),
+        'author_email': row['author_email'].strip(),
+        'is_internal_note': internal is True or str(internal).strip() in TRUE_VALUES,
+        'date_posted': _parse_datetime(row.get('date_posted'), 'date_posted') or datetime.utcnow(),
+    }
+    if not _blank(row.get('id')):
+        values['id'] = int(row['id'])
+    return values
+
+
+# --- Import ---
+class UserDirectory:
+    """Resolves emails to (id, is_agent_or_admin) with one IN query per batch."""
+
+    def __init__(self):
+        self._known = {}
+
+    def load(self, emails):
+        missing = [email for email in set(emails) if email and email not in self._known]
+        if missing:
+            rows = db.session.execute(
+                select(User.email, User.id, User.is_agent, User.is_admin).where(User.email.in_(missing))
+            ).all()
+            for email, user_id, is_agent, is_admin in rows:
+                self._known[email] = (user_id, bool(is_agent or is_admin))
+
+    def get(self, email):
+        return self._known.get(email)
+
+
+def _ticket_mappings(batch, users):
+    users.load([values['author_email'] for _, values in batch] +
+               [values['agent_email'] for _, values in batch])
+    for line, values in batch:
+        author = users.get(values.pop('author_email'))
+        if author is None:
+            yield line, RowError('author_email: no such user')
+            continue
+        values['user_id'] = author[0]
+        agent_email = values.pop('agent_email')
+        values['agent_id'] = None
+        if agent_email:
+            agent = users.get(agent_email)
+            if agent is None or not agent[1]:
+                yield line, RowError('agent_email: no such agent')
+                continue
+            values['agent_id'] = agent[0]
+        values['sla_due_at'] = sla.due_at(values['priority'], values['category'], values['status'],
+                                          values['last_updated'])
+        yield line, values
+
+
+def _response_mappings(batch, users):
+    users.load([values['author_email'] for _, values in batch])
+    ticket_ids = {values['ticket_id'] for _, values in batch}
+    existing = set(db.session.execute(select(Ticket.id).where(Ticket.id.in_(ticket_ids))).scalars())
+    for line, values in batch:
+        author = users.get(values.pop('author_email'))
+        if author is None:
+            yield line, RowError('author_email: no such user')
+        elif values['ticket_id'] not in existing:
+            yield line, RowError('ticket_id: no such ticket')
+        else:
+            values['user_id'] = author[0]
+            yield line, values
+
+
+def import_rows(rows, kind='tickets', batch_size=1000, dry_run=False, on_error=None):
+    """
+    Validate and insert rows in batches of `batch_size`, one executemany
+    INSERT and one commit per batch. Returns (inserted, rejected).
+    """
+    model, validate, resolve = {
+        'tickets': (Ticket, validate_ticket, _ticket_mappings),
+        'responses': (TicketResponse, validate_response, _response_mappings),
+    }[kind]
+    users = UserDirectory()
+    inserted = rejected = 0
+
+    def report(line, error, count=1):
+        nonlocal rejected
+        rejected += count
+        if on_error:
+            on_error(line, error)
+
+    def checked(numbered_rows):
+        for line, row in numbered_rows:
+            try:
+                yield line, validate(parse_row(row))
+            except (RowError, ValueError, TypeError) as error:
+                report(line, error)
+
+    for batch in batched(checked(enumerate(rows, start=1)), batch_size):
+        mappings = []
+        for line, values in resolve(batch, users):
+            if isinstance(values, RowError):
+                report(line, values)
+            else:
+                mappings.append(values)
+        if not mappings:
+            continue
+        if dry_run:
+            inserted += len(mappings)
+            continue
+        try:
+            db.session.execute(insert(model), mappings)
+            db.session.commit()
+            inserted += len(mappings)
+        except IntegrityError as error:
+            # e.g. an explicit id that already exists; the whole batch is rolled back
+            db.session.rollback()
+            report(None, RowError(f"{len(mappings)} rows rejected by the database: {error.orig}"), len(mappings))
+    return inserted, rejected
+
+
+# --- Export ---
+def export_rows(kind='tickets', batch_size=1000):
+    """
+    Stream rows out of the database with a server-side cursor (yield_per), so
+    only one batch is in memory at a time.
+    """
+    author = aliased(User)
+    if kind == 'tickets':
+        agent = aliased(User)
+        statement = (
+            select(Ticket.id, Ticket.title, Ticket.description, Ticket.category, Ticket.priority,
+                   Ticket.status, author.email, agent.email, Ticket.date_posted, Ticket.last_updated)
+            .join(author, Ticket.user_id == author.id)
+            .outerjoin(agent, Ticket.agent_id == agent.id)
+            .order_by(Ticket.id)
+        )
+        fields = TICKET_FIELDS
+    else:
+        statement = (
+            select(TicketResponse.id, TicketResponse.ticket_id, author.email, TicketResponse.content,
+                   TicketResponse.is_internal_note, TicketResponse.date_posted)
+            .join(author, TicketResponse.user_id == author.id)
+            .order_by(TicketResponse.id)
+        )
+        fields = RESPONSE_FIELDS
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    for row in result:
+        record = dict(zip(fields, row))
+        for key, value in record.items():
+            if isinstance(value, datetime):
+                record[key] = value.isoformat()
+        if 'is_internal_note' in record:
+            record['is_internal_note'] = bool(record['is_internal_note'])
+        yield record
+
+
+def _open(path, mode):
+    if path == '-':
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if 'r' in mode else sys.stdout
+        return contextlib.nullcontext(stream) # don't close stdin/stdout
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def _format_for(path, fmt):
+    if fmt:
+        return fmt
+    return 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+@tickets_cli.command('import')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults from the file extension.')
+@click.option('--kind', type=click.Choice(['tickets', 'responses']), default='tickets', show_default=True)
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--dry-run', is_flag=True, help='Validate only; insert nothing.')
+def import_command(path, fmt, kind, batch_size, dry_run):
+    """Import tickets or responses from a CSV/JSONL file ('-' for stdin)."""
+    def on_error(line, error):
+        where = f"row {line}" if line else "batch"
+        click.echo(f"{where}: {error}", err=True)
+
+    with _open(path, 'r') as stream:
+        inserted, rejected = import_rows(read_rows(stream, _format_for(path, fmt)), kind=kind,
+                                         batch_size=batch_size, dry_run=dry_run, on_error=on_error)
+
+    if inserted and not dry_run:
+        # Bulk inserts bypass the per-ticket hooks in routes.py
+        from routing import rebuild_agent_load
+        from search import get_search_backend
+        from stats import rebuild_ticket_stats
+        if kind == 'tickets':
+            rebuild_ticket_stats()
+            rebuild_agent_load()
+        get_search_backend().rebuild()
+        db.session.commit()
+        # These commit per batch themselves
+        from reports import backfill_events
+        backfill_events()
+        if kind == 'tickets':
+            from duplicates import backfill_signatures
+            backfill_signatures()
+    verb = 'Validated' if dry_run else 'Imported'
+    click.echo(f"{verb} {inserted} {kind}; rejected {rejected}.")
+
+
+@tickets_cli.command('export')
+@click.argument('path')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults from the file extension.')
+@click.option('--kind', type=click.Choice(['tickets', 'responses']), default='tickets', show_default=True)
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+def export_command(path, fmt, kind, batch_size):
+    """Export tickets or responses to a CSV/JSONL file ('-' for stdout)."""
+    fields = TICKET_FIELDS if kind == 'tickets' else RESPONSE_FIELDS
+    with _open(path, 'w') as stream:
+        write_rows(stream, _format_for(path, fmt), fields, export_rows(kind, batch_size))
@@ -0,0 +1,434 @@
+import re
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import case, event, func, insert, or_, select
+
+import routing
+from extensions import db
+from identity_cache import DatabaseVersionStore
+from models import Ticket, TicketDuplicate, TicketSignature
+
+# A signature is BANDS x ROWS MinHash values over the word pairs of a
+# ticket's title and description. Two tickets become candidates when all
+# ROWS values of any one band agree: for Jaccard similarity s that happens
+# with probability 1 - (1 - s**ROWS)**BANDS, ~0.74 at s = 0.5 and ~0.98 at
+# s = 0.7. Stored signatures depend on these and SEED: change any of them
+# and run `flask duplicates backfill --all`.
+BANDS = 10
+ROWS = 3
+SEED = 20240601
+PRIME = 4294967291 # largest prime below 2**32, so a * x + b fits in a uint64
+# Per band, only the newest tickets sharing a key are looked at (an outage
+# can put thousands in one bucket), and only the most promising candidates
+# are compared exactly.
+BUCKET_LIMIT = 200
+VERIFY_LIMIT = 50
+
+TOKEN = re.compile(r'\w+')
+# cache_version row bumped when tickets get signatures below other workers'
+# watermarks (restores, imports, backfills): every index rebuilds
+REBUILD_STAMP = 'duplicates'
+# session.info key: (index, ticket id, band keys) to add once the transaction commits
+PENDING_SIGNATURES = 'duplicate_signatures'
+
+duplicates_cli = AppGroup('duplicates', help='Near-duplicate ticket detection.')
+
+# One ticket a new one likely duplicates
+Match = namedtuple('Match', 'ticket_id user_id similarity linked')
+# One row of a ticket's duplicates card: the other ticket, and whether this
+# ticket is the later one ('of': it may duplicate the other) or not ('by')
+DuplicateEntry = namedtuple('DuplicateEntry', 'ticket_id user_id title status merged_into_id similarity linked direction')
+
+_permutations = None
+
+
+def _numpy():
+    import numpy as np # imported on first use, like reports.py; app.prewarm builds the index up front
+    return np
+
+
+# --- Signatures ---
+def ticket_text(title, description):
+    return f'{title}\n{description or ""}'
+
+
+def shingles(text):
+    """CRC-32s of the text's word pairs (its single word if it has only one)."""
+    words = TOKEN.findall(text.lower())
+    if len(words) < 2:
+        return {zlib.crc32(word.encode('utf-8')) for word in words}
+    return {zlib.crc32(f'{first} {second}'.encode('utf-8')) for first, second in zip(words, words[1:])}
+
+
+def similarity(first, second):
+    """Jaccard similarity of two shingle sets."""
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def band_keys(text):
+    """The text's BANDS band keys as a uint32 array, or None if it has no words."""
+    global _permutations
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    np = _numpy()
+    if _permutations is None:
+        # RandomState, not default_rng: its stream is fixed across NumPy versions
+        rng = np.random.RandomState(SEED)
+        _permutations = (rng.randint(1, PRIME, size=(BANDS * ROWS, 1), dtype=np.uint64),
+                         rng.randint(0, PRIME, size=(BANDS * ROWS, 1), dtype=np.uint64))
+    a, b = _permutations
+    x = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    minhash = ((a * x + b) % PRIME).min(axis=1).astype('<u4').reshape(BANDS, ROWS)
+    return np.array([zlib.crc32(band.tobytes()) for band in minhash], dtype='<u4')
+
+
+# --- Index ---
+class DuplicateIndex:
+    """
+    Per-worker LSH index from band keys to ticket ids. Each band is a pair
+    of parallel arrays, uint32 keys in sorted order and int32 ticket ids,
+    probed with searchsorted: 8 bytes per ticket per band (80 MB for a
+    million tickets) plus a byte per ticket id to skip ones already in.
+    New tickets wait in a small dict and are merged into the arrays
+    `pending_limit` at a time.
+    """
+
+    def __init__(self, pending_limit=1024):
+        np = _numpy()
+        self.keys = np.empty((BANDS, 0), dtype=np.uint32)
+        self.ids = np.empty((BANDS, 0), dtype=np.int32)
+        self.pending_limit = pending_limit
+        self._pending = [] # (ticket id, band keys)
+        self._pending_buckets = [{} for _ in range(BANDS)] # band -> {key: [ticket ids]}
+        self._seen = bytearray()
+        self.high_water = 0 # largest ticket_signature id read so far
+        self.stamp = None # REBUILD_STAMP as of the last rebuild
+        self.built_at = None
+        self.checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self.keys.shape[1] + len(self._pending)
+
+    def nbytes(self):
+        return self.keys.nbytes + self.ids.nbytes + len(self._seen)
+
+    def _sorted(self, keys, ids):
+        np = _numpy()
+        # Stable, so tickets sharing a key stay in id order (newest last)
+        order = np.argsort(keys, axis=1, kind='stable')
+        return np.take_along_axis(keys, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+    def load(self, ticket_ids, bands, high_water):
+        """Replace the contents: ticket_ids (n,) in ascending order, bands (n, BANDS)."""
+        np = _numpy()
+        ticket_ids = np.asarray(ticket_ids, dtype=np.int32)
+        keys, ids = self._sorted(np.ascontiguousarray(np.asarray(bands, dtype=np.uint32).T),
+                                 np.broadcast_to(ticket_ids, (BANDS, len(ticket_ids))))
+        seen = np.zeros(int(max(high_water, ticket_ids.max(initial=0))) + 1, dtype=np.uint8)
+        seen[ticket_ids] = 1
+        with self._lock:
+            self.keys, self.ids = keys, ids
+            self._pending, self._pending_buckets = [], [{} for _ in range(BANDS)]
+            self._seen = bytearray(seen.tobytes())
+            self.high_water = high_water
+
+    def add(self, ticket_id, keys):
+        with self._lock:
+            if ticket_id < len(self._seen) and self._seen[ticket_id]:
+                return
+            if ticket_id >= len(self._seen):
+                self._seen.extend(bytes(max(ticket_id + 1 - len(self._seen), 4096)))
+            self._seen[ticket_id] = 1
+            keys = [int(key) for key in keys]
+            self._pending.append((ticket_id, keys))
+            for band, key in enumerate(keys):
+                self._pending_buckets[band].setdefault(key, []).append(ticket_id)
+            if len(self._pending) >= self.pending_limit:
+                self._merge()
+
+    def _merge(self):
+        # Insert into the sorted arrays rather than sorting them again: one
+        # copy of each band instead of an argsort of a million keys
+        np = _numpy()
+        ids = np.array([ticket_id for ticket_id, _ in self._pending], dtype=np.int32)
+        new_keys, new_ids = self._sorted(np.array([keys for _, keys in self._pending], dtype=np.uint32).T,
+                                         np.broadcast_to(ids, (BANDS, len(ids))))
+        size = self.keys.shape[1] + len(ids)
+        keys, merged_ids = np.empty((BANDS, size), dtype=np.uint32), np.empty((BANDS, size), dtype=np.int32)
+        for band in range(BANDS):
+            # 'right': after existing tickets with the same key, so newest stay last
+            at = np.searchsorted(self.keys[band], new_keys[band], 'right')
+            keys[band] = np.insert(self.keys[band], at, new_keys[band])
+            merged_ids[band] = np.insert(self.ids[band], at, new_ids[band])
+        self.keys, self.ids = keys, merged_ids
+        self._pending, self._pending_buckets = [], [{} for _ in range(BANDS)]
+
+    def candidates(self, keys):
+        """{ticket id: bands it shares with `keys`}."""
+        np = _numpy()
+        with self._lock:
+            sorted_keys, ids, buckets = self.keys, self.ids, self._pending_buckets
+            found = []
+            for band, key in enumerate(keys):
+                row = sorted_keys[band]
+                low, high = np.searchsorted(row, key, 'left'), np.searchsorted(row, key, 'right')
+                if high > low:
+                    found.append(ids[band, max(low, high - BUCKET_LIMIT):high])
+                pending = buckets[band].get(int(key))
+                if pending:
+                    found.append(np.array(pending[-BUCKET_LIMIT:], dtype=np.int32))
+        if not found:
+            return {}
+        ticket_ids, counts = np.unique(np.concatenate(found), return_counts=True)
+        return dict(zip(ticket_ids.tolist(), counts.tolist()))
+
+
+def _signature_rows(query, batch_size=50000):
+    """(ticket ids, bands) arrays for a ticket_signature query, read by primary key in batches."""
+    np = _numpy()
+    id_parts, band_parts, last_id = [], [], 0
+    while True:
+        rows = db.session.execute(
+            query.where(TicketSignature.ticket_id > last_id).order_by(TicketSignature.ticket_id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        id_parts.append(np.fromiter((row[0] for row in rows), dtype=np.int32, count=len(rows)))
+        band_parts.append(np.frombuffer(b''.join(row[1] for row in rows), dtype='<u4').reshape(-1, BANDS))
+        last_id = rows[-1][0]
+    if not id_parts:
+        return np.empty(0, dtype=np.int32), np.empty((0, BANDS), dtype=np.uint32)
+    return np.concatenate(id_parts), np.concatenate(band_parts)
+
+
+def rebuild(index):
+    """Load the signatures of every open, unmerged ticket."""
+    stamp = DatabaseVersionStore(REBUILD_STAMP).current() # first: a bump while we load rebuilds again
+    high_water = db.session.execute(select(func.max(TicketSignature.ticket_id))).scalar() or 0
+    ticket_ids, bands = _signature_rows(
+        select(TicketSignature.ticket_id, TicketSignature.bands)
+        .join(Ticket, Ticket.id == TicketSignature.ticket_id)
+        .where(Ticket.status.in_(routing.OPEN_STATUSES), Ticket.merged_into_id.is_(None)))
+    index.load(ticket_ids, bands, high_water)
+    index.stamp = stamp
+    index.built_at = index.checked_at = time.monotonic()
+
+
+def request_rebuild():
+    """
+    Make every worker rebuild its index, for signatures added under old
+    ticket ids that catch_up() would never read. Runs in the caller's
+    transaction.
+    """
+    DatabaseVersionStore(REBUILD_STAMP).bump()
+
+
+def catch_up(index, overlap=100):
+    """
+    Add tickets other workers signed since we last looked. Ids are handed
+    out before their transactions commit, so re-read the last `overlap`
+    below the watermark too; the index skips ones it already has.
+    """
+    np = _numpy()
+    rows = db.session.execute(
+        select(TicketSignature.ticket_id, TicketSignature.bands)
+        .where(TicketSignature.ticket_id > index.high_water - overlap).order_by(TicketSignature.ticket_id)
+    ).all()
+    for ticket_id, bands in rows:
+        index.add(ticket_id, np.frombuffer(bands, dtype='<u4'))
+    if rows:
+        index.high_water = max(index.high_water, rows[-1][0])
+    index.checked_at = time.monotonic()
+
+
+def sync(index):
+    """
+    Build the index on first use, every DUPLICATES_REBUILD_SECONDS and after
+    request_rebuild(); otherwise catch up now and then.
+    """
+    config = current_app.config
+    now = time.monotonic()
+    if index.built_at is None or now - index.built_at >= config.get('DUPLICATES_REBUILD_SECONDS', 6 * 3600):
+        rebuild(index)
+    elif now - index.checked_at >= config.get('DUPLICATES_REFRESH_SECONDS', 1.0):
+        if DatabaseVersionStore(REBUILD_STAMP).current() != index.stamp:
+            rebuild(index)
+        else:
+            catch_up(index)
+
+
+def get_duplicate_index():
+    index = current_app.extensions.get('duplicate_index')
+    if index is None:
+        index = DuplicateIndex()
+        current_app.extensions['duplicate_index'] = index
+    return index
+
+
+# --- Matching ---
+def find_matches(text, keys, index, exclude=None, min_similarity=0.5, limit=5):
+    """
+    Open, unmerged tickets whose text is at least `min_similarity` similar,
+    best first. The index only proposes candidates; each is checked exactly
+    against its current title and description (one query), so stale index
+    entries cost nothing but a row that doesn't come back.
+    """
+    hits = index.candidates(keys)
+    hits.pop(exclude, None)
+    if not hits:
+        return []
+    ranked = sorted(hits, key=lambda ticket_id: (-hits[ticket_id], -ticket_id))[:VERIFY_LIMIT]
+    rows = db.session.execute(
+        select(Ticket.id, Ticket.user_id, Ticket.title, Ticket.description)
+        .where(Ticket.id.in_(ranked), Ticket.status.in_(routing.OPEN_STATUSES), Ticket.merged_into_id.is_(None))
+    ).all()
+    mine = shingles(text)
+    scored = sorted(((similarity(mine, shingles(ticket_text(row.title, row.description))), row.id, row.user_id)
+                     for row in rows), reverse=True)
+    return [Match(ticket_id, user_id, round(score, 4), False)
+            for score, ticket_id, user_id in scored if score >= min_similarity][:limit]
+
+
+# --- Hooks called from routes.py, inside the same transaction as the change ---
+def record_ticket_created(ticket):
+    """
+    Sign a new ticket, record the open tickets it likely duplicates and
+    link the closest one if it is at least DUPLICATES_AUTO_LINK_SIMILARITY
+    similar. Returns the matches, best first.
+    """
+    config = current_app.config
+    if not config.get('DUPLICATES_ENABLED', True):
+        return []
+    text = ticket_text(ticket.title, ticket.description)
+    keys = band_keys(text)
+    if keys is None:
+        return []
+    index = get_duplicate_index()
+    sync(index)
+    matches = find_matches(text, keys, index, exclude=ticket.id,
+                           min_similarity=config.get('DUPLICATES_MIN_SIMILARITY', 0.5),
+                           limit=config.get('DUPLICATES_MAX_RESULTS', 5))
+    auto_link = config.get('DUPLICATES_AUTO_LINK_SIMILARITY')
+    if matches and auto_link is not None and matches[0].similarity >= auto_link:
+        matches[0] = matches[0]._replace(linked=True)
+    db.session.add(TicketSignature(ticket_id=ticket.id, bands=keys.tobytes()))
+    if matches:
+        now = ticket.date_posted or datetime.utcnow()
+        db.session.execute(insert(TicketDuplicate), [
+            {'ticket_id': ticket.id, 'duplicate_of_id': match.ticket_id, 'similarity': match.similarity,
+             'linked': match.linked, 'created_at': now} for match in matches])
+    # Indexed once committed: SQLite hands a rolled-back id out again, and
+    # the index would skip the ticket that really gets it
+    db.session.info.setdefault(PENDING_SIGNATURES, []).append((index, ticket.id, keys))
+    return matches
+
+
+@event.listens_for(db.session, 'after_commit')
+def _index_committed(session):
+    for index, ticket_id, keys in session.info.pop(PENDING_SIGNATURES, ()):
+        index.add(ticket_id, keys)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _drop_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None: # the whole transaction, not a savepoint
+        session.info.pop(PENDING_SIGNATURES, None)
+
+
+# --- Reading ---
+def ticket_duplicates(ticket_id, limit=20):
+    """
+    The tickets this one may duplicate and those that may duplicate it,
+    with each other ticket's author, title and status, in one query. Linked
+    and closest first.
+    """
+    other_id = case((TicketDuplicate.ticket_id == ticket_id, TicketDuplicate.duplicate_of_id),
+                    else_=TicketDuplicate.ticket_id)
+    rows = db.session.execute(
+        select(TicketDuplicate.ticket_id, TicketDuplicate.similarity, TicketDuplicate.linked,
+               Ticket.id, Ticket.user_id, Ticket.title, Ticket.status, Ticket.merged_into_id)
+        .join(Ticket, Ticket.id == other_id)
+        .where(or_(TicketDuplicate.ticket_id == ticket_id, TicketDuplicate.duplicate_of_id == ticket_id))
+        .order_by(TicketDuplicate.linked.desc(), TicketDuplicate.similarity.desc(), Ticket.id.desc())
+        .limit(limit)
+    ).all()
+    return [DuplicateEntry(row.id, row.user_id, row.title, row.status, row.merged_into_id, row.similarity, row.linked,
+                           'of' if row.ticket_id == ticket_id else 'by')
+            for row in rows]
+
+
+# --- Backfill ---
+def backfill_signatures(batch_size=1000, resign=False):
+    """
+    Sign tickets that have no signature yet (all of them with `resign`,
+    after changing BANDS/ROWS/SEED). Walks tickets by primary key and
+    commits per batch; duplicates are only looked for on submit. The
+    workers' indexes are rebuilt to pick the new signatures up. Returns the
+    number of tickets signed.
+    """
+    if resign:
+        db.session.execute(TicketSignature.__table__.delete())
+        db.session.commit()
+    last_id, signed = 0, 0
+    while True:
+        tickets = db.session.execute(
+            select(Ticket.id, Ticket.title, Ticket.description)
+            .outerjoin(TicketSignature, TicketSignature.ticket_id == Ticket.id)
+            .where(Ticket.id > last_id, TicketSignature.ticket_id.is_(None))
+            .order_by(Ticket.id).limit(batch_size)
+        ).all()
+        if not tickets:
+            break
+        rows = []
+        for ticket in tickets:
+            keys = band_keys(ticket_text(ticket.title, ticket.description))
+            if keys is not None:
+                rows.append({'ticket_id': ticket.id, 'bands': keys.tobytes()})
+        if rows:
+            db.session.execute(insert(TicketSignature), rows)
+        db.session.commit()
+        last_id, signed = tickets[-1].id, signed + len(rows)
+    if signed or resign:
+        request_rebuild()
+        db.session.commit()
+    return signed
+
+
+# --- CLI ---
+@duplicates_cli.command('backfill')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+@click.option('--all', 'resign', is_flag=True, help='Re-sign every ticket (after changing the signature parameters).')
+def backfill_command(batch_size, resign):
+    """Sign tickets that predate duplicate detection."""
+    click.echo(f"Signed {backfill_signatures(batch_size, resign)} tickets.")
+
+
+@duplicates_cli.command('find')
+@click.argument('ticket_id', type=int)
+def find_command(ticket_id):
+    """List the open tickets a ticket likely duplicates."""
+    ticket = db.session.get(Ticket, ticket_id)
+    if ticket is None:
+        raise click.BadParameter(f'no ticket #{ticket_id}')
+    text = ticket_text(ticket.title, ticket.description)
+    keys = band_keys(text)
+    if keys is None:
+        return
+    index = get_duplicate_index()
+    sync(index)
+    config = current_app.config
+    for match in find_matches(text, keys, index, exclude=ticket_id,
+                              min_similarity=config.get('DUPLICATES_MIN_SIMILARITY', 0.5),
+                              limit=config.get('DUPLICATES_MAX_RESULTS', 5)):
+        click.echo(f"#{match.ticket_id}\t{match.similarity:.2f}")
@@ -0,0 +1,211 @@
+import json
+import queue
+import threading
+import time
+
+from flask import current_app
+
+from listing import response_to_dict, ticket_to_dict
+
+# Event types pushed to browsers
+TICKET_CREATED = 'ticket-created'
+STATUS_CHANGED = 'status-changed'
+ASSIGNED = 'assigned'
+NEW_RESPONSE = 'new-response'
+
+
+# --- Channels ---
+# Each open page subscribes to the channels it displays. Internal notes go to
+# a separate per-ticket channel that only agents/admins may subscribe to.
+def ticket_channel(ticket_id, internal=False):
+    return f"ticket:{ticket_id}:internal" if internal else f"ticket:{ticket_id}"
+
+
+def dashboard_channels(user):
+    """Channels carrying changes to the tickets on this user's dashboard."""
+    if user.is_admin:
+        return ['dashboard:admin']
+    if user.is_agent:
+        return [f'dashboard:agent:{user.id}', 'dashboard:unassigned']
+    return [f'dashboard:user:{user.id}']
+
+
+def ticket_dashboard_channels(ticket, previous_agent_id=None):
+    """Every dashboard that shows (or just stopped showing) this ticket."""
+    channels = ['dashboard:admin', f'dashboard:user:{ticket.user_id}']
+    if ticket.agent_id is None:
+        channels.append('dashboard:unassigned')
+    else:
+        channels.append(f'dashboard:agent:{ticket.agent_id}')
+    if previous_agent_id is None and ticket.agent_id is not None:
+        channels.append('dashboard:unassigned')
+    elif previous_agent_id is not None and previous_agent_id != ticket.agent_id:
+        channels.append(f'dashboard:agent:{previous_agent_id}')
+    return channels
+
+
+class Subscription:
+    """One SSE connection's inbox. Bounded so a stalled client can't grow it forever."""
+
+    def __init__(self, channels, maxsize=100):
+        self.channels = list(channels)
+        self._queue = queue.Queue(maxsize=maxsize)
+        # Set when we had to drop an event; the client should reload instead
+        # of trusting its incremental state.
+        self.overflowed = False
+
+    def deliver(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        pass
+
+
+# --- Backends ---
+class LocalBackend:
+    """In-process fan-out. Fine for one worker; use Redis for several."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers.setdefault(channel, set()).add(subscription)
+        subscription.close = lambda: self._unsubscribe(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class RedisSubscription:
+    def __init__(self, client, channels):
+        self.channels = list(channels)
+        self.overflowed = False
+        self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(*self.channels)
+
+    def get(self, timeout):
+        message = self._pubsub.get_message(timeout=timeout)
+        if message is None:
+            return None
+        data = message['data']
+        return data.decode('utf-8') if isinstance(data, bytes) else data
+
+    def close(self):
+        self._pubsub.close()
+
+
+class RedisBackend:
+    """Redis pub/sub, so an event published by one worker reaches all of them."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("EVENT_BUS_BACKEND = 'redis' requires the redis package") from None
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channels):
+        return RedisSubscription(self.client, channels)
+
+
+class EventBus:
+    def __init__(self, backend):
+        self.backend = backend
+        # In-process callbacks, run synchronously on publish in this worker
+        self._listeners = []
+
+    def listen(self, callback):
+        """Register callback(event_type, payload) for events published here."""
+        self._listeners.append(callback)
+
+    def publish(self, event_type, payload, channels):
+        message = json.dumps({'type': event_type, **payload})
+        for channel in channels:
+            self.backend.publish(channel, message)
+        for callback in self._listeners:
+            callback(event_type, payload)
+
+    def subscribe(self, channels):
+        return self.backend.subscribe(channels)
+
+
+def get_event_bus():
+    bus = current_app.extensions.get('event_bus')
+    if bus is None:
+        if current_app.config.get('EVENT_BUS_BACKEND') == 'redis':
+            backend = RedisBackend(current_app.config['EVENT_BUS_REDIS_URL'])
+        else:
+            backend = LocalBackend()
+        bus = EventBus(backend)
+        current_app.extensions['event_bus'] = bus
+    return bus
+
+
+# --- Publishing helpers used by routes.py, always after the commit ---
+def publish_ticket_event(event_type, ticket, previous_agent_id=None):
+    get_event_bus().publish(event_type, {'ticket': ticket_to_dict(ticket)},
+                            [ticket_channel(ticket.id)] + ticket_dashboard_channels(ticket, previous_agent_id))
+
+
+def publish_response(response):
+    ticket = response.ticket
+    payload = {'ticket': ticket_to_dict(ticket), 'response': response_to_dict(response)}
+    # Customers must never receive internal notes, not even on their dashboard
+    if response.is_internal_note:
+        channels = [ticket_channel(ticket.id, internal=True)]
+    else:
+        channels = [ticket_channel(ticket.id)] + ticket_dashboard_channels(ticket)
+    get_event_bus().publish(NEW_RESPONSE, payload, channels)
+
+
+# --- SSE stream ---
+def sse_stream(subscription, heartbeat=15, lifetime=300):
+    """
+    Yield text/event-stream chunks until `lifetime` seconds pass. Browsers
+    reconnect on their own, which frees the worker and lets a new connection
+    pick up role changes.
+    """
+    deadline = time.monotonic() + lifetime
+    try:
+        yield 'retry: 3000\n\n'
+        while time.monotonic() < deadline:
+            message = subscription.get(timeout=heartbeat)
+            if subscription.overflowed:
+                yield 'event: resync\ndata: {}\n\n'
+                return
+            if message is None:
+                yield ': keepalive\n\n'
+                continue
+            event_type = json.loads(message).get('type', 'message')
+            yield f'event: {event_type}\ndata: {message}\n\n'
+    finally:
+        subscription.close()
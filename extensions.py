@@ -0,0 +1,22 @@
+# Extension objects, created unbound and attached to an app in create_app().
+# Modules import them from here instead of from app.py, so importing models
+# or routes never builds an application. Flask-Migrate is not among them:
+# only `flask db` needs it (app.MigrateGroup).
+from flask_login import LoginManager
+from flask_sqlalchemy import SQLAlchemy
+
+from instrumentation import Instrumentation
+from ratelimit import RateLimiter
+from replicas import ReplicaRouter, RoutingSession
+
+# Reads may go to a replica (replicas.py); writes always go to the primary
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+login_manager = LoginManager()
+login_manager.login_view = 'main.login' # Name of the login route function
+login_manager.login_message_category = 'info'
+# Per-request latency and SQL accounting, exported at /metrics
+instrumentation = Instrumentation()
+# Token buckets on login/register/submission endpoints (RATE_LIMITS)
+limiter = RateLimiter()
+# Sends dashboard reads to DATABASE_REPLICA_URLS
+replica_router = ReplicaRouter()
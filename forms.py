@@ -1,5 +1,7 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, TextAreaField, SelectField, BooleanField
+from flask_wtf.file import MultipleFileField
+from wtforms import (StringField, PasswordField, SubmitField, TextAreaField, SelectField, BooleanField, IntegerField,
+                     SelectMultipleField)
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from models import User
 
@@ -40,11 +42,13 @@ class TicketForm(FlaskForm):
         ('High', 'High'),
         ('Urgent', 'Urgent')
     ], default='Medium', validators=[DataRequired()])
+    attachments = MultipleFileField('Attachments') # size limits are enforced while streaming (attachments.py)
     submit = SubmitField('Submit Ticket')
 
 class TicketResponseForm(FlaskForm):
     content = TextAreaField('Your Response', validators=[DataRequired()])
     is_internal_note = BooleanField('Internal Note (Agent Only)')
+    attachments = MultipleFileField('Attachments')
     submit = SubmitField('Add Response')
 
 class AssignAgentForm(FlaskForm):
@@ -58,4 +62,27 @@ class ChangeStatusForm(FlaskForm):
         ('Resolved', 'Resolved'),
         ('Closed', 'Closed')
     ], validators=[DataRequired()])
-    submit = SubmitField('Update Status')
\ No newline at end of file
+    submit = SubmitField('Update Status')
+
+class ClaimTicketForm(FlaskForm):
+    submit = SubmitField('Claim Next Ticket')
+
+class RestoreTicketForm(FlaskForm):
+    submit = SubmitField('Restore Ticket')
+
+# Batch operations on the agent dashboard (batch.py). Both forms read the
+# same row checkboxes (name="ticket_ids"); any ticket id is accepted here and
+# batch.py refuses the ones outside the agent's dashboard.
+NO_CHANGE = ('', 'No change')
+
+class BatchUpdateForm(FlaskForm):
+    ticket_ids = SelectMultipleField('Tickets', coerce=int, validate_choice=False, validators=[DataRequired()])
+    agent = SelectField('Assign to', default='') # choices: NO_CHANGE, 'none' (unassign) and the agents, set in routes.py
+    status = SelectField('Status', choices=[NO_CHANGE] + ChangeStatusForm.status.kwargs['choices'], default='')
+    priority = SelectField('Priority', choices=[NO_CHANGE] + TicketForm.priority.kwargs['choices'], default='')
+    submit = SubmitField('Apply to Selected')
+
+class MergeTicketsForm(FlaskForm):
+    ticket_ids = SelectMultipleField('Tickets', coerce=int, validate_choice=False, validators=[DataRequired()])
+    canonical = IntegerField('Merge into ticket #', validators=[DataRequired()])
+    submit = SubmitField('Merge Selected')
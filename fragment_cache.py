@@ -0,0 +1,135 @@
+import time
+
+from flask import current_app
+from flask_login import current_user
+from markupsafe import Markup
+
+import events
+from identity_cache import TTLCache
+from instrumentation import get_instrumentation
+
+
+def viewer_role(user):
+    if not user.is_authenticated:
+        return 'anonymous'
+    if user.is_admin:
+        return 'admin'
+    return 'agent' if user.is_agent else 'customer'
+
+
+class RedisFragmentStore:
+    """Shared tier: rendered HTML in Redis, so one worker's render serves all of them."""
+
+    def __init__(self, url, ttl=3600, prefix='ticketing:fragment'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("FRAGMENT_CACHE_BACKEND = 'redis' requires the redis package") from None
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, ticket_id, stamp, name):
+        return f'{self.prefix}:{ticket_id}:{stamp}:{name}'
+
+    def get(self, ticket_id, stamp, name):
+        value = self.client.get(self._key(ticket_id, stamp, name))
+        return value.decode('utf-8') if value is not None else None
+
+    def set(self, ticket_id, stamp, name, html):
+        self.client.set(self._key(ticket_id, stamp, name), html.encode('utf-8'), ex=self.ttl)
+
+
+class FragmentCache:
+    """
+    Rendered per-ticket markup (dashboard rows, the ticket detail header),
+    keyed by (ticket id, last_updated, fragment name, viewer role).
+
+    Every write that changes what a fragment shows also moves last_updated,
+    so a changed ticket simply stops matching its old entries, in every
+    worker and in the shared tier, without anyone having to delete them.
+    The local tier holds one entry per ticket (an LRU bounded by maxsize)
+    and drops it as soon as this worker publishes an event for the ticket;
+    shared entries under old stamps expire through their TTL.
+    """
+
+    def __init__(self, maxsize=2048, ttl=3600, shared=None, clock=time.monotonic):
+        # ticket id -> (stamp, {fragment key: html})
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl, clock=clock)
+        self.shared = shared
+
+    def get(self, ticket_id, stamp, key):
+        entry = self.local.get(ticket_id)
+        if entry is not None and entry[0] == stamp and key in entry[1]:
+            return entry[1][key], 'local'
+        if self.shared is not None:
+            html = self.shared.get(ticket_id, stamp, key)
+            if html is not None:
+                self._set_local(ticket_id, stamp, key, html)
+                return html, 'shared'
+        return None, None
+
+    def set(self, ticket_id, stamp, key, html):
+        self._set_local(ticket_id, stamp, key, html)
+        if self.shared is not None:
+            self.shared.set(ticket_id, stamp, key, html)
+
+    def _set_local(self, ticket_id, stamp, key, html):
+        entry = self.local.get(ticket_id)
+        # Copy on write: other threads may be reading the old dict
+        fragments = dict(entry[1]) if entry is not None and entry[0] == stamp else {}
+        fragments[key] = html
+        self.local.set(ticket_id, (stamp, fragments))
+
+    def invalidate(self, ticket_id):
+        self.local.delete(ticket_id)
+
+    def clear(self):
+        self.local.clear()
+
+    def on_event(self, event_type, payload):
+        # EventBus listener: status changes, assignments and responses all
+        # publish the ticket after committing
+        ticket = payload.get('ticket')
+        if ticket:
+            self.invalidate(ticket['id'])
+
+
+def get_fragment_cache():
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        config = current_app.config
+        shared = None
+        if config.get('FRAGMENT_CACHE_BACKEND') == 'redis':
+            shared = RedisFragmentStore(config['FRAGMENT_CACHE_REDIS_URL'], ttl=config.get('FRAGMENT_CACHE_TTL', 3600))
+        cache = FragmentCache(maxsize=config.get('FRAGMENT_CACHE_SIZE', 2048),
+                              ttl=config.get('FRAGMENT_CACHE_TTL', 3600), shared=shared)
+        events.get_event_bus().listen(cache.on_event)
+        current_app.extensions['fragment_cache'] = cache
+    return cache
+
+
+def cached_fragment(name, ticket, *extra, caller):
+    """
+    Template helper. Wrap per-ticket markup in
+
+        {% call cached_fragment('admin_row', ticket) %} ... {% endcall %}
+
+    and the body is only rendered on a miss. Anything else the markup
+    depends on besides the ticket row and the viewer's role (e.g. fields
+    that change without touching last_updated) goes in `extra`.
+    """
+    if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+        return caller()
+    cache = get_fragment_cache()
+    stamp = ticket.last_updated.isoformat()
+    key = ':'.join([name, viewer_role(current_user)] + [str(part) for part in extra])
+    html, tier = cache.get(ticket.id, stamp, key)
+    metric = get_instrumentation().metrics.fragment_cache
+    if html is not None:
+        metric.inc(tier, 'hit')
+        return Markup(html)
+    metric.inc('all', 'miss')
+    html = str(caller())
+    cache.set(ticket.id, stamp, key, html)
+    return Markup(html)
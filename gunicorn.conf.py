@@ -0,0 +1,52 @@
+# Gunicorn launch profile: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Each worker process has its own SQLAlchemy pool of DB_POOL_SIZE +
+# DB_MAX_OVERFLOW connections, so the number of workers is capped by the
+# connection budget we're allowed to use on MySQL (DB_CONNECTION_BUDGET,
+# leave headroom below max_connections for the notify worker, migrations
+# and admin sessions). Inside a worker, concurrency comes from gevent
+# greenlets (or threads with GUNICORN_WORKER_CLASS=gthread); requests beyond
+# the pool wait up to DB_POOL_TIMEOUT for a connection instead of opening
+# new ones.
+import multiprocessing
+import os
+
+from config import Config
+
+pool_per_worker = Config.DB_POOL_SIZE + Config.DB_MAX_OVERFLOW
+connection_budget = int(os.environ.get('DB_CONNECTION_BUDGET', 120))
+cpu_workers = multiprocessing.cpu_count() * 2 + 1
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY') or max(1, min(cpu_workers, connection_budget // pool_per_worker)))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+if worker_class == 'gevent':
+    # Greenlets per worker. Mostly these are waiting on the network (or
+    # holding an open /events stream, which doesn't use a DB connection).
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 500))
+else:
+    # One thread per pooled connection, so threads never queue on the pool
+    threads = int(os.environ.get('GUNICORN_THREADS', pool_per_worker))
+
+# /events streams stay open for EVENTS_STREAM_LIFETIME seconds
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', Config.EVENTS_STREAM_LIFETIME + 30))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then to bound slow memory growth
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+# Every worker builds its own app (and so its own engine and pool) after the
+# fork; a preloaded app would share pooled sockets between processes.
+preload_app = False
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    # The app is loaded and the worker is about to accept connections: pay
+    # for mapper configuration, template compilation and the first pooled
+    # connections now, not on the first requests it serves.
+    app = worker.wsgi
+    if app.config.get('PREWARM_ENABLED', True):
+        from app import prewarm
+        prewarm(app)
@@ -0,0 +1,257 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import make_transient_to_detached
+
+from extensions import db
+from models import CacheVersion, User
+from replicas import primary_reads
+
+VERSION_NAME = 'identity'
+# session.info key: the IdentityCache to invalidate once the transaction commits
+PENDING_INVALIDATION = 'identity_cache_invalidation'
+
+
+class TTLCache:
+    """A small thread-safe LRU where entries also expire after `ttl` seconds."""
+
+    def __init__(self, maxsize=1024, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.clock() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+# --- Version stores ---
+# Invalidation works by bumping a shared version number. Each worker compares
+# it with the version its local cache was filled under and clears on change.
+# A store that is not `transactional` is bumped after the role change
+# commits: bumped before, another worker could reload the old role in
+# between and keep it for a whole TTL.
+class LocalVersionStore:
+    """Single process only (dev server, tests)."""
+
+    transactional = False
+
+    def __init__(self):
+        self.version = 0
+
+    def current(self):
+        return self.version
+
+    def bump(self):
+        self.version += 1
+
+
+class DatabaseVersionStore:
+    """
+    Version stamp in the cache_version table. bump() runs in the caller's
+    transaction, so the new version is visible exactly when the role change
+    it belongs to is committed. Other caches keep their stamps under their
+    own `name` (duplicates.py).
+    """
+
+    transactional = True
+
+    def __init__(self, name=VERSION_NAME):
+        self.name = name
+
+    def current(self):
+        return db.session.execute(
+            select(CacheVersion.version).where(CacheVersion.name == self.name)
+        ).scalar() or 0
+
+    def bump(self):
+        result = db.session.execute(
+            update(CacheVersion).where(CacheVersion.name == self.name)
+            .values(version=CacheVersion.version + 1)
+        )
+        if result.rowcount:
+            return
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(CacheVersion).values(name=self.name, version=1))
+        except IntegrityError:
+            db.session.execute(
+                update(CacheVersion).where(CacheVersion.name == self.name)
+                .values(version=CacheVersion.version + 1)
+            )
+
+
+class RedisVersionStore:
+    """Version counter in Redis; checking it costs no database round trip."""
+
+    transactional = False
+
+    def __init__(self, url, key='ticketing:identity-version'):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("IDENTITY_CACHE_BACKEND = 'redis' requires the redis package") from None
+        self.client = redis.Redis.from_url(url)
+        self.key = key
+
+    def current(self):
+        return int(self.client.get(self.key) or 0)
+
+    def bump(self):
+        self.client.incr(self.key)
+
+
+class IdentityCache:
+    """
+    Caches users (for load_user) and the agent choices list. Cached users are
+    detached snapshots; get_user() merges them into the current session with
+    load=False, which gives the request a normal persistent User without a
+    SELECT. Misses and version checks read from the primary, also on
+    replica-routed requests.
+    """
+
+    def __init__(self, versions, maxsize=1024, ttl=300, check_interval=1.0, clock=time.monotonic):
+        self.versions = versions
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, clock=clock)
+        self.check_interval = check_interval
+        self.clock = clock
+        self._seen_version = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def sync(self):
+        """
+        Clear the local cache if another worker invalidated it. The shared
+        version is polled at most once per check_interval, which bounds how
+        long a demoted user can keep their old role in this worker.
+        """
+        now = self.clock()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+        with primary_reads():
+            version = self.versions.current()
+        with self._lock:
+            if version != self._seen_version:
+                self.cache.clear()
+                self._seen_version = version
+
+    def get_user(self, user_id):
+        self.sync()
+        key = ('user', user_id)
+        snapshot = self.cache.get(key)
+        if snapshot is None:
+            with primary_reads():
+                user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            self.cache.set(key, _snapshot(user))
+            return user
+        return db.session.merge(snapshot, load=False)
+
+    def agent_choices(self):
+        """(id, username) pairs for everyone who can be assigned a ticket."""
+        self.sync()
+        choices = self.cache.get('agent_choices')
+        if choices is None:
+            with primary_reads():
+                agents = db.session.query(User.id, User.username).filter(
+                    (User.is_agent == True) | (User.is_admin == True)
+                ).order_by(User.username).all()
+            choices = [(agent.id, agent.username) for agent in agents]
+            self.cache.set('agent_choices', choices)
+        return list(choices)
+
+    def invalidate(self):
+        """
+        Call when roles change, before committing the change. The version is
+        bumped with the change (database store) or right after it commits
+        (the others), and this worker's cache is cleared again then; a
+        rollback cancels the bump.
+        """
+        if self.versions.transactional:
+            self.versions.bump()
+        db.session.info[PENDING_INVALIDATION] = self
+        self.clear()
+
+    def clear(self):
+        self.cache.clear()
+        with self._lock:
+            self._checked_at = None
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    cache = session.info.pop(PENDING_INVALIDATION, None)
+    if cache is not None:
+        if not cache.versions.transactional:
+            cache.versions.bump()
+        cache.clear() # requests that ran while the change was uncommitted may have re-cached the old role
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _invalidate_rolled_back(session, previous_transaction):
+    if previous_transaction.parent is None: # the whole transaction, not a savepoint
+        session.info.pop(PENDING_INVALIDATION, None)
+
+
+def _snapshot(user):
+    # A detached copy holding only column values; sharing the session-bound
+    # instance between requests (and threads) is not safe.
+    copy = User(**{column.key: getattr(user, column.key) for column in User.__mapper__.column_attrs})
+    make_transient_to_detached(copy)
+    return copy
+
+
+def get_identity_cache():
+    cache = current_app.extensions.get('identity_cache')
+    if cache is None:
+        config = current_app.config
+        backend = config.get('IDENTITY_CACHE_BACKEND', 'database')
+        if backend == 'redis':
+            versions = RedisVersionStore(config['IDENTITY_CACHE_REDIS_URL'])
+        elif backend == 'local':
+            versions = LocalVersionStore()
+        else:
+            versions = DatabaseVersionStore()
+        cache = IdentityCache(
+            versions,
+            maxsize=config.get('IDENTITY_CACHE_SIZE', 1024),
+            ttl=config.get('IDENTITY_CACHE_TTL', 300),
+            check_interval=config.get('IDENTITY_CACHE_CHECK_INTERVAL', 1.0),
+        )
+        current_app.extensions['identity_cache'] = cache
+    return cache
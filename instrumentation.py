@@ -0,0 +1,249 @@
+import bisect
+import functools
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+# Long-lived or trivial endpoints that would only distort the histograms
+DEFAULT_EXCLUDED_ENDPOINTS = ('static', 'main.live_events', 'main.download_attachment', 'main.upload_attachment')
+
+# "IN (?, ?, ?)" and "IN (%s, %s)" both become "IN (?)", so the same query
+# with a different number of ids still counts as one statement shape.
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))*\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=2048)
+def statement_shape(statement):
+    return _WHITESPACE.sub(' ', _IN_LIST.sub('(?)', statement)).strip()
+
+
+# --- Metric types (Prometheus text format) ---
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra) if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class CounterMetric:
+    """A monotonically increasing count per label set."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            yield f'{self.name}{_labels(self.label_names, labels)} {value}'
+
+
+class Histogram:
+    """Fixed-bucket histogram per label set; observe() is a bisect and three adds."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {} # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        with self._lock:
+            values = sorted((labels, (list(counts), total, count)) for labels, (counts, total, count) in self._values.items())
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket{_labels(self.label_names, labels, [("le", bound)])} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {total}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {count}'
+
+
+class Metrics:
+    def __init__(self):
+        self.request_duration = Histogram(
+            'ticketing_request_duration_seconds', 'Time spent handling a request.',
+            labels=('endpoint', 'method', 'status'))
+        self.request_queries = Histogram(
+            'ticketing_request_queries', 'SQL statements run by one request.',
+            labels=('endpoint',), buckets=QUERY_COUNT_BUCKETS)
+        self.request_query_time = Histogram(
+            'ticketing_request_query_seconds', 'Time one request spent waiting on SQL.',
+            labels=('endpoint',))
+        self.n_plus_one = CounterMetric(
+            'ticketing_n_plus_one_total', 'Requests that repeated one statement shape more than the threshold.',
+            labels=('endpoint',))
+        self.slow_queries = CounterMetric(
+            'ticketing_slow_queries_total', 'SQL statements slower than SLOW_QUERY_SECONDS.',
+            labels=('endpoint',))
+        self.fragment_cache = CounterMetric(
+            'ticketing_fragment_cache_total', 'Fragment cache lookups (fragment_cache.py) by tier and result.',
+            labels=('tier', 'result'))
+        self.rate_limited = CounterMetric(
+            'ticketing_rate_limited_total', 'Requests rejected with 429 by the rate limiter (ratelimit.py).',
+            labels=('endpoint',))
+        self.replica_reads = CounterMetric(
+            'ticketing_replica_reads_total', 'Read-only requests by where their reads went (replicas.py).',
+            labels=('target', 'reason'))
+
+    def all(self):
+        return [self.request_duration, self.request_queries, self.request_query_time,
+                self.n_plus_one, self.slow_queries, self.fragment_cache, self.rate_limited,
+                self.replica_reads]
+
+    def render(self):
+        lines = []
+        for metric in self.all():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    """What one request has done so far; lives on flask.g."""
+
+    __slots__ = ('started', 'queries', 'query_time', 'statements', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.statements = Counter() # raw statement text -> executions
+        self.status = 500 # until after_request says otherwise
+
+
+class Instrumentation:
+    """
+    Per-request timing and SQL accounting. Cursor events are registered on
+    the Engine class, so every engine the app creates is covered. Outside a
+    request (CLI commands, workers) the hooks do nothing.
+
+    Numbers are per process; with several workers each scrape of /metrics
+    sees the worker that served it.
+    """
+
+    def __init__(self, app=None):
+        self.metrics = Metrics()
+        self.enabled = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.slow_query_seconds = config.get('SLOW_QUERY_SECONDS', 0.5)
+        self.n_plus_one_threshold = config.get('N_PLUS_ONE_THRESHOLD', 10)
+        self.excluded = set(config.get('INSTRUMENTATION_EXCLUDED_ENDPOINTS', DEFAULT_EXCLUDED_ENDPOINTS))
+        app.extensions['instrumentation'] = self
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        if config.get('INSTRUMENTATION_ENABLED', True):
+            self.enable()
+
+    def enable(self):
+        if not self.enabled:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            event.remove(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.remove(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self.enabled = False
+
+    # --- Flask hooks ---
+    def _before_request(self):
+        if self.enabled and request.endpoint not in self.excluded:
+            g._request_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = g.get('_request_stats')
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown_request(self, error=None):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return
+        endpoint = request.endpoint or '<unmatched>'
+        metrics = self.metrics
+        metrics.request_duration.observe(time.perf_counter() - stats.started, endpoint, request.method, str(stats.status))
+        metrics.request_queries.observe(stats.queries, endpoint)
+        metrics.request_query_time.observe(stats.query_time, endpoint)
+        if stats.queries > self.n_plus_one_threshold:
+            shapes = Counter()
+            for statement, count in stats.statements.items():
+                shapes[statement_shape(statement)] += count
+            shape, repeats = shapes.most_common(1)[0]
+            if repeats > self.n_plus_one_threshold:
+                metrics.n_plus_one.inc(endpoint)
+                logger.warning('Possible N+1 in %s: statement ran %d times: %s', endpoint, repeats, shape[:500])
+
+    # --- SQLAlchemy hooks ---
+    # These run for every statement, so they do as little as possible: the
+    # request's stats ride along on the execution context, and statements
+    # are only normalised into shapes once, at teardown.
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is None or not has_request_context():
+            return
+        stats = g.get('_request_stats')
+        if stats is not None:
+            context._request_stats = stats
+            context._query_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(context, '_request_stats', None)
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - context._query_started
+        stats.queries += 1
+        stats.query_time += elapsed
+        stats.statements[statement] += 1
+        if elapsed > self.slow_query_seconds:
+            endpoint = request.endpoint or '<unmatched>'
+            self.metrics.slow_queries.inc(endpoint)
+            # Statement only; parameters may hold personal data
+            logger.warning('Slow query in %s (%.3fs): %s', endpoint, elapsed, _WHITESPACE.sub(' ', statement)[:1000])
+
+
+def get_instrumentation():
+    return current_app.extensions['instrumentation']
@@ -0,0 +1,214 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import and_, desc, or_
+from sqlalchemy.orm import joinedload
+
+from models import Ticket, TicketResponse
+
+DEFAULT_PAGE_SIZE = 25
+DEFAULT_RESPONSES_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# A page of tickets plus the cursor needed to fetch the next (older) page.
+# next_cursor is None when there is nothing older to show.
+TicketPage = namedtuple('TicketPage', ['items', 'next_cursor', 'has_more'])
+# Same idea for a ticket's responses; items are oldest-first for display.
+ResponsePage = namedtuple('ResponsePage', ['items', 'next_cursor', 'has_more'])
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not produce."""
+
+
+# --- Cursor encoding ---
+# A cursor is the (date_posted, id) of the last ticket on the previous page,
+# packed into an opaque, URL-safe string so clients can't depend on its shape.
+def encode_cursor(date_posted, item_id):
+    raw = f"{date_posted.isoformat()}|{item_id}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        date_part, id_part = raw.split('|', 1)
+        return datetime.fromisoformat(date_part), int(id_part)
+    except (ValueError, UnicodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def page_size(requested=None, setting='TICKETS_PER_PAGE', fallback=DEFAULT_PAGE_SIZE):
+    """Clamp a client-requested page size to something sane."""
+    default = current_app.config.get(setting, fallback)
+    try:
+        size = int(requested) if requested else default
+    except (TypeError, ValueError):
+        size = default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+# --- Dashboard scopes ---
+# Each dashboard only differs in which tickets it may see; ordering, eager
+# loading and pagination are shared in paginate_tickets().
+def user_tickets_query(user):
+    return Ticket.query.filter(Ticket.user_id == user.id)
+
+
+def agent_tickets_query(agent):
+    return Ticket.query.filter((Ticket.agent_id == agent.id) | (Ticket.agent_id == None))
+
+
+def agent_ticket_branches(agent):
+    """
+    agent_tickets_query() as two disjoint queries, the agent's tickets and
+    the unassigned ones. The OR plans as a MULTI-INDEX OR that sorts every
+    match; each branch on its own walks ix_ticket_agent_id_date_posted in
+    order, and paginate_tickets() merges them.
+    """
+    return (Ticket.query.filter(Ticket.agent_id == agent.id), Ticket.query.filter(Ticket.agent_id == None))
+
+
+def all_tickets_query():
+    return Ticket.query
+
+
+def dashboard_query(user):
+    """Pick the ticket scope for whichever dashboard this user lands on."""
+    if user.is_admin:
+        return all_tickets_query()
+    if user.is_agent:
+        return agent_tickets_query(user)
+    return user_tickets_query(user)
+
+
+def dashboard_branches(user):
+    """dashboard_query() for paging: disjoint queries for paginate_tickets() to merge."""
+    if user.is_agent and not user.is_admin:
+        return agent_ticket_branches(user)
+    return (dashboard_query(user),)
+
+
+def keyset_query(query, cursor=None):
+    """
+    Order a ticket query newest first and, given a cursor, restrict it to the
+    rows after that cursor. Split out so query_plans.py can EXPLAIN exactly
+    what the dashboards run.
+    """
+    if cursor:
+        last_posted, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Ticket.date_posted < last_posted,
+            and_(Ticket.date_posted == last_posted, Ticket.id < last_id)
+        ))
+    return query.order_by(desc(Ticket.date_posted), desc(Ticket.id))
+
+
+def paginate_tickets(query, cursor=None, per_page=DEFAULT_PAGE_SIZE, options=None):
+    """
+    Return one page of tickets, newest first, using keyset pagination on
+    (date_posted, id). Author and agent are joined in the same query so the
+    templates don't trigger a lazy load per row; pass `options` to load
+    something else instead. `query` may also be a tuple of disjoint
+    queries (dashboard_branches()); each is paged the same way and the
+    pages merged.
+    """
+    if options is None:
+        options = (joinedload(Ticket.author), joinedload(Ticket.agent))
+    branches = query if isinstance(query, tuple) else (query,)
+
+    # Fetch one extra row so we know whether an older page exists without
+    # running a separate COUNT. The page's rows are the newest per_page + 1
+    # of any branch's, so that many from each is enough to merge.
+    rows = []
+    for branch in branches:
+        rows.extend(keyset_query(branch.options(*options), cursor).limit(per_page + 1).all())
+    if len(branches) > 1:
+        rows.sort(key=lambda ticket: (ticket.date_posted, ticket.id), reverse=True)
+        rows = rows[:per_page + 1]
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    next_cursor = encode_cursor(items[-1].date_posted, items[-1].id) if has_more else None
+    return TicketPage(items=items, next_cursor=next_cursor, has_more=has_more)
+
+
+# --- Delta queries ---
+# Tickets changed since a poller's last sync, oldest change first, paged by
+# (last_updated, id). A ticket that changes again while a client is paging
+# moves behind the cursor and turns up on a later page.
+def changed_since_query(query, since, cursor=None):
+    query = query.filter(Ticket.last_updated >= since)
+    if cursor:
+        last_updated, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Ticket.last_updated > last_updated,
+            and_(Ticket.last_updated == last_updated, Ticket.id > last_id)
+        ))
+    return query.order_by(Ticket.last_updated, Ticket.id)
+
+
+def paginate_changed(query, since, cursor=None, per_page=DEFAULT_PAGE_SIZE, options=()):
+    """One page of the tickets in `query` with last_updated >= since."""
+    rows = changed_since_query(query.options(*options), since, cursor).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    next_cursor = encode_cursor(items[-1].last_updated, items[-1].id) if has_more else None
+    return TicketPage(items=items, next_cursor=next_cursor, has_more=has_more)
+
+
+def visible_responses(ticket, viewer):
+    """A ticket's responses as a query, without internal notes for customers."""
+    query = ticket.responses
+    if not viewer.is_agent and not viewer.is_admin:
+        query = query.filter((TicketResponse.is_internal_note == False) | (TicketResponse.is_internal_note == None))
+    return query
+
+
+def paginate_responses(ticket, viewer, before=None, per_page=DEFAULT_RESPONSES_PAGE_SIZE):
+    """
+    The newest `per_page` visible responses older than the `before` cursor,
+    returned oldest-first. The cursor for the next call points at the oldest
+    response on this page, so "load older" walks back through the thread.
+    """
+    query = visible_responses(ticket, viewer).options(joinedload(TicketResponse.responder))
+    if before:
+        last_posted, last_id = decode_cursor(before)
+        query = query.filter(or_(
+            TicketResponse.date_posted < last_posted,
+            and_(TicketResponse.date_posted == last_posted, TicketResponse.id < last_id)
+        ))
+    rows = query.order_by(desc(TicketResponse.date_posted), desc(TicketResponse.id)).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+    next_cursor = encode_cursor(items[-1].date_posted, items[-1].id) if has_more else None
+    items.reverse()
+    return ResponsePage(items=items, next_cursor=next_cursor, has_more=has_more)
+
+
+def response_to_dict(response):
+    return {
+        'id': response.id,
+        'ticket_id': response.ticket_id,
+        'content': response.content,
+        'author': response.responder.username,
+        'author_is_staff': bool(response.responder.is_agent or response.responder.is_admin),
+        'is_internal_note': bool(response.is_internal_note),
+        'date_posted': response.date_posted.isoformat(),
+    }
+
+
+def ticket_to_dict(ticket):
+    return {
+        'id': ticket.id,
+        'title': ticket.title,
+        'status': ticket.status,
+        'priority': ticket.priority,
+        'category': ticket.category,
+        'date_posted': ticket.date_posted.isoformat(),
+        'last_updated': ticket.last_updated.isoformat(),
+        'author': ticket.author.username,
+        'agent': ticket.agent.username if ticket.agent else None,
+    }
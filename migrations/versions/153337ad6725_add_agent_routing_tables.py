@@ -0,0 +1,56 @@
+"""Add agent_skill and agent_load tables
+
+Revision ID: 153337ad6725
+Revises: 6237d14b7752
+Create Date: 2026-10-18 19:20:43.512904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '153337ad6725'
+down_revision = '6237d14b7752'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('agent_skill',
+    sa.Column('agent_id', sa.Integer(), nullable=False),
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.ForeignKeyConstraint(['agent_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('agent_id', 'category')
+    )
+    op.create_table('agent_load',
+    sa.Column('agent_id', sa.Integer(), nullable=False),
+    sa.Column('open_count', sa.Integer(), nullable=False),
+    sa.Column('weighted_load', sa.Integer(), nullable=False),
+    sa.Column('capacity', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['agent_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('agent_id')
+    )
+    with op.batch_alter_table('agent_load', schema=None) as batch_op:
+        batch_op.create_index('ix_agent_load_weighted_load', ['weighted_load'], unique=False)
+
+    # Seed loads from the tickets already assigned (same result as
+    # `flask routing rebuild`), so the incremental hooks start out right.
+    op.execute(
+        "INSERT INTO agent_load (agent_id, open_count, weighted_load, capacity, version) "
+        "SELECT u.id, COUNT(t.id), "
+        "COALESCE(SUM(CASE t.priority WHEN 'Low' THEN 1 WHEN 'Medium' THEN 2 WHEN 'High' THEN 3 "
+        "WHEN 'Urgent' THEN 5 ELSE 1 END), 0), 20, 0 "
+        "FROM user u LEFT JOIN ticket t ON t.agent_id = u.id AND t.status IN ('Open', 'In Progress') "
+        "WHERE u.is_agent = 1 OR u.is_admin = 1 OR t.id IS NOT NULL "
+        "GROUP BY u.id"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('agent_load', schema=None) as batch_op:
+        batch_op.drop_index('ix_agent_load_weighted_load')
+
+    op.drop_table('agent_load')
+    op.drop_table('agent_skill')
@@ -0,0 +1,47 @@
+"""Add full-text search indexes
+
+Revision ID: 1b8631d9826a
+Revises: 3b07091056a0
+Create Date: 2026-10-18 11:20:48.907215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b8631d9826a'
+down_revision = '3b07091056a0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        op.create_index('ft_ticket_title_description', 'ticket', ['title', 'description'], mysql_prefix='FULLTEXT')
+        op.create_index('ft_ticket_response_content', 'ticket_response', ['content'], mysql_prefix='FULLTEXT')
+    elif bind.dialect.name == 'sqlite':
+        # Same layout as search.SQLiteFTSBackend, filled from existing rows
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS ticket_search USING fts5("
+            "title, body, ticket_id UNINDEXED, response_id UNINDEXED, is_internal UNINDEXED, "
+            "tokenize = 'porter unicode61')"
+        )
+        op.execute(
+            "INSERT INTO ticket_search (title, body, ticket_id, response_id, is_internal) "
+            "SELECT title, description, id, NULL, 0 FROM ticket"
+        )
+        op.execute(
+            "INSERT INTO ticket_search (title, body, ticket_id, response_id, is_internal) "
+            "SELECT '', content, ticket_id, id, COALESCE(is_internal_note, 0) FROM ticket_response"
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        op.drop_index('ft_ticket_response_content', table_name='ticket_response')
+        op.drop_index('ft_ticket_title_description', table_name='ticket')
+    elif bind.dialect.name == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS ticket_search")
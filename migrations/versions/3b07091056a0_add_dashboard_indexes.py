@@ -0,0 +1,50 @@
+"""Add indexes for dashboard query patterns
+
+Revision ID: 3b07091056a0
+Revises: f033791e5ef6
+Create Date: 2026-10-18 10:02:37.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b07091056a0'
+down_revision = 'f033791e5ef6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # user_dashboard: WHERE user_id = ? ORDER BY date_posted DESC
+    op.create_index('ix_ticket_user_id_date_posted', 'ticket', ['user_id', 'date_posted'], unique=False)
+    # agent_dashboard: WHERE agent_id = ? OR agent_id IS NULL ORDER BY date_posted DESC
+    op.create_index('ix_ticket_agent_id_date_posted', 'ticket', ['agent_id', 'date_posted'], unique=False)
+    # filter_by(status=...)
+    op.create_index('ix_ticket_status_date_posted', 'ticket', ['status', 'date_posted'], unique=False)
+    # admin_dashboard: ORDER BY date_posted DESC, id DESC with no filter
+    op.create_index('ix_ticket_date_posted', 'ticket', ['date_posted'], unique=False)
+    # view_ticket: responses for one ticket in date order
+    op.create_index('ix_ticket_response_ticket_id_date_posted', 'ticket_response', ['ticket_id', 'date_posted'], unique=False)
+    # Agent choices: WHERE is_agent OR is_admin (index merge / multi-index OR)
+    op.create_index(op.f('ix_user_is_agent'), 'user', ['is_agent'], unique=False)
+    op.create_index(op.f('ix_user_is_admin'), 'user', ['is_admin'], unique=False)
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'mysql':
+        # InnoDB dropped its implicit foreign key indexes once the composite
+        # indexes above could serve them; put them back before dropping ours.
+        op.create_index('user_id', 'ticket', ['user_id'], unique=False)
+        op.create_index('agent_id', 'ticket', ['agent_id'], unique=False)
+        op.create_index('ticket_id', 'ticket_response', ['ticket_id'], unique=False)
+
+    op.drop_index(op.f('ix_user_is_admin'), table_name='user')
+    op.drop_index(op.f('ix_user_is_agent'), table_name='user')
+    op.drop_index('ix_ticket_response_ticket_id_date_posted', table_name='ticket_response')
+    op.drop_index('ix_ticket_date_posted', table_name='ticket')
+    op.drop_index('ix_ticket_status_date_posted', table_name='ticket')
+    op.drop_index('ix_ticket_agent_id_date_posted', table_name='ticket')
+    op.drop_index('ix_ticket_user_id_date_posted', table_name='ticket')
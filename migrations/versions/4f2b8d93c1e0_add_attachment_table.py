@@ -0,0 +1,47 @@
+"""Add attachment table
+
+Revision ID: 4f2b8d93c1e0
+Revises: 9e4c6a1d2b7f
+Create Date: 2026-10-18 21:10:37.651092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2b8d93c1e0'
+down_revision = '9e4c6a1d2b7f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('attachment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('response_id', sa.Integer(), nullable=True),
+    sa.Column('uploader_id', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('content_type', sa.String(length=100), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['response_id'], ['ticket_response.id'], ),
+    sa.ForeignKeyConstraint(['ticket_id'], ['ticket.id'], ),
+    sa.ForeignKeyConstraint(['uploader_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('attachment', schema=None) as batch_op:
+        batch_op.create_index('ix_attachment_sha256', ['sha256'], unique=False)
+        batch_op.create_index('ix_attachment_ticket_id_created_at', ['ticket_id', 'created_at'], unique=False)
+        batch_op.create_index('ix_attachment_uploader_id', ['uploader_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('attachment', schema=None) as batch_op:
+        batch_op.drop_index('ix_attachment_uploader_id')
+        batch_op.drop_index('ix_attachment_ticket_id_created_at')
+        batch_op.drop_index('ix_attachment_sha256')
+
+    op.drop_table('attachment')
@@ -0,0 +1,43 @@
+"""Add outbox_message table
+
+Revision ID: 6237d14b7752
+Revises: dbf925e7a485
+Create Date: 2026-10-18 14:05:51.730112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6237d14b7752'
+down_revision = 'dbf925e7a485'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outbox_message',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event', sa.String(length=30), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('recipient', sa.String(length=120), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('dedup_key', sa.String(length=200), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('available_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('dedup_key')
+    )
+    op.create_index('ix_outbox_message_status_available_at', 'outbox_message', ['status', 'available_at'], unique=False)
+    op.create_index('ix_outbox_message_ticket_id_recipient', 'outbox_message', ['ticket_id', 'recipient'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_message_ticket_id_recipient', table_name='outbox_message')
+    op.drop_index('ix_outbox_message_status_available_at', table_name='outbox_message')
+    op.drop_table('outbox_message')
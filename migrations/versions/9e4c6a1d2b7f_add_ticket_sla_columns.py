@@ -0,0 +1,33 @@
+"""Add ticket SLA columns
+
+Revision ID: 9e4c6a1d2b7f
+Revises: 153337ad6725
+Create Date: 2026-10-18 20:05:12.184530
+
+Deadlines depend on the SLA_POLICIES setting, so they are not filled in
+here; run `flask sla rebuild` once after upgrading.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4c6a1d2b7f'
+down_revision = '153337ad6725'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('sla_due_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('sla_level', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('ix_ticket_sla_due_at', ['sla_due_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_index('ix_ticket_sla_due_at')
+        batch_op.drop_column('sla_level')
+        batch_op.drop_column('sla_due_at')
@@ -0,0 +1,67 @@
+"""Add ticket event history and report rollup tables
+
+Revision ID: a7c3e5f19b24
+Revises: 4f2b8d93c1e0
+Create Date: 2026-10-18 22:05:12.384417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c3e5f19b24'
+down_revision = '4f2b8d93c1e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ticket_event',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.Column('agent_id', sa.Integer(), nullable=True),
+    sa.Column('old_status', sa.String(length=20), nullable=True),
+    sa.Column('new_status', sa.String(length=20), nullable=True),
+    sa.Column('seconds', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ticket_event', schema=None) as batch_op:
+        batch_op.create_index('ix_ticket_event_created_at', ['created_at'], unique=False)
+        batch_op.create_index('ix_ticket_event_ticket_id_kind', ['ticket_id', 'kind'], unique=False)
+
+    op.create_table('report_rollup',
+    sa.Column('granularity', sa.String(length=5), nullable=False),
+    sa.Column('metric', sa.String(length=30), nullable=False),
+    sa.Column('bucket', sa.DateTime(), nullable=False),
+    sa.Column('dimension', sa.String(length=50), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('p50', sa.Float(), nullable=True),
+    sa.Column('p90', sa.Float(), nullable=True),
+    sa.PrimaryKeyConstraint('granularity', 'metric', 'bucket', 'dimension')
+    )
+    op.create_table('report_watermark',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_event_id', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('first_response_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_column('first_response_at')
+
+    op.drop_table('report_watermark')
+    op.drop_table('report_rollup')
+    with op.batch_alter_table('ticket_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_ticket_event_ticket_id_kind')
+        batch_op.drop_index('ix_ticket_event_created_at')
+
+    op.drop_table('ticket_event')
@@ -0,0 +1,45 @@
+"""Add ticket audit trail and merged_into_id
+
+Revision ID: b9e2f47a1c36
+Revises: c5d81e3a6f02
+Create Date: 2026-10-19 00:52:31.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e2f47a1c36'
+down_revision = 'c5d81e3a6f02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ticket_audit',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('field', sa.String(length=20), nullable=False),
+    sa.Column('old_value', sa.String(length=50), nullable=True),
+    sa.Column('new_value', sa.String(length=50), nullable=True),
+    sa.Column('batch_id', sa.String(length=32), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ticket_audit', schema=None) as batch_op:
+        batch_op.create_index('ix_ticket_audit_ticket_id_created_at', ['ticket_id', 'created_at'], unique=False)
+
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('merged_into_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_column('merged_into_id')
+
+    with op.batch_alter_table('ticket_audit', schema=None) as batch_op:
+        batch_op.drop_index('ix_ticket_audit_ticket_id_created_at')
+
+    op.drop_table('ticket_audit')
@@ -0,0 +1,27 @@
+"""Add ticket last_updated index for API delta queries
+
+Revision ID: c5d81e3a6f02
+Revises: a7c3e5f19b24
+Create Date: 2026-10-18 23:41:08.205716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d81e3a6f02'
+down_revision = 'a7c3e5f19b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # /api/v1/tickets?updated_since=...: WHERE last_updated >= ? ORDER BY last_updated, id
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.create_index('ix_ticket_last_updated', ['last_updated'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_index('ix_ticket_last_updated')
@@ -0,0 +1,45 @@
+"""Add ticket signatures and duplicates for near-duplicate detection
+
+Revision ID: d3f6a81c2b57
+Revises: b9e2f47a1c36
+Create Date: 2026-10-18 19:58:12.417390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f6a81c2b57'
+down_revision = 'b9e2f47a1c36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ticket_signature',
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('bands', sa.LargeBinary(length=40), nullable=False),
+    sa.PrimaryKeyConstraint('ticket_id')
+    )
+    op.create_table('ticket_duplicate',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('duplicate_of_id', sa.Integer(), nullable=False),
+    sa.Column('similarity', sa.Float(), nullable=False),
+    sa.Column('linked', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('ticket_duplicate', schema=None) as batch_op:
+        batch_op.create_index('ix_ticket_duplicate_ticket_id', ['ticket_id'], unique=False)
+        batch_op.create_index('ix_ticket_duplicate_duplicate_of_id', ['duplicate_of_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ticket_duplicate', schema=None) as batch_op:
+        batch_op.drop_index('ix_ticket_duplicate_duplicate_of_id')
+        batch_op.drop_index('ix_ticket_duplicate_ticket_id')
+
+    op.drop_table('ticket_duplicate')
+    op.drop_table('ticket_signature')
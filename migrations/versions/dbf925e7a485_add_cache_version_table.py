@@ -0,0 +1,28 @@
+"""Add cache_version table
+
+Revision ID: dbf925e7a485
+Revises: 1b8631d9826a
+Create Date: 2026-10-18 12:41:15.276044
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dbf925e7a485'
+down_revision = '1b8631d9826a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
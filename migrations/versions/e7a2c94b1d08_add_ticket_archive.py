@@ -0,0 +1,51 @@
+"""Add ticket archive tables
+
+Revision ID: e7a2c94b1d08
+Revises: d3f6a81c2b57
+Create Date: 2026-10-18 20:31:47.902215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a2c94b1d08'
+down_revision = 'd3f6a81c2b57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ticket_archive',
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('agent_id', sa.Integer(), nullable=True),
+    sa.Column('title', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('priority', sa.String(length=20), nullable=False),
+    sa.Column('category', sa.String(length=50), nullable=False),
+    sa.Column('date_posted', sa.DateTime(), nullable=False),
+    sa.Column('last_updated', sa.DateTime(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.Column('payload', sa.LargeBinary(length=16777215), nullable=False),
+    sa.PrimaryKeyConstraint('ticket_id')
+    )
+    op.create_table('archived_attachment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('ticket_id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_attachment', schema=None) as batch_op:
+        batch_op.create_index('ix_archived_attachment_ticket_id', ['ticket_id'], unique=False)
+        batch_op.create_index('ix_archived_attachment_sha256', ['sha256'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('archived_attachment', schema=None) as batch_op:
+        batch_op.drop_index('ix_archived_attachment_sha256')
+        batch_op.drop_index('ix_archived_attachment_ticket_id')
+
+    op.drop_table('archived_attachment')
+    op.drop_table('ticket_archive')
@@ -0,0 +1,29 @@
+"""Add ticket index for the unassigned claim queue
+
+Revision ID: f4b19d6e2a83
+Revises: e7a2c94b1d08
+Create Date: 2026-10-19 09:12:37.418251
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b19d6e2a83'
+down_revision = 'e7a2c94b1d08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # routing.claim_next: WHERE agent_id IS NULL AND status = ? AND priority = ?
+    # ORDER BY date_posted, id LIMIT 1 FOR UPDATE SKIP LOCKED
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.create_index('ix_ticket_agent_id_status_priority_date_posted',
+                              ['agent_id', 'status', 'priority', 'date_posted'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('ticket', schema=None) as batch_op:
+        batch_op.drop_index('ix_ticket_agent_id_status_priority_date_posted')
@@ -1,4 +1,4 @@
-from app import db
+from extensions import db
 from flask_login import UserMixin
 from datetime import datetime # Don't forget this import for default=datetime.utcnow
 
@@ -7,8 +7,8 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(20), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(60), nullable=False)
-    is_agent = db.Column(db.Boolean, default=False) # Based on your routes.py
-    is_admin = db.Column(db.Boolean, default=False) # Based on your routes.py
+    is_agent = db.Column(db.Boolean, default=False, index=True) # Based on your routes.py
+    is_admin = db.Column(db.Boolean, default=False, index=True) # Based on your routes.py
 
     # Relationship for tickets created by this user
     tickets_created = db.relationship(
@@ -38,6 +38,25 @@ class User(db.Model, UserMixin):
         return f"User('{self.username}', '{self.email}')"
 
 class Ticket(db.Model):
+    # Indexes match the dashboard access paths in routes.py/listing.py: each
+    # dashboard filters on one column and pages by (date_posted, id). The
+    # primary key is implicitly the last column of every secondary index.
+    __table_args__ = (
+        db.Index('ix_ticket_user_id_date_posted', 'user_id', 'date_posted'),
+        db.Index('ix_ticket_agent_id_date_posted', 'agent_id', 'date_posted'),
+        # The unassigned queue (routing.claim_next): open tickets by priority, oldest first
+        db.Index('ix_ticket_agent_id_status_priority_date_posted', 'agent_id', 'status', 'priority', 'date_posted'),
+        db.Index('ix_ticket_status_date_posted', 'status', 'date_posted'),
+        db.Index('ix_ticket_date_posted', 'date_posted'),
+        # API delta queries (api.py): tickets changed since a poller's last sync
+        db.Index('ix_ticket_last_updated', 'last_updated'),
+        # The SLA scheduler's queue (sla.py): due tickets are a range scan on
+        # this index; closed tickets have no deadline and are never read.
+        db.Index('ix_ticket_sla_due_at', 'sla_due_at'),
+        # Full-text search (search.py). MySQL only; SQLite uses an FTS5 table.
+        db.Index('ft_ticket_title_description', 'title', 'description', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -46,15 +65,23 @@ class Ticket(db.Model):
     status = db.Column(db.String(20), nullable=False, default='Open') # Found in your routes.py
     category = db.Column(db.String(50), nullable=False, default='General') # Found in your routes.py
     priority = db.Column(db.String(20), nullable=False, default='Low') # Found in your routes.py
+    sla_due_at = db.Column(db.DateTime, nullable=True) # next SLA deadline; NULL once resolved/closed
+    sla_level = db.Column(db.Integer, nullable=False, default=0) # escalations since staff last acted
+    first_response_at = db.Column(db.DateTime, nullable=True) # first public reply by someone other than the author
+    # Set when closed as a duplicate (batch.py); its responses now live on that ticket.
+    # Not a foreign key, like the history tables, so either ticket can be archived alone.
+    merged_into_id = db.Column(db.Integer, nullable=True)
 
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # Foreign key for the ticket creator
     agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True) # Foreign key for the assigned agent
 
     # NEW: Relationship for responses associated with this ticket
+    # lazy='dynamic' makes ticket.responses a query rather than a list, so long
+    # threads are filtered and paged in SQL (see listing.paginate_responses).
     responses = db.relationship(
         'TicketResponse',
         backref='ticket',
-        lazy=True,
+        lazy='dynamic',
         cascade="all, delete-orphan" # Optional: deletes responses if the parent ticket is deleted
     )
 
@@ -62,6 +89,11 @@ class Ticket(db.Model):
         return f"Ticket('{self.title}', '{self.date_posted}')"
 
 class TicketResponse(db.Model):
+    __table_args__ = (
+        db.Index('ix_ticket_response_ticket_id_date_posted', 'ticket_id', 'date_posted'),
+        db.Index('ft_ticket_response_content', 'content', mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     content = db.Column(db.Text, nullable=False)
     date_posted = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -74,4 +106,261 @@ class TicketResponse(db.Model):
     # No need to redefine them here with db.relationship
 
     def __repr__(self):
-        return f"TicketResponse('{self.content[:20]}...', 'Ticket ID: {self.ticket_id}', 'User ID: {self.user_id}')"
\ No newline at end of file
+        return f"TicketResponse('{self.content[:20]}...', 'Ticket ID: {self.ticket_id}', 'User ID: {self.user_id}')"
+
+class TicketStat(db.Model):
+    # Materialized ticket counters for the admin dashboard, one row per
+    # (dimension, value) such as ('status', 'Open') or ('agent', '7').
+    # Kept current by the hooks in stats.py; rebuild with `flask stats rebuild`.
+    __tablename__ = 'ticket_stats'
+    dimension = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"TicketStat('{self.dimension}', '{self.value}', {self.count})"
+
+class CacheVersion(db.Model):
+    # Shared version stamps for in-process caches (see identity_cache.py).
+    # Bumping a row tells every worker to drop what it cached under the old one.
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"CacheVersion('{self.name}', {self.version})"
+
+class OutboxMessage(db.Model):
+    # Transactional outbox for email notifications (notifications.py). Rows are
+    # written in the same commit as the ticket change and sent later by
+    # `flask notify run`. ticket_id is deliberately not a foreign key: queued
+    # mail must not block deleting or archiving a ticket.
+    __tablename__ = 'outbox_message'
+    __table_args__ = (
+        db.Index('ix_outbox_message_status_available_at', 'status', 'available_at'),
+        db.Index('ix_outbox_message_ticket_id_recipient', 'ticket_id', 'recipient'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    event = db.Column(db.String(30), nullable=False)
+    ticket_id = db.Column(db.Integer, nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    payload = db.Column(db.Text, nullable=False) # JSON; everything needed to write the email
+    dedup_key = db.Column(db.String(200), unique=True, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending') # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    available_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+
+    def __repr__(self):
+        return f"OutboxMessage('{self.event}', 'Ticket ID: {self.ticket_id}', '{self.status}')"
+
+class AgentSkill(db.Model):
+    # Ticket categories an agent handles, used by the routing engine
+    # (routing.py). An agent with no rows here is a generalist.
+    __tablename__ = 'agent_skill'
+    agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category = db.Column(db.String(50), primary_key=True)
+
+    def __repr__(self):
+        return f"AgentSkill('Agent ID: {self.agent_id}', '{self.category}')"
+
+class AgentLoad(db.Model):
+    # Per-agent open-ticket counters, maintained incrementally by routing.py
+    # in the same transaction as each assignment or status change, so routing
+    # never has to COUNT tickets. `version` goes up on every change; routing
+    # only takes an agent if the version it read is still current.
+    # Rebuild with `flask routing rebuild`.
+    __tablename__ = 'agent_load'
+    __table_args__ = (
+        db.Index('ix_agent_load_weighted_load', 'weighted_load'),
+    )
+
+    agent_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    open_count = db.Column(db.Integer, nullable=False, default=0) # Open + In Progress tickets
+    weighted_load = db.Column(db.Integer, nullable=False, default=0) # the same, weighted by priority
+    capacity = db.Column(db.Integer, nullable=False, default=20) # open tickets before routing skips them; 0 = paused
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"AgentLoad('Agent ID: {self.agent_id}', {self.open_count}/{self.capacity})"
+
+class Attachment(db.Model):
+    # A file uploaded to a ticket or one of its responses (attachments.py).
+    # The bytes live in the attachment store under their SHA-256, so the same
+    # log uploaded twice is stored once; rows are just references to it.
+    __tablename__ = 'attachment'
+    __table_args__ = (
+        db.Index('ix_attachment_ticket_id_created_at', 'ticket_id', 'created_at'),
+        db.Index('ix_attachment_uploader_id', 'uploader_id'),
+        db.Index('ix_attachment_sha256', 'sha256'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
+    response_id = db.Column(db.Integer, db.ForeignKey('ticket_response.id'), nullable=True) # NULL = on the ticket itself
+    uploader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False) # as uploaded; only used for display and downloads
+    content_type = db.Column(db.String(100), nullable=False, default='application/octet-stream')
+    size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    uploader = db.relationship('User', foreign_keys=[uploader_id])
+    response = db.relationship('TicketResponse', foreign_keys=[response_id])
+
+    def __repr__(self):
+        return f"Attachment('{self.filename}', {self.size} bytes, 'Ticket ID: {self.ticket_id}')"
+
+class TicketEvent(db.Model):
+    # Append-only ticket history for reporting (reports.py): one row per
+    # creation, first response and status change, written by the hooks in
+    # the same transaction as the change. No foreign keys, so history
+    # outlives archived or deleted tickets. `flask reports rollup` folds it
+    # into report_rollup.
+    __tablename__ = 'ticket_event'
+    __table_args__ = (
+        db.Index('ix_ticket_event_ticket_id_kind', 'ticket_id', 'kind'),
+        db.Index('ix_ticket_event_created_at', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True) # also the rollup watermark
+    ticket_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False) # 'created', 'first_response' or 'status'
+    category = db.Column(db.String(50), nullable=False)
+    agent_id = db.Column(db.Integer, nullable=True) # assigned agent at the time (responder for first_response)
+    old_status = db.Column(db.String(20), nullable=True)
+    new_status = db.Column(db.String(20), nullable=True)
+    seconds = db.Column(db.Float, nullable=True) # time to first response, or to resolution
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"TicketEvent('{self.kind}', 'Ticket ID: {self.ticket_id}', '{self.created_at}')"
+
+class ReportRollup(db.Model):
+    # Pre-aggregated history per hour and per day (reports.py), e.g.
+    # ('day', 'tickets_created', 2026-03-01, 'Billing Inquiry'). Report
+    # endpoints only read these; the primary key is their range scan.
+    __tablename__ = 'report_rollup'
+    granularity = db.Column(db.String(5), primary_key=True) # 'hour' or 'day'
+    metric = db.Column(db.String(30), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True) # start of the hour/day, UTC
+    dimension = db.Column(db.String(50), primary_key=True) # category, agent id, or '' for none
+    count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0) # sum of the values (net change for backlog_delta)
+    p50 = db.Column(db.Float, nullable=True)
+    p90 = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return f"ReportRollup('{self.granularity}', '{self.metric}', '{self.bucket}', '{self.dimension}', {self.count})"
+
+class ReportWatermark(db.Model):
+    # How far the rollup job has read ticket_event
+    __tablename__ = 'report_watermark'
+    name = db.Column(db.String(50), primary_key=True)
+    last_event_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"ReportWatermark('{self.name}', {self.last_event_id})"
+
+class TicketAudit(db.Model):
+    # Who changed what on a ticket and when (audit.py): one row per field
+    # changed, by the single-ticket routes, the batch operations (which share
+    # a batch_id per submission) and SLA escalations (actor_id NULL). Values
+    # are stored as text; agent changes hold user ids. No foreign keys, like
+    # ticket_event.
+    __tablename__ = 'ticket_audit'
+    __table_args__ = (
+        db.Index('ix_ticket_audit_ticket_id_created_at', 'ticket_id', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, nullable=False)
+    actor_id = db.Column(db.Integer, nullable=True) # NULL = the system (SLA escalations)
+    field = db.Column(db.String(20), nullable=False) # 'agent', 'status', 'priority', 'merged_into' or 'merged'
+    old_value = db.Column(db.String(50), nullable=True)
+    new_value = db.Column(db.String(50), nullable=True)
+    batch_id = db.Column(db.String(32), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"TicketAudit('{self.field}', 'Ticket ID: {self.ticket_id}', '{self.old_value}' -> '{self.new_value}')"
+
+class TicketSignature(db.Model):
+    # A ticket's MinHash band keys for near-duplicate detection
+    # (duplicates.py): BANDS little-endian uint32s, computed once on submit
+    # so a worker rebuilds its in-memory index by reading these instead of
+    # re-shingling every ticket. No foreign key, like ticket_event.
+    __tablename__ = 'ticket_signature'
+    ticket_id = db.Column(db.Integer, primary_key=True) # also the catch-up watermark
+    bands = db.Column(db.LargeBinary(40), nullable=False)
+
+    def __repr__(self):
+        return f"TicketSignature('Ticket ID: {self.ticket_id}')"
+
+class TicketDuplicate(db.Model):
+    # A likely duplicate found on submit (duplicates.py): ticket_id was
+    # filed after duplicate_of_id, which was open at the time, and their
+    # titles + descriptions overlap by `similarity` (Jaccard over word
+    # pairs). `linked` is set automatically above
+    # DUPLICATES_AUTO_LINK_SIMILARITY. No foreign keys, so either ticket can
+    # be archived alone.
+    __tablename__ = 'ticket_duplicate'
+    __table_args__ = (
+        db.Index('ix_ticket_duplicate_ticket_id', 'ticket_id'),
+        db.Index('ix_ticket_duplicate_duplicate_of_id', 'duplicate_of_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, nullable=False)
+    duplicate_of_id = db.Column(db.Integer, nullable=False)
+    similarity = db.Column(db.Float, nullable=False)
+    linked = db.Column(db.Boolean, nullable=False, default=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"TicketDuplicate('Ticket ID: {self.ticket_id}', 'Duplicate of: {self.duplicate_of_id}', {self.similarity:.2f})"
+
+class TicketArchive(db.Model):
+    # A Closed ticket moved out of the hot tables by `flask tickets archive`
+    # (archive.py). The columns are what permission checks and the ticket
+    # counters need; the ticket row itself, its responses, attachment rows
+    # and audit trail are one zlib-compressed JSON document in `payload`,
+    # only read when someone opens or restores the ticket. ticket_id is the
+    # ticket's original id and, like the history tables, not a foreign key.
+    __tablename__ = 'ticket_archive'
+
+    ticket_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    agent_id = db.Column(db.Integer, nullable=True)
+    title = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    priority = db.Column(db.String(20), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    date_posted = db.Column(db.DateTime, nullable=False)
+    last_updated = db.Column(db.DateTime, nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    payload = db.Column(db.LargeBinary(16777215), nullable=False) # MEDIUMBLOB on MySQL
+
+    def __repr__(self):
+        return f"TicketArchive('{self.title}', 'Ticket ID: {self.ticket_id}')"
+
+class ArchivedAttachment(db.Model):
+    # Attachments of archived tickets, by their original id: downloads of
+    # old links find their ticket here, and `flask attachments gc` keeps the
+    # files they refer to. The rest of the row is in the ticket's payload.
+    __tablename__ = 'archived_attachment'
+    __table_args__ = (
+        db.Index('ix_archived_attachment_ticket_id', 'ticket_id'),
+        db.Index('ix_archived_attachment_sha256', 'sha256'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    ticket_id = db.Column(db.Integer, nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+
+    def __repr__(self):
+        return f"ArchivedAttachment('{self.sha256}', 'Ticket ID: {self.ticket_id}')"
@@ -0,0 +1,312 @@
+import json
+import random
+import smtplib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, insert, or_, select, update
+
+from extensions import db
+from models import OutboxMessage
+
+STATUS_CHANGED = 'status_changed'
+NEW_RESPONSE = 'new_response'
+SLA_BREACHED = 'sla_breached'
+
+notify_cli = AppGroup('notify', help='Send queued email notifications.')
+
+
+# --- Enqueueing (request side) ---
+# These only add an OutboxMessage to the session; the caller's commit makes
+# the notification durable together with the ticket change. Nothing here
+# talks to SMTP, so request latency doesn't depend on the mail server.
+def _message_values(event, ticket, recipient, dedup_key, **details):
+    now = datetime.utcnow()
+    return dict(
+        event=event,
+        ticket_id=ticket.id,
+        recipient=recipient,
+        payload=json.dumps({'ticket_id': ticket.id, 'title': ticket.title, 'status': ticket.status, **details}),
+        dedup_key=dedup_key[:200],
+        created_at=now,
+        # Hold messages briefly so a burst of updates becomes one email
+        available_at=now + timedelta(seconds=current_app.config.get('NOTIFY_COALESCE_SECONDS', 30)),
+    )
+
+
+def _enqueue(event, ticket, recipient, dedup_key, **details):
+    if not current_app.config.get('NOTIFICATIONS_ENABLED', True) or not recipient:
+        return None
+    message = OutboxMessage(**_message_values(event, ticket, recipient, dedup_key, **details))
+    db.session.add(message)
+    return message
+
+
+def _status_change_key(ticket):
+    return f"{STATUS_CHANGED}:{ticket.id}:{ticket.status}:{ticket.last_updated.isoformat()}"
+
+
+def enqueue_status_change(ticket, old_status, actor):
+    if old_status == ticket.status or ticket.user_id == actor.id:
+        return None
+    return _enqueue(STATUS_CHANGED, ticket, ticket.author.email, _status_change_key(ticket),
+                    old_status=old_status, new_status=ticket.status, actor=actor.username)
+
+
+def enqueue_status_changes(changes, actor):
+    """
+    enqueue_status_change for many tickets in one INSERT (batch.py).
+    `changes` are (ticket, old_status, author email) triples; a ticket is
+    anything with id, user_id, title, status and last_updated.
+    """
+    if not current_app.config.get('NOTIFICATIONS_ENABLED', True):
+        return 0
+    rows = [_message_values(STATUS_CHANGED, ticket, email, _status_change_key(ticket),
+                            old_status=old_status, new_status=ticket.status, actor=actor.username)
+            for ticket, old_status, email in changes
+            if old_status != ticket.status and ticket.user_id != actor.id and email]
+    if rows:
+        db.session.execute(insert(OutboxMessage), rows)
+    return len(rows)
+
+
+def enqueue_response(response):
+    """Tell the other side of the conversation about a new public response."""
+    if response.is_internal_note:
+        return None
+    ticket = response.ticket
+    if response.user_id == ticket.user_id:
+        recipient = ticket.agent.email if ticket.agent else None
+    else:
+        recipient = ticket.author.email
+    return _enqueue(NEW_RESPONSE, ticket, recipient, f"{NEW_RESPONSE}:{response.id}:{recipient}",
+                    response_id=response.id, author=response.responder.username,
+                    content=response.content[:1000])
+
+
+def enqueue_sla_breach(ticket, recipients, level, action, missed):
+    """
+    Tell the assigned agent and the escalation contacts a deadline passed.
+    The key includes the `missed` deadline: staff activity resets the level,
+    and the next breach at the same level is a new one.
+    """
+    return [_enqueue(SLA_BREACHED, ticket, recipient,
+                     f"{SLA_BREACHED}:{ticket.id}:{level}:{missed.isoformat()}:{recipient}",
+                     level=level, action=action, priority=ticket.priority)
+            for recipient in dict.fromkeys(recipients) if recipient]
+
+
+# --- Delivery (worker side) ---
+class SMTPMailer:
+    """Sends EmailMessages over one SMTP connection per batch."""
+
+    def __init__(self, host, port, username=None, password=None, use_tls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self._connection = None
+
+    def __enter__(self):
+        self._connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            self._connection.starttls()
+        if self.username:
+            self._connection.login(self.username, self.password)
+        return self
+
+    def __exit__(self, *exc_info):
+        try:
+            self._connection.quit()
+        except smtplib.SMTPException:
+            pass
+        self._connection = None
+
+    def send(self, message):
+        self._connection.send_message(message)
+
+
+SLA_ACTIONS = {
+    'notify': 'no staff action within the deadline.',
+    'bump_priority': 'priority raised.',
+    'reassign': 'ticket reassigned.',
+}
+
+
+def compose(messages, sender, base_url):
+    """
+    Build one email from every queued event for the same ticket and
+    recipient, oldest first. Repeated status changes collapse into the
+    latest one.
+    """
+    payloads = [json.loads(message.payload) for message in messages]
+    latest = payloads[-1]
+    lines = []
+    status_line = None
+    for payload, message in zip(payloads, messages):
+        if message.event == STATUS_CHANGED:
+            status_line = f"Status changed to {payload['new_status']} by {payload['actor']}."
+        elif message.event == NEW_RESPONSE:
+            lines.append(f"{payload['author']} wrote:\n\n{payload['content']}\n")
+        elif message.event == SLA_BREACHED:
+            lines.append(f"SLA breached (escalation {payload['level']}, {payload['priority']}): "
+                         f"{SLA_ACTIONS.get(payload['action'], payload['action'])}\n")
+    if status_line:
+        lines.insert(0, status_line + '\n')
+    lines.append(f"View the ticket: {base_url.rstrip('/')}/ticket/{latest['ticket_id']}")
+
+    email = EmailMessage()
+    email['Subject'] = f"[Ticket #{latest['ticket_id']}] {latest['title']} ({latest['status']})"
+    email['From'] = sender
+    email['To'] = messages[0].recipient
+    email.set_content('\n'.join(lines))
+    return email
+
+
+class NotificationWorker:
+    """
+    Drains the outbox in batches. Claiming marks rows 'sending' with a lease
+    (available_at in the future), so two workers never send the same row and
+    a crashed worker's rows become claimable again when the lease runs out.
+    `clock` is injectable for tests.
+    """
+
+    def __init__(self, mailer, sender, base_url, batch_size=100, max_attempts=8,
+                 backoff_base=30, backoff_max=3600, lease_seconds=300, clock=datetime.utcnow):
+        self.mailer = mailer
+        self.sender = sender
+        self.base_url = base_url
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.clock = clock
+
+    def backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def claim(self):
+        now = self.clock()
+        claimable = or_(
+            and_(OutboxMessage.status == 'pending', OutboxMessage.available_at <= now),
+            and_(OutboxMessage.status == 'sending', OutboxMessage.available_at <= now), # expired lease
+        )
+        ids = db.session.execute(
+            select(OutboxMessage.id).where(claimable).order_by(OutboxMessage.available_at)
+            .limit(self.batch_size).with_for_update(skip_locked=True)
+        ).scalars().all()
+        if not ids:
+            db.session.commit()
+            return []
+        due = db.session.execute(
+            select(OutboxMessage.ticket_id, OutboxMessage.recipient).where(OutboxMessage.id.in_(ids))
+        ).all()
+        # Coalesce: also take anything newer that is still waiting for the
+        # same ticket and recipient, even if it isn't due yet.
+        pairs = set(due)
+        followers = db.session.execute(
+            select(OutboxMessage.id, OutboxMessage.ticket_id, OutboxMessage.recipient)
+            .where(OutboxMessage.status == 'pending',
+                   OutboxMessage.ticket_id.in_({ticket_id for ticket_id, _ in pairs}))
+            .with_for_update(skip_locked=True)
+        ).all()
+        ids = set(ids) | {row.id for row in followers if (row.ticket_id, row.recipient) in pairs}
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        db.session.execute(
+            update(OutboxMessage).where(OutboxMessage.id.in_(ids))
+            .values(status='sending', available_at=lease_until)
+        )
+        db.session.commit()
+        return OutboxMessage.query.filter(OutboxMessage.id.in_(ids)).order_by(OutboxMessage.id).all()
+
+    def run_once(self):
+        """Send one batch. Returns (emails sent, messages retried or failed)."""
+        messages = self.claim()
+        if not messages:
+            return 0, 0
+        groups = OrderedDict()
+        for message in messages:
+            groups.setdefault((message.ticket_id, message.recipient), []).append(message)
+
+        sent = failed = 0
+        try:
+            with self.mailer:
+                for group in groups.values():
+                    try:
+                        self.mailer.send(compose(group, self.sender, self.base_url))
+                    except (smtplib.SMTPException, OSError) as error:
+                        self._retry(group, error)
+                        failed += len(group)
+                    else:
+                        self._sent(group)
+                        sent += 1
+                    db.session.commit()
+        except (smtplib.SMTPException, OSError) as error:
+            # Couldn't even connect: everything still 'sending' goes back
+            for group in groups.values():
+                if group[0].status == 'sending':
+                    self._retry(group, error)
+                    failed += len(group)
+            db.session.commit()
+        return sent, failed
+
+    def _sent(self, group):
+        now = self.clock()
+        for message in group:
+            message.status = 'sent'
+            message.sent_at = now
+
+    def _retry(self, group, error):
+        now = self.clock()
+        for message in group:
+            message.attempts += 1
+            message.last_error = str(error)[:1000]
+            if message.attempts >= self.max_attempts:
+                message.status = 'failed'
+            else:
+                message.status = 'pending'
+                message.available_at = now + self.backoff(message.attempts)
+
+
+def worker_from_config(config, **overrides):
+    mailer = SMTPMailer(
+        config.get('MAIL_SERVER', 'localhost'), config.get('MAIL_PORT', 25),
+        username=config.get('MAIL_USERNAME'), password=config.get('MAIL_PASSWORD'),
+        use_tls=config.get('MAIL_USE_TLS', False),
+    )
+    options = dict(
+        sender=config.get('MAIL_DEFAULT_SENDER', 'support@localhost'),
+        base_url=config.get('NOTIFY_BASE_URL', 'http://localhost:5000'),
+        batch_size=config.get('NOTIFY_BATCH_SIZE', 100),
+        max_attempts=config.get('NOTIFY_MAX_ATTEMPTS', 8),
+    )
+    options.update(overrides)
+    return NotificationWorker(mailer, **options)
+
+
+@notify_cli.command('run')
+@click.option('--once', is_flag=True, help='Send one batch and exit.')
+@click.option('--batch-size', type=int, help='Messages claimed per batch.')
+@click.option('--poll-interval', type=float, default=2.0, show_default=True,
+              help='Seconds to sleep when the outbox is empty.')
+def run_command(once, batch_size, poll_interval):
+    """Drain the notification outbox."""
+    overrides = {'batch_size': batch_size} if batch_size else {}
+    worker = worker_from_config(current_app.config, **overrides)
+    while True:
+        sent, failed = worker.run_once()
+        if sent or failed:
+            click.echo(f"sent {sent} emails, {failed} messages deferred")
+        if once:
+            break
+        if not sent and not failed:
+            time.sleep(poll_interval)
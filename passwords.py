@@ -0,0 +1,133 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+import bcrypt
+from flask import current_app
+
+# bcrypt only looks at the first 72 bytes; older bcrypt releases (and so
+# every hash Flask-Bcrypt produced for us) truncated silently, newer ones
+# raise instead. Truncate ourselves so both keep verifying.
+BCRYPT_MAX_BYTES = 72
+
+
+class HashingBusy(Exception):
+    """Too many password hashes already queued, or one timed out; the caller should answer 503."""
+
+
+# --- Work done in the pool processes ---
+# Module-level functions so ProcessPoolExecutor can pickle them.
+def _hash_password(password, rounds, prefix):
+    salt = bcrypt.gensalt(rounds=rounds, prefix=prefix)
+    return bcrypt.hashpw(password[:BCRYPT_MAX_BYTES], salt).decode('utf-8')
+
+
+def _check_password(password, hashed):
+    try:
+        return bcrypt.checkpw(password[:BCRYPT_MAX_BYTES], hashed)
+    except ValueError: # Not a bcrypt hash at all
+        return False
+
+
+def hash_rounds(hashed):
+    """Cost factor a stored hash was made with, e.g. 12 for '$2b$12$...'."""
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a small process pool so hashing can't hold the GIL (or a
+    request thread's CPU) for the rest of the worker. At most `max_pending`
+    hashes may be queued or running per worker; beyond that we raise
+    HashingBusy straight away instead of letting a login storm pile up
+    behind the pool and starve every other request.
+
+    With pool_size=0 hashing runs inline on the request thread, still
+    subject to the same max_pending limit.
+    """
+
+    def __init__(self, rounds=12, pool_size=2, max_pending=16, timeout=10.0, prefix=b'2b'):
+        self.rounds = rounds
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.prefix = prefix
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+
+    def _executor(self):
+        # Pools don't survive fork(): build one per worker process, lazily.
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(max_workers=self.pool_size)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy()
+        if not self.pool_size:
+            try:
+                return fn(*args)
+            finally:
+                self._slots.release()
+        try:
+            future = self._executor().submit(fn, *args)
+            result = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # The pool is backed up: answer 503 rather than hold the request.
+            # A hash that has already started can't be cancelled; it keeps
+            # its slot until it finishes, so max_pending still bounds the pool.
+            if future.cancel():
+                self._slots.release()
+            else:
+                future.add_done_callback(lambda _: self._slots.release())
+            raise HashingBusy() from None
+        except BaseException:
+            self._slots.release()
+            raise
+        self._slots.release()
+        return result
+
+    def hash(self, password):
+        return self._run(_hash_password, password.encode('utf-8'), self.rounds, self.prefix)
+
+    def check(self, hashed, password):
+        if not hashed:
+            return False
+        return self._run(_check_password, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def warm(self):
+        """Start the pool's processes now instead of on the first login (app.prewarm)."""
+        if self.pool_size:
+            executor = self._executor()
+            for future in [executor.submit(hash_rounds, '') for _ in range(self.pool_size)]:
+                future.result(timeout=self.timeout)
+
+    def needs_rehash(self, hashed):
+        """True if the hash was made with a different cost than configured."""
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def get_password_hasher():
+    hasher = current_app.extensions.get('password_hasher')
+    if hasher is None:
+        config = current_app.config
+        hasher = PasswordHasher(
+            rounds=config.get('BCRYPT_LOG_ROUNDS', 12),
+            pool_size=config.get('PASSWORD_HASH_POOL_SIZE', 2),
+            max_pending=config.get('PASSWORD_HASH_MAX_PENDING', 16),
+            timeout=config.get('PASSWORD_HASH_TIMEOUT', 10.0),
+        )
+        current_app.extensions['password_hasher'] = hasher
+    return hasher
@@ -0,0 +1,119 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import click
+from sqlalchemy import desc
+
+import routing
+import sla
+from extensions import db
+from listing import (agent_ticket_branches, all_tickets_query, changed_since_query, encode_cursor, keyset_query,
+                     user_tickets_query)
+from models import Ticket, TicketResponse, User
+
+# Tables whose full scans we care about. Scanning a handful of lookup rows is
+# fine; scanning these at 200k+ rows is what made the dashboards slow.
+WATCHED_TABLES = ('ticket', 'ticket_response', 'user')
+
+
+def dashboard_queries():
+    """
+    The hot queries from routes.py, routing.py and sla.py, built the same
+    way they build them so a change there shows up here. Returns (name,
+    select statement) pairs.
+    """
+    me = SimpleNamespace(id=1)
+    cursor = encode_cursor(datetime(2024, 1, 1), 1000)
+
+    def page(query, with_cursor=False):
+        return keyset_query(query, cursor if with_cursor else None).limit(26).statement
+
+    return [
+        ('user_dashboard', page(user_tickets_query(me))),
+        ('user_dashboard (older page)', page(user_tickets_query(me), with_cursor=True)),
+        ('agent_dashboard (assigned)', page(agent_ticket_branches(me)[0])),
+        ('agent_dashboard (unassigned)', page(agent_ticket_branches(me)[1])),
+        ('agent_dashboard (unassigned, older page)', page(agent_ticket_branches(me)[1], with_cursor=True)),
+        ('admin_dashboard', page(all_tickets_query())),
+        ('admin_dashboard (older page)', page(all_tickets_query(), with_cursor=True)),
+        ('api delta sync', changed_since_query(all_tickets_query(), datetime(2024, 1, 1)).limit(26).statement),
+        ('api delta sync (next page)', changed_since_query(all_tickets_query(), datetime(2024, 1, 1), cursor)
+         .limit(26).statement),
+        ('claim next', routing.queue_query('Open', 'Urgent')),
+        ('claim next (skilled agent)', routing.queue_query('Open', 'Urgent', ['Technical Issue', 'Billing'])),
+        ('unassigned count', routing.queue_size_query()),
+        ('sla due tickets', sla.due_query(datetime(2024, 1, 1), 500)),
+        ('tickets by status', Ticket.query.filter_by(status='Open').order_by(desc(Ticket.date_posted)).statement),
+        ('ticket responses', TicketResponse.query.filter_by(ticket_id=1).order_by(TicketResponse.date_posted).statement),
+        ('agent choices', User.query.filter((User.is_agent == True) | (User.is_admin == True)).statement),
+    ]
+
+
+def _explain(connection, statement):
+    dialect = connection.dialect
+    compiled = statement.compile(dialect=dialect, compile_kwargs={'render_postcompile': True}) # expand IN lists
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    if dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), params).mappings().fetchall()
+    return [dict(row) for row in rows]
+
+
+def _sorts(dialect_name, plan):
+    """Return the plan steps that sort rows instead of reading them in index order."""
+    if dialect_name == 'sqlite':
+        # "USE TEMP B-TREE FOR ORDER BY" (also "... FOR LAST TERM OF ORDER BY")
+        return [step for step in plan if step.startswith('USE TEMP B-TREE') and 'ORDER BY' in step]
+    return [f"{step.get('table')}: Using filesort" for step in plan if 'Using filesort' in (step.get('Extra') or '')]
+
+
+def _full_scans(dialect_name, plan):
+    """Return the watched tables the plan reads without an index."""
+    scans = []
+    for step in plan:
+        if dialect_name == 'sqlite':
+            # e.g. "SCAN ticket" (bad) vs "SCAN ticket USING INDEX ix_..." (ok)
+            words = step.split()
+            if len(words) >= 2 and words[0] == 'SCAN' and 'INDEX' not in words:
+                table = words[1]
+                if table in WATCHED_TABLES:
+                    scans.append(table)
+        else:
+            # MySQL: type=ALL with no chosen key is a table scan
+            if step.get('type') == 'ALL' and not step.get('key') and step.get('table') in WATCHED_TABLES:
+                scans.append(step['table'])
+    return scans
+
+
+def check_query_plans():
+    """EXPLAIN every dashboard query; return [(name, plan, full_scans, sorts)]."""
+    results = []
+    with db.engine.connect() as connection:
+        dialect_name = connection.dialect.name
+        for name, statement in dashboard_queries():
+            plan = _explain(connection, statement)
+            results.append((name, plan, _full_scans(dialect_name, plan), _sorts(dialect_name, plan)))
+    return results
+
+
+@click.command('check-indexes')
+@click.option('--verbose', '-v', is_flag=True, help='Print the full plan for every query.')
+def check_indexes_command(verbose):
+    """Fail if any dashboard query falls back to a full table scan or a sort."""
+    failures = 0
+    for name, plan, scans, sorts in check_query_plans():
+        problems = ([f"full scan of {', '.join(scans)}"] if scans else []) + sorts
+        if problems:
+            failures += 1
+            click.echo(f"FAIL  {name}: {'; '.join(problems)}")
+        else:
+            click.echo(f"ok    {name}")
+        if verbose or problems:
+            for step in plan:
+                click.echo(f"        {step}")
+    if failures:
+        raise SystemExit(1)
@@ -0,0 +1,219 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask import current_app, request, session
+
+from instrumentation import get_instrumentation
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('ip', 'account', 'user')
+
+# `limit` requests per `period` seconds, with bursts of up to `limit`
+Rule = namedtuple('Rule', 'scope limit period')
+
+
+# --- Backends ---
+# acquire() takes [(key, capacity, refill per second), ...] and either takes
+# one token from every bucket or, if any of them is empty, none at all and
+# returns the seconds until all of them have one again (0 means allowed).
+class MemoryRateLimitBackend:
+    """
+    Buckets in this process only: with several workers each one enforces
+    the limits on its own share of the traffic. At most `maxsize` buckets
+    are kept; the least recently used are dropped first, and a dropped
+    bucket comes back full.
+    """
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._buckets = OrderedDict() # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def acquire(self, buckets):
+        now = self.clock()
+        with self._lock:
+            levels, wait = [], 0.0
+            for key, capacity, rate in buckets:
+                entry = self._buckets.get(key)
+                tokens = capacity if entry is None else min(capacity, entry[0] + (now - entry[1]) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels.append(tokens)
+            if wait:
+                return wait
+            for (key, capacity, rate), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return 0.0
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+# Same algorithm as MemoryRateLimitBackend, run atomically inside Redis with
+# the server's clock, so every worker shares the buckets. Each bucket is a
+# hash that expires once it would have refilled anyway. The wait goes back
+# as a string: Lua numbers are truncated to integers on the way out.
+ACQUIRE_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local levels, wait = {}, 0
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+    local tokens = tonumber(bucket[1])
+    if tokens then
+        tokens = math.min(capacity, tokens + math.max(0, now - tonumber(bucket[2])) * rate)
+    else
+        tokens = capacity
+    end
+    if tokens < 1 then
+        wait = math.max(wait, (1 - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity, rate = tonumber(ARGV[2 * i - 1]), tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'updated', tostring(now))
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+end
+return '0'
+"""
+
+
+class RedisRateLimitBackend:
+    """
+    Buckets shared by every worker through Redis, one script call per
+    request. If Redis is unreachable requests are let through (and logged):
+    losing the limiter should not take logins down with it.
+    """
+
+    def __init__(self, url, prefix='ticketing:ratelimit'):
+        # Imported here, like the other Redis backends: it costs ~70 ms at start-up
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND = 'redis' requires the redis package") from None
+        self.errors = redis.RedisError
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(ACQUIRE_SCRIPT)
+        self.prefix = prefix
+
+    def acquire(self, buckets):
+        keys, args = [], []
+        for key, capacity, rate in buckets:
+            keys.append(key)
+            args.extend((capacity, rate))
+        try:
+            return float(self.script(keys=keys, args=args))
+        except self.errors as error:
+            logger.warning('Rate limiter unavailable, allowing request: %s', error)
+            return 0.0
+
+    def clear(self):
+        for key in self.client.scan_iter(match=f'{self.prefix}:*'):
+            self.client.delete(key)
+
+
+# --- Flask integration ---
+class RateLimiter:
+    """
+    Token-bucket limits on the endpoints in RATE_LIMITS, checked in
+    before_request: a rejected request is answered with 429 before the view
+    runs, so it costs one bucket lookup and no form validation, SQL or
+    password hashing. Only RATE_LIMIT_METHODS are counted (by default the
+    POSTs and PUTs that do the work), never the GET that renders a form.
+
+    Each rule keys its bucket by one scope:
+      'ip'       the client address (request.remote_addr; behind a proxy,
+                 wrap the app in werkzeug's ProxyFix so this is the client)
+      'account'  the email address being logged in or registered, so
+                 credential stuffing spread over many addresses still hits
+                 one bucket per targeted account
+      'user'     the logged-in user, read from the session cookie without
+                 loading the user
+    A request is allowed only if every applicable bucket has a token.
+    """
+
+    prefix = 'ticketing:ratelimit'
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.enabled = config.get('RATE_LIMIT_ENABLED', True)
+        self.methods = frozenset(config.get('RATE_LIMIT_METHODS', ('POST', 'PUT')))
+        self.rules = {}
+        for endpoint, rules in config.get('RATE_LIMITS', {}).items():
+            self.rules[endpoint] = tuple(Rule(*rule) for rule in rules)
+            for rule in self.rules[endpoint]:
+                if rule.scope not in SCOPES:
+                    raise ValueError(f"RATE_LIMITS[{endpoint!r}]: unknown scope {rule.scope!r}")
+        self.backend_name = config.get('RATE_LIMIT_BACKEND', 'memory')
+        self.redis_url = config.get('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+        self.backend = None
+        self._backend_lock = threading.Lock()
+        app.extensions['rate_limiter'] = self
+        app.before_request(self._before_request)
+
+    def get_backend(self):
+        # Built on first use, i.e. in the worker after gunicorn has forked
+        with self._backend_lock:
+            if self.backend is None:
+                if self.backend_name == 'redis':
+                    self.backend = RedisRateLimitBackend(self.redis_url, self.prefix)
+                else:
+                    self.backend = MemoryRateLimitBackend()
+            return self.backend
+
+    def identity(self, scope):
+        """Who a request counts against for this scope, or None if the rule doesn't apply."""
+        if scope == 'ip':
+            return request.remote_addr or 'unknown'
+        if scope == 'account':
+            email = request.form.get('email', '').strip().lower()
+            # Hashed: addresses shouldn't sit in Redis in the clear
+            return hashlib.sha256(email.encode('utf-8')).hexdigest()[:32] if email else None
+        return session.get('_user_id') # 'user': Flask-Login's id for the session
+
+    def buckets(self, endpoint):
+        buckets = []
+        for rule in self.rules.get(endpoint, ()):
+            identity = self.identity(rule.scope)
+            if identity is not None:
+                buckets.append((f'{self.prefix}:{endpoint}:{rule.scope}:{identity}', rule.limit, rule.limit / rule.period))
+        return buckets
+
+    def _before_request(self):
+        if not self.enabled or request.method not in self.methods or request.endpoint not in self.rules:
+            return None
+        buckets = self.buckets(request.endpoint)
+        if not buckets:
+            return None
+        wait = self.get_backend().acquire(buckets)
+        if not wait:
+            return None
+        get_instrumentation().metrics.rate_limited.inc(request.endpoint)
+        retry_after = max(1, math.ceil(wait))
+        return (f'Too many requests. Please try again in {retry_after} seconds.', 429,
+                {'Retry-After': str(retry_after)})
+
+
+def get_rate_limiter():
+    return current_app.extensions['rate_limiter']
@@ -0,0 +1,193 @@
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import current_app, request, session as flask_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+
+from instrumentation import get_instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Flask session key: until this time.time() the user's reads stay on the primary
+READ_PRIMARY_UNTIL = '_read_primary_until'
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS names for DATABASE_REPLICA_URLS: replica_0, replica_1, ..."""
+    return {f'replica_{index}': url for index, url in enumerate(urls)}
+
+
+def _is_write(clause):
+    # INSERT/UPDATE/DELETE, and SELECT ... FOR UPDATE (claims, SLA batches)
+    return clause is not None and (getattr(clause, 'is_dml', False)
+                                   or getattr(clause, '_for_update_arg', None) is not None)
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to the replica engine in session.info['replica'] (set per
+    request by ReplicaRouter, or by replica_reads()); everything else goes
+    to the primary as before. The first write (a flush or DML statement)
+    pins the rest of the session to the primary, so a request always reads
+    what it has just written.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or _is_write(clause):
+                self.info['wrote'] = True
+            elif not self.info.get('wrote') and self.info.get('replica') is not None:
+                return self.info['replica']
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replication_lag(connection):
+    """
+    Seconds a MySQL replica is behind its source; None if replication is
+    broken or we may not ask (needs REPLICATION CLIENT). A server that isn't
+    replicating at all, or another database (a SQLite copy standing in
+    locally), counts as current.
+    """
+    if connection.dialect.name != 'mysql':
+        return 0.0
+    for statement, column in (('SHOW REPLICA STATUS', 'Seconds_Behind_Source'),
+                              ('SHOW SLAVE STATUS', 'Seconds_Behind_Master')): # before 8.0.22
+        try:
+            row = connection.exec_driver_sql(statement).mappings().first()
+        except DBAPIError:
+            continue
+        if row is None:
+            return 0.0
+        return float(row[column]) if row.get(column) is not None else None
+    return None
+
+
+class ReplicaRouter:
+    """
+    Picks a read replica for GET requests to REPLICA_ENDPOINTS (the
+    dashboards and other read-only scans), so they stop competing with
+    ticket writes on the primary.
+
+    - A request that writes leaves a READ_PRIMARY_UNTIL stamp in the user's
+      session, and their reads stay on the primary for
+      REPLICA_READ_YOUR_WRITES seconds: the page they are redirected to
+      shows their change even if the replicas haven't applied it yet.
+    - Each worker checks every replica's lag at most once per
+      REPLICA_LAG_CHECK_INTERVAL; replicas further behind than
+      REPLICA_MAX_LAG, or that can't be checked, are skipped, and with none
+      left the request reads from the primary.
+
+    Without DATABASE_REPLICA_URLS this does nothing.
+    """
+
+    def __init__(self, app=None):
+        self.names = ()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.names = tuple(replica_binds(config.get('DATABASE_REPLICA_URLS', ())))
+        self.endpoints = frozenset(config.get('REPLICA_ENDPOINTS', ()))
+        self.max_lag = config.get('REPLICA_MAX_LAG', 5.0)
+        self.check_interval = config.get('REPLICA_LAG_CHECK_INTERVAL', 1.0)
+        self.read_your_writes = config.get('REPLICA_READ_YOUR_WRITES', 10)
+        self.probe = config.get('REPLICA_LAG_PROBE') or replication_lag
+        self.clock = time.monotonic
+        self._lags = {} # replica name -> (checked at, lag in seconds or None)
+        self._lock = threading.Lock()
+        app.extensions['replica_router'] = self
+        if self.names:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+
+    # --- Replica health ---
+    def lag(self, name):
+        """The replica's lag as of the last check, re-checking when that is too old."""
+        now = self.clock()
+        with self._lock:
+            checked = self._lags.get(name)
+        if checked is not None and now - checked[0] < self.check_interval:
+            return checked[1]
+        engine = current_app.extensions['sqlalchemy'].engines[name]
+        try:
+            with engine.connect() as connection:
+                lag = self.probe(connection)
+        except SQLAlchemyError as error:
+            logger.warning('Replica %s unavailable: %s', name, error)
+            lag = None
+        with self._lock:
+            self._lags[name] = (now, lag)
+        return lag
+
+    def healthy(self):
+        return [name for name in self.names
+                if (lag := self.lag(name)) is not None and lag <= self.max_lag]
+
+    def choose(self):
+        """(name, engine) of a current replica, or (None, None) to use the primary."""
+        names = self.healthy()
+        if not names:
+            return None, None
+        name = random.choice(names)
+        return name, current_app.extensions['sqlalchemy'].engines[name]
+
+    # --- Flask hooks ---
+    def _before_request(self):
+        if request.method not in ('GET', 'HEAD') or request.endpoint not in self.endpoints:
+            return
+        metric = get_instrumentation().metrics.replica_reads
+        if flask_session.get(READ_PRIMARY_UNTIL, 0) > time.time():
+            metric.inc('primary', 'read_your_writes')
+            return
+        name, engine = self.choose()
+        if engine is None:
+            metric.inc('primary', 'lag')
+            return
+        current_app.extensions['sqlalchemy'].session().info['replica'] = engine
+        metric.inc(name, 'ok')
+
+    def _after_request(self, response):
+        if current_app.extensions['sqlalchemy'].session().info.get('wrote'):
+            flask_session[READ_PRIMARY_UNTIL] = time.time() + self.read_your_writes
+        return response
+
+
+@contextmanager
+def replica_reads():
+    """
+    Run reports and other read-only work outside a request (CLI commands)
+    against a current replica, if there is one:
+
+        with replica_reads():
+            rows = ...
+    """
+    router = current_app.extensions.get('replica_router')
+    name, engine = router.choose() if router is not None and router.names else (None, None)
+    db_session = current_app.extensions['sqlalchemy'].session()
+    previous = db_session.info.get('replica')
+    db_session.info['replica'] = engine
+    try:
+        yield name
+    finally:
+        db_session.info['replica'] = previous
+
+
+@contextmanager
+def primary_reads():
+    """
+    Read from the primary inside a replica-routed request: for loads that
+    fill caches other requests rely on (identity_cache.py), which mustn't
+    keep a replica's stale copy after it has caught up.
+    """
+    db_session = current_app.extensions['sqlalchemy'].session()
+    previous = db_session.info.get('replica')
+    db_session.info['replica'] = None
+    try:
+        yield
+    finally:
+        db_session.info['replica'] = previous
@@ -0,0 +1,420 @@
+import csv
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+import routing
+from extensions import db
+from models import ReportRollup, ReportWatermark, Ticket, TicketEvent, TicketResponse, User
+from replicas import replica_reads
+
+CREATED = 'created'
+FIRST_RESPONSE = 'first_response'
+STATUS = 'status'
+GRANULARITIES = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+# Longest range one request may ask for, per granularity
+MAX_RANGE = {'hour': timedelta(days=31), 'day': timedelta(days=3 * 366)}
+WATERMARK = 'rollup'
+UNASSIGNED = 'unassigned'
+
+reports_cli = AppGroup('reports', help='Ticket history rollups and reports.')
+
+
+# --- Hooks called from routes.py, inside the same transaction as the change ---
+def _event(ticket, kind, now, **values):
+    db.session.add(TicketEvent(ticket_id=ticket.id, kind=kind, category=ticket.category, created_at=now, **values))
+
+
+def record_ticket_created(ticket):
+    _event(ticket, CREATED, ticket.date_posted or datetime.utcnow(), new_status=ticket.status)
+
+
+def record_response(response):
+    """
+    The ticket's first public reply from anyone but its author starts the
+    first-response clock's one and only sample. The conditional UPDATE
+    makes sure two replies racing each other record it once.
+    """
+    ticket = response.ticket
+    if response.is_internal_note or response.user_id == ticket.user_id:
+        return
+    now = response.date_posted or datetime.utcnow()
+    result = db.session.execute(
+        update(Ticket).where(Ticket.id == ticket.id, Ticket.first_response_at.is_(None))
+        .values(first_response_at=now).execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        set_committed_value(ticket, 'first_response_at', now)
+        _event(ticket, FIRST_RESPONSE, now, agent_id=response.user_id,
+               seconds=(now - ticket.date_posted).total_seconds())
+
+
+def _resolution_seconds(old_status, new_status, since, now):
+    # Leaving the open statuses resolves a ticket; reopening doesn't count
+    if (old_status is None or routing.is_open(old_status)) and not routing.is_open(new_status):
+        return (now - since).total_seconds()
+    return None
+
+
+def record_status_change(ticket, old_status, now=None):
+    if old_status == ticket.status:
+        return
+    now = now or ticket.last_updated or datetime.utcnow()
+    _event(ticket, STATUS, now, agent_id=ticket.agent_id, old_status=old_status, new_status=ticket.status,
+           seconds=_resolution_seconds(old_status, ticket.status, ticket.date_posted, now))
+
+
+def record_status_changes(changes, now):
+    """
+    record_status_change for many tickets in one INSERT (batch.py).
+    `changes` are (ticket, old_status) pairs; a ticket is anything with id,
+    category, agent_id, status and date_posted.
+    """
+    rows = [{'ticket_id': ticket.id, 'kind': STATUS, 'category': ticket.category, 'agent_id': ticket.agent_id,
+             'old_status': old_status, 'new_status': ticket.status, 'created_at': now,
+             'seconds': _resolution_seconds(old_status, ticket.status, ticket.date_posted, now)}
+            for ticket, old_status in changes if old_status != ticket.status]
+    if rows:
+        db.session.execute(insert(TicketEvent), rows)
+
+
+# --- Backfill ---
+def backfill_events(batch_size=1000):
+    """
+    Give tickets that predate the history (or were bulk imported) the
+    events it would have recorded: creation, first response, and, for
+    tickets already resolved or closed, one status change at last_updated.
+    Walks tickets by primary key; tickets that already have an event of a
+    kind are skipped, so it can be re-run. Commits per batch. Returns the
+    number of events added.
+    """
+    last_id, added = 0, 0
+    while True:
+        tickets = db.session.execute(
+            select(Ticket.id, Ticket.user_id, Ticket.agent_id, Ticket.category, Ticket.status,
+                   Ticket.date_posted, Ticket.last_updated, Ticket.first_response_at)
+            .where(Ticket.id > last_id).order_by(Ticket.id).limit(batch_size)
+        ).all()
+        if not tickets:
+            return added
+        ids = [ticket.id for ticket in tickets]
+        existing = set(db.session.execute(
+            select(TicketEvent.ticket_id, TicketEvent.kind).where(TicketEvent.ticket_id.in_(ids)).distinct()
+        ).all())
+        first_replies = dict(db.session.execute(
+            select(TicketResponse.ticket_id, func.min(TicketResponse.date_posted))
+            .join(Ticket, Ticket.id == TicketResponse.ticket_id)
+            .where(TicketResponse.ticket_id.in_(ids), TicketResponse.user_id != Ticket.user_id,
+                   TicketResponse.is_internal_note == False)
+            .group_by(TicketResponse.ticket_id)
+        ).all())
+        responders = {}
+        if first_replies:
+            responders = {(ticket_id, posted): user_id for ticket_id, posted, user_id in db.session.execute(
+                select(TicketResponse.ticket_id, TicketResponse.date_posted, TicketResponse.user_id)
+                .where(TicketResponse.ticket_id.in_(list(first_replies)))
+            ).all()}
+
+        events, first_response_updates = [], []
+        for ticket in tickets:
+            base = {'ticket_id': ticket.id, 'category': ticket.category}
+            if (ticket.id, CREATED) not in existing:
+                events.append({**base, 'kind': CREATED, 'new_status': 'Open', 'created_at': ticket.date_posted})
+            replied = ticket.first_response_at or first_replies.get(ticket.id)
+            if replied is not None and (ticket.id, FIRST_RESPONSE) not in existing:
+                events.append({**base, 'kind': FIRST_RESPONSE, 'created_at': replied,
+                               'agent_id': responders.get((ticket.id, replied)),
+                               'seconds': (replied - ticket.date_posted).total_seconds()})
+                if ticket.first_response_at is None:
+                    first_response_updates.append({'id': ticket.id, 'first_response_at': replied})
+            if not routing.is_open(ticket.status) and (ticket.id, STATUS) not in existing:
+                events.append({**base, 'kind': STATUS, 'agent_id': ticket.agent_id, 'old_status': None,
+                               'new_status': ticket.status, 'created_at': ticket.last_updated,
+                               'seconds': _resolution_seconds(None, ticket.status, ticket.date_posted,
+                                                              ticket.last_updated)})
+        if events:
+            db.session.execute(insert(TicketEvent), events)
+        if first_response_updates:
+            db.session.execute(update(Ticket), first_response_updates)
+        db.session.commit()
+        last_id, added = ids[-1], added + len(events)
+
+
+# --- Rollups ---
+def _summaries(frame, keys, metric, dimension):
+    """count/total/p50/p90 of `seconds` per group, as rollup rows."""
+    if frame.empty:
+        return []
+    grouped = frame.groupby(keys)['seconds']
+    stats = grouped.agg(['count', 'sum']).join(grouped.quantile([0.5, 0.9]).unstack())
+    rows = []
+    for key, row in stats.iterrows():
+        bucket, value = (key, '') if dimension is None else key
+        rows.append({'metric': metric, 'bucket': bucket, 'dimension': value, 'count': int(row['count']),
+                     'total': float(row['sum']), 'p50': float(row[0.5]), 'p90': float(row[0.9])})
+    return rows
+
+
+def compute_rollups(events, granularity):
+    """
+    Aggregate a DataFrame of ticket_event rows into rollup rows for one
+    granularity. Everything is column-wise pandas/NumPy: one floor() for
+    the buckets, then grouped counts, sums and quantiles.
+    """
+    import numpy as np # Only the rollup job needs NumPy/pandas, and they are slow to import
+
+    events = events.assign(bucket=events['created_at'].dt.floor({'hour': 'h', 'day': 'D'}[granularity]))
+    kind = events['kind']
+    rows = []
+
+    created = events[kind == CREATED]
+    for (bucket, category), count in created.groupby(['bucket', 'category']).size().items():
+        rows.append({'metric': 'tickets_created', 'bucket': bucket, 'dimension': category,
+                     'count': int(count), 'total': float(count)})
+
+    rows += _summaries(events[kind == FIRST_RESPONSE], 'bucket', 'first_response_seconds', None)
+
+    resolved = events[(kind == STATUS) & events['seconds'].notna()]
+    resolved = resolved.assign(agent=resolved['agent_id'].astype('Int64').astype('string').fillna(UNASSIGNED))
+    rows += _summaries(resolved, ['bucket', 'agent'], 'resolution_seconds', 'agent')
+
+    # Backlog: +1 per new ticket, -1 when one leaves the open statuses, +1 when reopened
+    was_open = events['old_status'].isna() | events['old_status'].isin(routing.OPEN_STATUSES)
+    is_open = events['new_status'].isin(routing.OPEN_STATUSES)
+    delta = np.select([kind == CREATED, (kind == STATUS) & was_open & ~is_open,
+                       (kind == STATUS) & ~was_open & is_open], [1, -1, 1], 0)
+    changes = events.assign(delta=delta)[delta != 0]
+    if not changes.empty:
+        grouped = changes.groupby('bucket')['delta'].agg(['count', 'sum'])
+        for bucket, row in grouped.iterrows():
+            rows.append({'metric': 'backlog_delta', 'bucket': bucket, 'dimension': '',
+                         'count': int(row['count']), 'total': float(row['sum'])})
+
+    for row in rows:
+        row['granularity'] = granularity
+        row['bucket'] = row['bucket'].to_pydatetime()
+        row.setdefault('p50', None)
+        row.setdefault('p90', None)
+    return rows
+
+
+def _day_ranges(days, max_days=31):
+    """Group sorted days into [start, end) ranges of at most max_days."""
+    ranges = []
+    for day in sorted(days):
+        if ranges and day < ranges[-1][0] + timedelta(days=max_days):
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    return ranges
+
+
+def _load_events(start, end):
+    import pandas as pd
+    columns = [TicketEvent.id, TicketEvent.kind, TicketEvent.category, TicketEvent.agent_id,
+               TicketEvent.old_status, TicketEvent.new_status, TicketEvent.seconds, TicketEvent.created_at]
+    result = db.session.execute(select(*columns).where(TicketEvent.created_at >= start, TicketEvent.created_at < end))
+    frame = pd.DataFrame(result.all(), columns=[column.key for column in columns])
+    frame['created_at'] = pd.to_datetime(frame['created_at'])
+    frame['seconds'] = pd.to_numeric(frame['seconds'])
+    return frame
+
+
+def run_rollup(batch_size=50000, settle_seconds=60, now=None):
+    """
+    Fold new ticket events into report_rollup. Reads the events after the
+    watermark (at most batch_size, and only those older than
+    settle_seconds so slow transactions have committed), then recomputes
+    every day they touch, hours included, from all of that day's events,
+    so percentiles stay exact and an event that commits late is still
+    counted the next time its day is recomputed. One transaction per call.
+    Returns (events read, rollup rows written).
+    """
+    now = now or datetime.utcnow()
+    watermark = db.session.get(ReportWatermark, WATERMARK, with_for_update=True)
+    if watermark is None:
+        watermark = ReportWatermark(name=WATERMARK, last_event_id=0)
+        db.session.add(watermark)
+    new = db.session.execute(
+        select(TicketEvent.id, TicketEvent.created_at)
+        .where(TicketEvent.id > watermark.last_event_id,
+               TicketEvent.created_at <= now - timedelta(seconds=settle_seconds))
+        .order_by(TicketEvent.id).limit(batch_size)
+    ).all()
+    if not new:
+        db.session.commit()
+        return 0, 0
+    days = {datetime(created_at.year, created_at.month, created_at.day) for _, created_at in new}
+    written = 0
+    for start, end in _day_ranges(days):
+        rows = []
+        events = _load_events(start, end)
+        if not events.empty:
+            for granularity in GRANULARITIES:
+                rows += compute_rollups(events, granularity)
+        db.session.execute(delete(ReportRollup).where(ReportRollup.bucket >= start, ReportRollup.bucket < end))
+        if rows:
+            db.session.execute(insert(ReportRollup), rows)
+        written += len(rows)
+    watermark.last_event_id = new[-1].id
+    watermark.updated_at = now
+    db.session.commit()
+    return len(new), written
+
+
+def rebuild_rollups():
+    """Drop every rollup and the watermark; the next run_rollup starts from the first event. Caller commits."""
+    db.session.execute(delete(ReportRollup))
+    db.session.execute(delete(ReportWatermark).where(ReportWatermark.name == WATERMARK))
+
+
+# --- Reading reports ---
+def parse_range(granularity='day', start=None, end=None):
+    """(start, end) datetimes for a report request; raises ValueError on bad input."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    step = GRANULARITIES[granularity]
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    end = datetime.fromisoformat(end) if end else today + timedelta(days=1)
+    start = datetime.fromisoformat(start) if start else end - (timedelta(days=365) if step.days else timedelta(days=7))
+    if start >= end:
+        raise ValueError('start must be before end')
+    if end - start > MAX_RANGE[granularity]:
+        raise ValueError(f"{granularity} reports cover at most {MAX_RANGE[granularity].days} days")
+    return start, end
+
+
+def _rollups(metric, granularity, start, end):
+    return db.session.execute(
+        select(ReportRollup.bucket, ReportRollup.dimension, ReportRollup.count, ReportRollup.total,
+               ReportRollup.p50, ReportRollup.p90)
+        .where(ReportRollup.granularity == granularity, ReportRollup.metric == metric,
+               ReportRollup.bucket >= start, ReportRollup.bucket < end)
+        .order_by(ReportRollup.bucket, ReportRollup.dimension)
+    ).all()
+
+
+def _durations(row):
+    return {'count': row.count, 'median_seconds': row.p50, 'p90_seconds': row.p90,
+            'mean_seconds': row.total / row.count if row.count else None}
+
+
+def tickets_by_category(granularity, start, end):
+    return ['bucket', 'category', 'count'], [
+        {'bucket': row.bucket, 'category': row.dimension, 'count': row.count}
+        for row in _rollups('tickets_created', granularity, start, end)]
+
+
+def first_response(granularity, start, end):
+    return ['bucket', 'count', 'median_seconds', 'p90_seconds', 'mean_seconds'], [
+        {'bucket': row.bucket, **_durations(row)} for row in _rollups('first_response_seconds', granularity, start, end)]
+
+
+def resolution_by_agent(granularity, start, end):
+    rows = _rollups('resolution_seconds', granularity, start, end)
+    agent_ids = {int(row.dimension) for row in rows if row.dimension.isdigit()}
+    names = dict(db.session.execute(select(User.id, User.username).where(User.id.in_(agent_ids))).all()) if agent_ids else {}
+    return ['bucket', 'agent_id', 'agent', 'count', 'median_seconds', 'p90_seconds', 'mean_seconds'], [
+        {'bucket': row.bucket, 'agent_id': row.dimension,
+         'agent': names.get(int(row.dimension)) if row.dimension.isdigit() else UNASSIGNED, **_durations(row)}
+        for row in rows]
+
+
+def backlog(granularity, start, end):
+    """Open tickets at the end of every bucket: the running sum of backlog_delta."""
+    baseline = db.session.execute(
+        select(func.coalesce(func.sum(ReportRollup.total), 0))
+        .where(ReportRollup.granularity == granularity, ReportRollup.metric == 'backlog_delta',
+               ReportRollup.bucket < start)
+    ).scalar()
+    changes = {row.bucket: row.total for row in _rollups('backlog_delta', granularity, start, end)}
+    step = GRANULARITIES[granularity]
+    buckets = [start + step * index for index in range(int((end - start) / step))]
+    deltas = [int(changes.get(bucket, 0)) for bucket in buckets]
+    return ['bucket', 'net_change', 'backlog'], [
+        {'bucket': bucket, 'net_change': delta, 'backlog': int(baseline) + level}
+        for bucket, delta, level in zip(buckets, deltas, accumulate(deltas))]
+
+
+REPORTS = {
+    'tickets_by_category': tickets_by_category,
+    'first_response': first_response,
+    'resolution_by_agent': resolution_by_agent,
+    'backlog': backlog,
+}
+
+
+def build_report(name, granularity, start, end):
+    """(fields, rows) for report `name`; buckets are ISO strings."""
+    fields, rows = REPORTS[name](granularity, start, end)
+    for row in rows:
+        row['bucket'] = row['bucket'].isoformat()
+    return fields, rows
+
+
+# --- CLI ---
+@reports_cli.command('rollup')
+@click.option('--loop', is_flag=True, help='Keep running, every --interval seconds.')
+@click.option('--interval', type=float, default=300.0, show_default=True)
+@click.option('--batch-size', type=int, help='Events read per transaction.')
+def rollup_command(loop, interval, batch_size):
+    """Fold new ticket events into the hourly/daily rollups."""
+    config = current_app.config
+    batch_size = batch_size or config.get('REPORTS_ROLLUP_BATCH_SIZE', 50000)
+    while True:
+        while True:
+            read, written = run_rollup(batch_size, config.get('REPORTS_SETTLE_SECONDS', 60))
+            if read:
+                click.echo(f"Rolled up {read} events into {written} rows.")
+            if read < batch_size:
+                break
+        if not loop:
+            return
+        time.sleep(interval)
+
+
+@reports_cli.command('backfill')
+@click.option('--batch-size', type=int, default=1000, show_default=True)
+def backfill_command(batch_size):
+    """Create history events for tickets that predate them."""
+    click.echo(f"Added {backfill_events(batch_size)} events; run `flask reports rollup` to aggregate them.")
+
+
+@reports_cli.command('rebuild')
+def rebuild_command():
+    """Recompute every rollup from the full event history."""
+    rebuild_rollups()
+    db.session.commit()
+    total = 0
+    batch_size = current_app.config.get('REPORTS_ROLLUP_BATCH_SIZE', 50000)
+    while True:
+        read, _ = run_rollup(batch_size, current_app.config.get('REPORTS_SETTLE_SECONDS', 60))
+        total += read
+        if read < batch_size:
+            break
+    click.echo(f"Rebuilt rollups from {total} events.")
+
+
+@reports_cli.command('show')
+@click.argument('name', type=click.Choice(sorted(REPORTS)))
+@click.option('--granularity', type=click.Choice(sorted(GRANULARITIES)), default='day', show_default=True)
+@click.option('--start', help='ISO date; default: a year (day) or a week (hour) before --end.')
+@click.option('--end', help='ISO date, exclusive; default: tomorrow.')
+def show_command(name, granularity, start, end):
+    """Print a report as CSV."""
+    try:
+        start, end = parse_range(granularity, start, end)
+    except ValueError as error:
+        raise click.BadParameter(str(error))
+    with replica_reads():
+        fields, rows = build_report(name, granularity, start, end)
+    writer = csv.DictWriter(sys.stdout, fieldnames=fields)
+    writer.writeheader()
+    writer.writerows(rows)
@@ -1,11 +1,35 @@
-from flask import render_template, url_for, flash, redirect, request, abort
-import datetime
-from app import app, db, bcrypt
-from forms import RegistrationForm, LoginForm, TicketForm, TicketResponseForm, AssignAgentForm, ChangeStatusForm
-from models import User, Ticket, TicketResponse
+from flask import Blueprint, current_app, render_template, url_for, flash, redirect, request, abort, jsonify, Response
+from datetime import datetime, timedelta
+from extensions import db
+from forms import (RegistrationForm, LoginForm, TicketForm, TicketResponseForm, AssignAgentForm, ChangeStatusForm, ClaimTicketForm,
+                   BatchUpdateForm, MergeTicketsForm, RestoreTicketForm, NO_CHANGE)
+from models import User, Ticket, TicketResponse, Attachment, TicketArchive
+import stats
+import routing
+import sla
+from identity_cache import get_identity_cache
+import events
+import notifications
+import attachments
+import reports
+import archive
+import audit
+import batch
+import duplicates
+from passwords import HashingBusy, get_password_hasher
+from instrumentation import get_instrumentation
+from search import get_search_backend, DEFAULT_PER_PAGE as SEARCH_PER_PAGE
+from listing import (InvalidCursor, paginate_tickets, paginate_responses, page_size, ticket_to_dict, response_to_dict,
+                     user_tickets_query, agent_ticket_branches, all_tickets_query, dashboard_branches)
 from flask_login import login_user, current_user, logout_user, login_required
-from sqlalchemy import desc
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
+from sqlalchemy.orm import joinedload
+import csv
 import functools
+import io
+
+main = Blueprint('main', __name__)
 
 # --- Helper Decorators for Authorization ---
 def agent_required(f):
@@ -14,7 +38,7 @@ def agent_required(f):
     def wrap(*args, **kwargs):
         if not current_user.is_agent and not current_user.is_admin:
             flash('You do not have permission to view this page.', 'danger')
-            return redirect(url_for('home'))
+            return redirect(url_for('main.home'))
         return f(*args, **kwargs)
     return wrap
 
@@ -24,73 +48,110 @@ def admin_required(f):
     def wrap(*args, **kwargs):
         if not current_user.is_admin:
             flash('You do not have admin permission to view this page.', 'danger')
-            return redirect(url_for('home'))
+            return redirect(url_for('main.home'))
         return f(*args, **kwargs)
     return wrap
 
+def can_view_ticket(ticket, user):
+    # Only author, assigned agent, or admin can view a ticket
+    return ticket.user_id == user.id or ticket.agent_id == user.id or user.is_admin
+
+def _ticket_page(query):
+    """Paginate a dashboard query using the cursor/per_page query args."""
+    try:
+        return paginate_tickets(query, cursor=request.args.get('cursor'),
+                                per_page=page_size(request.args.get('per_page')))
+    except InvalidCursor:
+        abort(400)
+
+def _response_page(ticket):
+    """The page of responses before the ?before= cursor (newest page without one)."""
+    try:
+        return paginate_responses(ticket, current_user, before=request.args.get('before'),
+                                  per_page=page_size(request.args.get('per_page'), 'RESPONSES_PER_PAGE', 20))
+    except InvalidCursor:
+        abort(400)
+
+def _save_attachments(uploads, ticket, response=None):
+    # Each file is read and hashed in chunks; raises AttachmentError
+    for upload in uploads or []:
+        if upload and upload.filename:
+            attachments.save_upload(upload.stream, upload.filename, ticket, current_user, response)
+
+@main.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    # Shed login/register load instead of queueing it behind the hash pool
+    return 'Too many sign-in attempts are being processed. Please try again shortly.', 503, {'Retry-After': '2'}
+
 # --- Public Routes ---
-@app.route("/")
-@app.route("/home")
+@main.route("/")
+@main.route("/home")
 def home():
     if current_user.is_authenticated:
         if current_user.is_admin:
-            return redirect(url_for('admin_dashboard'))
+            return redirect(url_for('main.admin_dashboard'))
         elif current_user.is_agent:
-            return redirect(url_for('agent_dashboard'))
+            return redirect(url_for('main.agent_dashboard'))
         else:
-            return redirect(url_for('user_dashboard'))
+            return redirect(url_for('main.user_dashboard'))
     return render_template('index.html', title='Welcome')
 
-@app.route("/register", methods=['GET', 'POST'])
+@main.route("/register", methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = get_password_hasher().hash(form.password.data)
         user = User(username=form.username.data, email=form.email.data, password=hashed_password)
         db.session.add(user)
         db.session.commit()
         flash('Your account has been created! You are now able to log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html', title='Register', form=form)
 
-@app.route("/login", methods=['GET', 'POST'])
+@main.route("/login", methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('home'))
+        return redirect(url_for('main.home'))
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password, form.password.data):
+        hasher = get_password_hasher()
+        if user and hasher.check(user.password, form.password.data):
+            if hasher.needs_rehash(user.password):
+                # BCRYPT_LOG_ROUNDS changed since this hash was made; upgrade it
+                # now while we have the plaintext.
+                user.password = hasher.hash(form.password.data)
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
-            return redirect(next_page) if next_page else redirect(url_for('home'))
+            return redirect(next_page) if next_page else redirect(url_for('main.home'))
         else:
             flash('Login Unsuccessful. Please check email and password', 'danger')
     return render_template('login.html', title='Login', form=form)
 
-@app.route("/logout")
+@main.route("/logout")
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
 
 # --- User Portal Routes ---
-@app.route("/user_dashboard")
+@main.route("/user_dashboard")
 @login_required
 def user_dashboard():
     # Regular users don't have agent/admin access, so filter their own tickets
     if current_user.is_agent or current_user.is_admin:
         flash('You are logged in as an agent/admin. Redirecting to your dashboard.', 'info')
-        return redirect(url_for('home')) # Redirect to appropriate dashboard based on home logic
+        return redirect(url_for('main.home')) # Redirect to appropriate dashboard based on home logic
     
-    tickets = Ticket.query.filter_by(user_id=current_user.id).order_by(desc(Ticket.date_posted)).all()
-    return render_template('user_dashboard.html', title='My Tickets', tickets=tickets)
+    page = _ticket_page(user_tickets_query(current_user))
+    return render_template('user_dashboard.html', title='My Tickets', tickets=page.items, page=page)
 
-@app.route("/submit_ticket", methods=['GET', 'POST'])
+@main.route("/submit_ticket", methods=['GET', 'POST'])
 @login_required
 def submit_ticket():
     form = TicketForm()
@@ -99,28 +160,46 @@ def submit_ticket():
                         category=form.category.data, priority=form.priority.data,
                         author=current_user)
         db.session.add(ticket)
+        db.session.flush() # Populate column defaults (status etc.) before counting
+        try:
+            _save_attachments(form.attachments.data, ticket)
+        except attachments.AttachmentError as error:
+            db.session.rollback()
+            flash(str(error), 'danger')
+            return render_template('submit_ticket.html', title='Submit Ticket', form=form), error.status_code
+        routing.route_ticket(ticket) # Picks an agent, or leaves it in the unassigned queue
+        sla.start(ticket)
+        stats.record_ticket_created(ticket)
+        reports.record_ticket_created(ticket)
+        get_search_backend().index_ticket(ticket)
+        matches = duplicates.record_ticket_created(ticket)
         db.session.commit()
+        events.publish_ticket_event(events.TICKET_CREATED, ticket)
         flash('Your ticket has been submitted!', 'success')
-        return redirect(url_for('user_dashboard'))
+        # Only the author's own tickets are worth pointing out to them
+        own = [match.ticket_id for match in matches if match.user_id == current_user.id]
+        if own:
+            flash(f'This looks like a duplicate of your open ticket #{own[0]}; you can follow both from your dashboard.', 'info')
+        return redirect(url_for('main.user_dashboard'))
     return render_template('submit_ticket.html', title='Submit Ticket', form=form)
 
-@app.route("/ticket/<int:ticket_id>", methods=['GET', 'POST'])
+@main.route("/ticket/<int:ticket_id>", methods=['GET', 'POST'])
 @login_required
 def view_ticket(ticket_id):
-    ticket = Ticket.query.get_or_404(ticket_id)
+    ticket = db.session.get(Ticket, ticket_id)
+    if ticket is None:
+        return _archived_ticket(ticket_id)
 
     # Authorization check: only author, assigned agent, or admin can view
-    if not (ticket.user_id == current_user.id or
-            ticket.agent_id == current_user.id or
-            current_user.is_admin):
+    if not can_view_ticket(ticket, current_user):
         flash('You do not have permission to view this ticket.', 'danger')
-        return redirect(url_for('user_dashboard')) # Redirect to user's dashboard if not authorized
+        return redirect(url_for('main.user_dashboard')) # Redirect to user's dashboard if not authorized
 
     response_form = TicketResponseForm()
     if response_form.validate_on_submit():
         if not current_user.is_agent and not current_user.is_admin and response_form.is_internal_note.data:
             flash('Only agents/admins can add internal notes.', 'danger')
-            return redirect(url_for('view_ticket', ticket_id=ticket.id))
+            return redirect(url_for('main.view_ticket', ticket_id=ticket.id))
 
         response = TicketResponse(content=response_form.content.data,
                                   ticket=ticket,
@@ -128,118 +207,387 @@ def view_ticket(ticket_id):
                                   is_internal_note=response_form.is_internal_note.data)
         db.session.add(response)
         ticket.last_updated = datetime.utcnow()
+        sla.record_response(response, by_staff=current_user.is_agent or current_user.is_admin)
+        db.session.flush() # Assigns response.id for the search index
+        try:
+            _save_attachments(response_form.attachments.data, ticket, response)
+        except attachments.AttachmentError as error:
+            db.session.rollback()
+            flash(str(error), 'danger')
+            return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
+        reports.record_response(response)
+        get_search_backend().index_response(response)
+        notifications.enqueue_response(response)
         db.session.commit()
+        events.publish_response(response)
         flash('Your response has been added!', 'success')
-        return redirect(url_for('view_ticket', ticket_id=ticket.id))
+        return redirect(url_for('main.view_ticket', ticket_id=ticket.id))
     
-    # Filter responses for regular users
-    if not current_user.is_agent and not current_user.is_admin:
-        responses = [res for res in ticket.responses if not res.is_internal_note]
-    else:
-        responses = ticket.responses
+    # Only the newest page of responses; older ones load on demand from
+    # ticket_responses. Internal notes are filtered out in SQL for customers.
+    response_page = _response_page(ticket)
 
     # Admin/Agent specific forms
     assign_form = AssignAgentForm()
     change_status_form = ChangeStatusForm()
 
-    if current_user.is_admin or current_user.is_agent:
-        agents = User.query.filter((User.is_agent == True) | (User.is_admin == True)).order_by(User.username).all()
-        assign_form.agent.choices = [(agent.id, agent.username) for agent in agents]
-        if ticket.agent:
-            assign_form.agent.data = ticket.agent.id # Pre-select current agent
+    is_staff = current_user.is_admin or current_user.is_agent
+    if is_staff:
+        assign_form.agent.choices = get_identity_cache().agent_choices()
+        if ticket.agent_id:
+            assign_form.agent.data = ticket.agent_id # Pre-select current agent
 
     return render_template('ticket_detail.html', title=f'Ticket {ticket.id}', ticket=ticket,
-                           response_form=response_form, responses=responses,
-                           assign_form=assign_form, change_status_form=change_status_form)
+                           response_form=response_form, responses=response_page.items, response_page=response_page,
+                           assign_form=assign_form, change_status_form=change_status_form,
+                           merge_form=MergeTicketsForm(),
+                           attachments=attachments.visible_attachments(ticket, current_user),
+                           history=audit.ticket_history(ticket.id) if is_staff else [],
+                           duplicates=duplicates.ticket_duplicates(ticket.id) if is_staff else [])
+
+def _archived_ticket(ticket_id):
+    # view_ticket's fallback: old Closed tickets live in ticket_archive (archive.py), read-only
+    archived = db.session.get(TicketArchive, ticket_id)
+    if archived is None:
+        abort(404)
+    if not can_view_ticket(archived, current_user):
+        flash('You do not have permission to view this ticket.', 'danger')
+        return redirect(url_for('main.user_dashboard'))
+    if request.method == 'POST':
+        flash('This ticket is archived and can no longer be replied to.', 'warning')
+        return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
+    view = archive.ticket_view(archived, current_user)
+    return render_template('archived_ticket.html', title=f'Ticket {ticket_id}', ticket=view.ticket,
+                           responses=view.responses, attachments=view.attachments, restore_form=RestoreTicketForm())
+
+@main.route("/ticket/<int:ticket_id>/restore", methods=['POST'])
+@agent_required
+def restore_ticket(ticket_id):
+    form = RestoreTicketForm()
+    archived = db.session.get(TicketArchive, ticket_id)
+    if archived is None or not can_view_ticket(archived, current_user):
+        abort(404)
+    if not form.validate_on_submit():
+        flash('Invalid request.', 'danger')
+        return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
+    archive.restore_tickets([ticket_id])
+    flash(f'Ticket #{ticket_id} was restored from the archive.', 'success')
+    return redirect(url_for('main.view_ticket', ticket_id=ticket_id))
+
+@main.route("/ticket/<int:ticket_id>/attachments", methods=['PUT'])
+@login_required
+def upload_attachment(ticket_id):
+    # Raw upload for large files (`curl -T big.log ...?filename=big.log`): the
+    # request body is the file, streamed from the socket straight into the
+    # store without multipart parsing or a temp copy. Send the CSRF token of
+    # any form in the X-CSRFToken header.
+    ticket = Ticket.query.get_or_404(ticket_id)
+    if not can_view_ticket(ticket, current_user):
+        abort(403)
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError:
+            abort(400)
+    try:
+        attachment = attachments.save_upload(request.stream, request.args.get('filename'), ticket, current_user,
+                                             content_length=request.content_length)
+    except attachments.AttachmentError as error:
+        db.session.rollback()
+        return jsonify(error=str(error)), error.status_code
+    db.session.commit()
+    return jsonify(attachments.attachment_to_dict(attachment)), 201
+
+@main.route("/attachments/<int:attachment_id>/<path:filename>")
+@login_required
+def download_attachment(attachment_id, filename):
+    attachment = db.session.get(Attachment, attachment_id)
+    if attachment is None:
+        found = archive.find_attachment(attachment_id, current_user)
+        if found is None or not can_view_ticket(found[0], current_user):
+            abort(404)
+        return attachments.download_response(found[1])
+    ticket = db.session.get(Ticket, attachment.ticket_id)
+    # 404 rather than 403: don't confirm the attachment exists
+    if not can_view_ticket(ticket, current_user) or not attachments.can_view_attachment(attachment, current_user):
+        abort(404)
+    return attachments.download_response(attachment)
+
+@main.route("/ticket/<int:ticket_id>/responses")
+@login_required
+def ticket_responses(ticket_id):
+    # "Load older responses": ?before=<cursor> from the previous page. Returns
+    # JSON, or with ?format=html the rendered cards for the ticket page.
+    ticket = Ticket.query.get_or_404(ticket_id)
+    if not can_view_ticket(ticket, current_user):
+        abort(403)
+    page = _response_page(ticket)
+    next_url = url_for('main.ticket_responses', ticket_id=ticket.id, before=page.next_cursor,
+                       per_page=request.args.get('per_page'), format=request.args.get('format')) if page.has_more else None
+    if request.args.get('format') == 'html':
+        fragment = render_template('_responses.html', responses=page.items)
+        return fragment, 200, {'X-Next-Url': next_url or ''}
+    return jsonify(responses=[response_to_dict(response) for response in page.items],
+                   next_cursor=page.next_cursor, next=next_url)
+
+@main.route("/events")
+@login_required
+def live_events():
+    # Server-sent events for the page the user has open: a single ticket
+    # (?ticket=<id>) or otherwise their dashboard.
+    ticket_id = request.args.get('ticket', type=int)
+    if ticket_id is not None:
+        ticket = Ticket.query.get_or_404(ticket_id)
+        if not can_view_ticket(ticket, current_user):
+            abort(403)
+        channels = [events.ticket_channel(ticket.id)]
+        if current_user.is_agent or current_user.is_admin:
+            channels.append(events.ticket_channel(ticket.id, internal=True))
+    else:
+        channels = events.dashboard_channels(current_user)
+
+    subscription = events.get_event_bus().subscribe(channels)
+    stream = events.sse_stream(subscription,
+                               heartbeat=current_app.config.get('EVENTS_HEARTBEAT', 15),
+                               lifetime=current_app.config.get('EVENTS_STREAM_LIFETIME', 300))
+    # X-Accel-Buffering stops nginx from holding events back
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@main.route("/search")
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    page_number = request.args.get('page', 1, type=int)
+    page_number = max(page_number, 1)
+    tickets, has_more = [], False
+    if query:
+        results = get_search_backend().search(query, current_user, page=page_number, per_page=SEARCH_PER_PAGE)
+        # Load the matches in one query, then put them back in rank order
+        by_id = {ticket.id: ticket for ticket in Ticket.query.options(
+            joinedload(Ticket.author), joinedload(Ticket.agent)
+        ).filter(Ticket.id.in_(results.ticket_ids)).all()} if results.ticket_ids else {}
+        tickets = [by_id[ticket_id] for ticket_id in results.ticket_ids if ticket_id in by_id]
+        has_more = results.has_more
+    return render_template('search.html', title='Search', query=query, tickets=tickets,
+                           page_number=page_number, has_more=has_more)
 
 # --- Agent/Admin Portal Routes ---
-@app.route("/agent_dashboard")
+@main.route("/agent_dashboard")
 @agent_required
 def agent_dashboard():
     # Only show tickets assigned to the agent or unassigned tickets
-    tickets = Ticket.query.filter(
-        (Ticket.agent_id == current_user.id) | (Ticket.agent_id == None)
-    ).order_by(desc(Ticket.date_posted)).all()
-    return render_template('agent_dashboard.html', title='Agent Dashboard', tickets=tickets)
+    page = _ticket_page(agent_ticket_branches(current_user))
+    unassigned = routing.displayed_queue_size() # what Claim next can still hand out, a few seconds old at most
+    return render_template('agent_dashboard.html', title='Agent Dashboard', tickets=page.items, page=page,
+                           claim_form=ClaimTicketForm(), unassigned=unassigned,
+                           batch_form=_batch_form(), merge_form=MergeTicketsForm())
 
-@app.route("/admin_dashboard")
+@main.route("/tickets/claim", methods=['POST'])
+@agent_required
+def claim_ticket():
+    # Pull the next ticket from the unassigned queue; safe for many agents at once
+    form = ClaimTicketForm()
+    if not form.validate_on_submit():
+        flash('Invalid request.', 'danger')
+        return redirect(url_for('main.agent_dashboard'))
+    ticket = routing.claim_next(current_user)
+    if ticket is None:
+        db.session.commit()
+        flash('There are no unassigned tickets for you to claim.', 'info')
+        return redirect(url_for('main.agent_dashboard'))
+    stats.record_assignment(None, ticket.agent_id)
+    audit.record_change(ticket, current_user, 'agent', None, ticket.agent_id)
+    db.session.commit()
+    events.publish_ticket_event(events.ASSIGNED, ticket, previous_agent_id=None)
+    flash(f'You claimed ticket #{ticket.id}.', 'success')
+    return redirect(url_for('main.view_ticket', ticket_id=ticket.id))
+
+@main.route("/admin_dashboard")
 @admin_required
 def admin_dashboard():
-    tickets = Ticket.query.order_by(desc(Ticket.date_posted)).all() # All tickets
-    agents = User.query.filter((User.is_agent == True) | (User.is_admin == True)).count()
-    users = User.query.count()
-    open_tickets = Ticket.query.filter_by(status='Open').count()
-    in_progress_tickets = Ticket.query.filter_by(status='In Progress').count()
-    resolved_tickets = Ticket.query.filter_by(status='Resolved').count()
+    # Counters come from the materialized ticket_stats table (one query) and
+    # the user totals from a single aggregate, instead of a count() per status.
+    counts = stats.read_ticket_stats()
+    users, agents = stats.user_counts()
+    page = _ticket_page(all_tickets_query()) # All tickets, one page at a time
 
     # Basic analytics data (can be expanded)
-    ticket_status_data = {
-        'Open': open_tickets,
-        'In Progress': in_progress_tickets,
-        'Resolved': resolved_tickets,
-        'Closed': Ticket.query.filter_by(status='Closed').count()
-    }
+    ticket_status_data = {status: counts['status'].get(status, 0)
+                          for status in ('Open', 'In Progress', 'Resolved', 'Closed')}
+    total_tickets = sum(counts['status'].values())
     
-    return render_template('admin_dashboard.html', title='Admin Dashboard', tickets=tickets,
-                           agents_count=agents, users_count=users,
-                           open_tickets=open_tickets, in_progress_tickets=in_progress_tickets,
-                           resolved_tickets=resolved_tickets,
-                           ticket_status_data=ticket_status_data)
+    return render_template('admin_dashboard.html', title='Admin Dashboard', tickets=page.items, page=page,
+                           total_tickets=total_tickets, agents_count=agents, users_count=users,
+                           open_tickets=ticket_status_data['Open'],
+                           in_progress_tickets=ticket_status_data['In Progress'],
+                           resolved_tickets=ticket_status_data['Resolved'],
+                           priority_counts=counts['priority'], category_counts=counts['category'],
+                           ticket_status_data=ticket_status_data,
+                           history_start=(datetime.utcnow() - timedelta(days=89)).date().isoformat())
+
+@main.route("/dashboard/tickets")
+@login_required
+def dashboard_tickets():
+    # JSON version of whichever dashboard the current user would see
+    page = _ticket_page(dashboard_branches(current_user))
+    next_url = url_for('main.dashboard_tickets', cursor=page.next_cursor, per_page=request.args.get('per_page')) if page.has_more else None
+    return jsonify(tickets=[ticket_to_dict(ticket) for ticket in page.items],
+                   next_cursor=page.next_cursor, next=next_url)
 
-@app.route("/ticket/<int:ticket_id>/assign", methods=['POST'])
+@main.route("/ticket/<int:ticket_id>/assign", methods=['POST'])
 @agent_required
 def assign_agent(ticket_id):
     ticket = Ticket.query.get_or_404(ticket_id)
     form = AssignAgentForm()
-    agents = User.query.filter((User.is_agent == True) | (User.is_admin == True)).order_by(User.username).all()
-    form.agent.choices = [(agent.id, agent.username) for agent in agents]
+    form.agent.choices = get_identity_cache().agent_choices()
 
     if form.validate_on_submit():
-        agent = User.query.get(form.agent.data)
+        agent = get_identity_cache().get_user(form.agent.data)
         if agent:
+            previous_agent_id = ticket.agent_id
+            stats.record_assignment(previous_agent_id, agent.id)
+            routing.record_assignment(ticket, previous_agent_id, agent.id)
             ticket.agent = agent
+            ticket.last_updated = datetime.utcnow() # Also moves the fragment cache key
+            audit.record_change(ticket, current_user, 'agent', previous_agent_id, agent.id)
             db.session.commit()
+            events.publish_ticket_event(events.ASSIGNED, ticket, previous_agent_id=previous_agent_id)
             flash(f'Ticket assigned to {agent.username}.', 'success')
         else:
             flash('Selected agent not found.', 'danger')
     else:
         flash('Invalid agent selection.', 'danger')
-    return redirect(url_for('view_ticket', ticket_id=ticket.id))
+    return redirect(url_for('main.view_ticket', ticket_id=ticket.id))
 
-@app.route("/ticket/<int:ticket_id>/status", methods=['POST'])
+@main.route("/ticket/<int:ticket_id>/status", methods=['POST'])
 @agent_required
 def change_ticket_status(ticket_id):
     ticket = Ticket.query.get_or_404(ticket_id)
     form = ChangeStatusForm()
     if form.validate_on_submit():
+        old_status = ticket.status
+        stats.record_status_change(old_status, form.status.data)
         ticket.status = form.status.data
         ticket.last_updated = datetime.utcnow()
+        routing.record_status_change(ticket, old_status)
+        sla.record_status_change(ticket, old_status)
+        reports.record_status_change(ticket, old_status)
+        notifications.enqueue_status_change(ticket, old_status, current_user)
+        audit.record_change(ticket, current_user, 'status', old_status, ticket.status)
         db.session.commit()
+        events.publish_ticket_event(events.STATUS_CHANGED, ticket)
         flash(f'Ticket status updated to {ticket.status}.', 'success')
     else:
         flash('Invalid status selection.', 'danger')
-    return redirect(url_for('view_ticket', ticket_id=ticket.id))
+    return redirect(url_for('main.view_ticket', ticket_id=ticket.id))
+
+def _batch_form():
+    form = BatchUpdateForm()
+    form.agent.choices = [NO_CHANGE, ('none', 'Unassigned')] + [
+        (str(agent_id), username) for agent_id, username in get_identity_cache().agent_choices()]
+    return form
+
+def _batch_message(verb, result, target=''):
+    message = f"{verb} {result.changed} ticket{'' if result.changed == 1 else 's'}{target}"
+    if result.moved:
+        message += f" ({result.moved} responses moved)"
+    if result.unchanged:
+        message += f"; {result.unchanged} already up to date"
+    if result.refused:
+        message += f"; {result.refused} not on your dashboard"
+    return message + '.'
+
+@main.route("/tickets/batch", methods=['POST'])
+@agent_required
+def batch_update():
+    # Assign / set status / set priority on every ticket ticked on the
+    # dashboard, in one transaction (batch.py)
+    form = _batch_form()
+    if not form.validate_on_submit():
+        flash('Select the tickets to change.', 'danger')
+        return redirect(url_for('main.agent_dashboard'))
+    agent = form.agent.data
+    try:
+        result = batch.update_tickets(form.ticket_ids.data, current_user,
+                                      agent_id=batch.UNCHANGED if not agent else None if agent == 'none' else int(agent),
+                                      status=form.status.data or None, priority=form.priority.data or None)
+    except batch.BatchError as error:
+        db.session.rollback()
+        flash(str(error), 'danger')
+        return redirect(url_for('main.agent_dashboard'))
+    flash(_batch_message('Updated', result), 'success')
+    return redirect(url_for('main.agent_dashboard'))
+
+@main.route("/tickets/merge", methods=['POST'])
+@agent_required
+def merge_tickets():
+    form = MergeTicketsForm()
+    if not form.validate_on_submit():
+        flash('Select the duplicates and the ticket number to merge them into.', 'danger')
+        return redirect(url_for('main.agent_dashboard'))
+    try:
+        result = batch.merge_tickets(form.canonical.data, form.ticket_ids.data, current_user)
+    except batch.BatchError as error:
+        db.session.rollback()
+        flash(str(error), 'danger')
+        return redirect(url_for('main.agent_dashboard'))
+    flash(_batch_message('Merged', result, f' into #{form.canonical.data}'), 'success')
+    return redirect(url_for('main.view_ticket', ticket_id=form.canonical.data))
+
+@main.route("/metrics")
+@admin_required
+def metrics():
+    # Prometheus text format, for this worker process only
+    return Response(get_instrumentation().metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@main.route("/reports/<name>")
+@admin_required
+def report(name):
+    # Served from the hourly/daily rollups (reports.py), never the raw tables:
+    # /reports/backlog?granularity=day&start=2026-01-01&end=2026-07-01&format=csv
+    if name not in reports.REPORTS:
+        abort(404)
+    granularity = request.args.get('granularity', 'day')
+    try:
+        start, end = reports.parse_range(granularity, request.args.get('start'), request.args.get('end'))
+    except ValueError as error:
+        return jsonify(error=str(error)), 400
+    fields, rows = reports.build_report(name, granularity, start, end)
+    if request.args.get('format') == 'csv':
+        stream = io.StringIO()
+        writer = csv.DictWriter(stream, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+        return Response(stream.getvalue(), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename="{name}.csv"'})
+    return jsonify(report=name, granularity=granularity, start=start.isoformat(), end=end.isoformat(),
+                   fields=fields, rows=rows)
 
-@app.route("/manage_users")
+@main.route("/manage_users")
 @admin_required
 def manage_users():
     users = User.query.order_by(User.username).all()
     return render_template('manage_users.html', title='Manage Users', users=users)
 
-@app.route("/user/<int:user_id>/toggle_agent_status", methods=['POST'])
+@main.route("/user/<int:user_id>/toggle_agent_status", methods=['POST'])
 @admin_required
 def toggle_agent_status(user_id):
     user = User.query.get_or_404(user_id)
     user.is_agent = not user.is_agent
+    if user.is_agent:
+        routing.ensure_agent(user.id) # Make them routable
+    get_identity_cache().invalidate() # Roles changed: drop cached users/agent list everywhere
     db.session.commit()
     flash(f'{user.username} agent status toggled to {user.is_agent}.', 'success')
-    return redirect(url_for('manage_users'))
+    return redirect(url_for('main.manage_users'))
 
-@app.route("/user/<int:user_id>/toggle_admin_status", methods=['POST'])
+@main.route("/user/<int:user_id>/toggle_admin_status", methods=['POST'])
 @admin_required
 def toggle_admin_status(user_id):
     user = User.query.get_or_404(user_id)
     user.is_admin = not user.is_admin
+    get_identity_cache().invalidate() # Roles changed: drop cached users/agent list everywhere
     db.session.commit()
     flash(f'{user.username} admin status toggled to {user.is_admin}.', 'success')
-    return redirect(url_for('manage_users'))
\ No newline at end of file
+    return redirect(url_for('main.manage_users'))
\ No newline at end of file
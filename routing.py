@@ -0,0 +1,378 @@
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, case, exists, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from forms import TicketForm
+from identity_cache import TTLCache
+from models import AgentLoad, AgentSkill, Ticket, User
+
+# Statuses that count towards an agent's load
+OPEN_STATUSES = ('Open', 'In Progress')
+# What one open ticket of each priority adds to weighted_load
+PRIORITY_WEIGHTS = {'Low': 1, 'Medium': 2, 'High': 3, 'Urgent': 5}
+# Order agents pull from the unassigned queue in
+CLAIM_ORDER = ('Urgent', 'High', 'Medium', 'Low')
+# These still go to the least loaded skilled agent when everyone is at capacity
+OVERFLOW_PRIORITIES = ('Urgent',)
+CANDIDATES = 5 # agents tried per read before reading loads again
+ATTEMPTS = 3
+
+routing_cli = AppGroup('routing', help='Automatic ticket assignment.')
+
+
+def weight(priority):
+    return PRIORITY_WEIGHTS.get(priority, 1)
+
+
+def is_open(status):
+    return status in OPEN_STATUSES
+
+
+# --- Load counters ---
+def _load_values(tickets, load):
+    return dict(open_count=AgentLoad.open_count + tickets,
+                weighted_load=AgentLoad.weighted_load + load,
+                version=AgentLoad.version + 1)
+
+
+def _adjust(agent_id, tickets, load):
+    # Atomic increments, like stats._bump; version goes up so a concurrent
+    # route_ticket that read the old load retries instead of overfilling.
+    if agent_id is None or (not tickets and not load):
+        return
+    result = db.session.execute(
+        update(AgentLoad).where(AgentLoad.agent_id == agent_id).values(**_load_values(tickets, load))
+    )
+    if result.rowcount:
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(AgentLoad).values(
+                agent_id=agent_id, open_count=tickets, weighted_load=load, version=1,
+                capacity=current_app.config.get('AGENT_DEFAULT_CAPACITY', 20)))
+    except IntegrityError:
+        db.session.execute(
+            update(AgentLoad).where(AgentLoad.agent_id == agent_id).values(**_load_values(tickets, load))
+        )
+
+
+def ensure_agent(agent_id):
+    """Give a (new) agent a load row so routing can consider them. Caller commits."""
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(AgentLoad).values(
+                agent_id=agent_id, open_count=0, weighted_load=0, version=0,
+                capacity=current_app.config.get('AGENT_DEFAULT_CAPACITY', 20)))
+    except IntegrityError:
+        pass # already has one
+
+
+# --- Hooks called from routes.py, inside the same transaction as the change ---
+def record_assignment(ticket, previous_agent_id, new_agent_id):
+    """Call when ticket moves from previous_agent_id to new_agent_id (either may be None)."""
+    if previous_agent_id == new_agent_id or not is_open(ticket.status):
+        return
+    ticket_weight = weight(ticket.priority)
+    _adjust(previous_agent_id, -1, -ticket_weight)
+    _adjust(new_agent_id, 1, ticket_weight)
+
+
+def record_status_change(ticket, old_status):
+    """Call after ticket.status changed from old_status."""
+    was_open, now_open = is_open(old_status), is_open(ticket.status)
+    if was_open == now_open or ticket.agent_id is None:
+        return
+    delta = 1 if now_open else -1
+    _adjust(ticket.agent_id, delta, delta * weight(ticket.priority))
+
+
+def record_priority_change(ticket, old_priority):
+    """Call after ticket.priority changed from old_priority."""
+    if ticket.agent_id is None or not is_open(ticket.status):
+        return
+    _adjust(ticket.agent_id, 0, weight(ticket.priority) - weight(old_priority))
+
+
+def record_bulk_changes(changes):
+    """
+    Loads for many tickets at once (batch.py): `changes` are (before, after)
+    pairs of {'agent_id', 'status', 'priority'} values. Each agent's load is
+    adjusted once, by the sum over their tickets, in a single executemany
+    UPDATE (agents without a load row yet go through _adjust).
+    """
+    deltas = {}
+    for before, after in changes:
+        for values, sign in ((before, -1), (after, 1)):
+            if values['agent_id'] is not None and is_open(values['status']):
+                tickets, load = deltas.get(values['agent_id'], (0, 0))
+                deltas[values['agent_id']] = (tickets + sign, load + sign * weight(values['priority']))
+    # In agent order, so concurrent batches lock agent_load rows in the same order
+    deltas = {agent_id: delta for agent_id, delta in sorted(deltas.items()) if delta != (0, 0)}
+    if not deltas:
+        return
+    existing = set(db.session.execute(
+        select(AgentLoad.agent_id).where(AgentLoad.agent_id.in_(deltas))).scalars())
+    table = AgentLoad.__table__
+    rows = [{'b_agent_id': agent_id, 'b_tickets': tickets, 'b_load': load}
+            for agent_id, (tickets, load) in deltas.items() if agent_id in existing]
+    if rows:
+        db.session.execute(
+            table.update().where(table.c.agent_id == bindparam('b_agent_id'))
+            .values(open_count=table.c.open_count + bindparam('b_tickets'),
+                    weighted_load=table.c.weighted_load + bindparam('b_load'),
+                    version=table.c.version + 1),
+            rows)
+    for agent_id, (tickets, load) in deltas.items():
+        if agent_id not in existing:
+            _adjust(agent_id, tickets, load)
+
+
+# --- Routing new tickets ---
+def _candidates(category, respect_capacity, exclude=None):
+    skilled = exists().where(AgentSkill.agent_id == AgentLoad.agent_id, AgentSkill.category == category)
+    generalist = ~exists().where(AgentSkill.agent_id == AgentLoad.agent_id)
+    query = (
+        select(AgentLoad.agent_id, AgentLoad.version)
+        .join(User, User.id == AgentLoad.agent_id)
+        .where(User.is_agent == True, AgentLoad.capacity > 0, or_(skilled, generalist))
+    )
+    if exclude is not None:
+        query = query.where(AgentLoad.agent_id != exclude)
+    if respect_capacity:
+        query = query.where(AgentLoad.open_count < AgentLoad.capacity)
+    # Specialists first, then whoever is least busy relative to their capacity
+    return query.order_by(
+        case((skilled, 0), else_=1),
+        AgentLoad.weighted_load * 1.0 / AgentLoad.capacity,
+        AgentLoad.agent_id,
+    ).limit(CANDIDATES)
+
+
+def route_ticket(ticket):
+    """
+    Assign a new ticket to the best agent for its category and priority and
+    charge it to their load. Returns the agent id, or None if nobody has room
+    (the ticket then waits in the unassigned queue for claim_next). Call
+    after the ticket is flushed; the caller commits.
+
+    Taking an agent is an UPDATE conditional on the load version we read, so
+    when several tickets are routed at once only one of them gets a given
+    agent's last free slot and the others move on to the next candidate.
+    """
+    if not current_app.config.get('ROUTING_ENABLED', True):
+        return None
+    agent_id = _take_agent(ticket)
+    if agent_id is not None:
+        ticket.agent_id = agent_id
+    return agent_id
+
+
+def reroute_ticket(ticket):
+    """
+    Move an open ticket to the best agent other than its current one (SLA
+    escalation), moving its load with it. Returns the new agent id, or None
+    if nobody else can take it. The caller records stats and commits.
+    """
+    if not current_app.config.get('ROUTING_ENABLED', True) or not is_open(ticket.status):
+        return None
+    previous_agent_id = ticket.agent_id
+    agent_id = _take_agent(ticket, exclude=previous_agent_id)
+    if agent_id is not None:
+        _adjust(previous_agent_id, -1, -weight(ticket.priority))
+        ticket.agent_id = agent_id
+    return agent_id
+
+
+def _take_agent(ticket, exclude=None):
+    ticket_weight = weight(ticket.priority)
+    passes = (True, False) if ticket.priority in OVERFLOW_PRIORITIES else (True,)
+    for respect_capacity in passes:
+        for attempt in range(ATTEMPTS):
+            query = _candidates(ticket.category, respect_capacity, exclude)
+            if attempt:
+                # A plain re-read sees the transaction's snapshot (REPEATABLE
+                # READ) and the versions we just lost on; a locking read sees
+                # the current ones, skipping agents others are taking now.
+                query = query.with_for_update(of=AgentLoad, skip_locked=True)
+            candidates = db.session.execute(query).all()
+            if not candidates:
+                break
+            for agent_id, version in candidates:
+                taken = db.session.execute(
+                    update(AgentLoad)
+                    .where(AgentLoad.agent_id == agent_id, AgentLoad.version == version)
+                    .values(**_load_values(1, ticket_weight))
+                ).rowcount
+                if taken:
+                    return agent_id
+    return None
+
+
+# --- Claiming from the queue ---
+def queue_query(status, priority, skills=()):
+    """
+    The oldest unassigned ticket with this status and priority, in one of
+    `skills` (any category if empty), locked for claiming. A walk down
+    ix_ticket_agent_id_status_priority_date_posted: no sort, and Closed
+    tickets are never read.
+    """
+    query = select(Ticket.id).where(Ticket.agent_id.is_(None), Ticket.status == status, Ticket.priority == priority)
+    if skills:
+        query = query.where(Ticket.category.in_(skills))
+    return query.order_by(Ticket.date_posted, Ticket.id).limit(1).with_for_update(skip_locked=True)
+
+
+def queue_size_query():
+    return (select(func.count()).select_from(Ticket)
+            .where(Ticket.agent_id.is_(None), Ticket.status.in_(OPEN_STATUSES)))
+
+
+def queue_size():
+    """Unassigned open tickets: a count over the same index, Closed ones never read."""
+    return db.session.execute(queue_size_query()).scalar()
+
+
+def displayed_queue_size():
+    """
+    queue_size() for the agent dashboard, counted at most once per
+    ROUTING_QUEUE_SIZE_TTL seconds per worker: every agent's page load would
+    otherwise run the COUNT, and the number is only there to glance at.
+    """
+    cache = current_app.extensions.get('routing_queue_size')
+    if cache is None:
+        cache = TTLCache(maxsize=1, ttl=current_app.config.get('ROUTING_QUEUE_SIZE_TTL', 5))
+        current_app.extensions['routing_queue_size'] = cache
+    size = cache.get('queue_size')
+    if size is None:
+        size = queue_size()
+        cache.set('queue_size', size)
+    return size
+
+
+def claim_next(agent):
+    """
+    Assign the most urgent, oldest unassigned open ticket the agent is
+    skilled for to them and return it (None if the queue is empty). Within
+    a priority, Open tickets go before In Progress ones that lost their
+    agent. The caller records stats and commits.
+
+    SKIP LOCKED lets many agents claim at once without queueing on each
+    other's row locks; the UPDATE ... WHERE agent_id IS NULL guarantees a
+    ticket is only ever claimed once, also on databases that ignore SKIP
+    LOCKED (SQLite).
+    """
+    skills = db.session.execute(
+        select(AgentSkill.category).where(AgentSkill.agent_id == agent.id)
+    ).scalars().all()
+    # One indexed query per priority and open status rather than sorting
+    # the whole queue.
+    for priority in CLAIM_ORDER:
+        for status in OPEN_STATUSES:
+            for _ in range(ATTEMPTS):
+                ticket_id = db.session.execute(queue_query(status, priority, skills)).scalar()
+                if ticket_id is None:
+                    break
+                won = db.session.execute(
+                    update(Ticket)
+                    .where(Ticket.id == ticket_id, Ticket.agent_id.is_(None))
+                    .values(agent_id=agent.id, last_updated=datetime.utcnow())
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                if won:
+                    _adjust(agent.id, 1, weight(priority))
+                    return db.session.execute(
+                        select(Ticket).where(Ticket.id == ticket_id).execution_options(populate_existing=True)
+                    ).scalar_one()
+    return None
+
+
+# --- Maintenance ---
+def rebuild_agent_load():
+    """Recompute every agent's load from the ticket table, keeping capacities. Caller commits."""
+    capacities = dict(db.session.execute(select(AgentLoad.agent_id, AgentLoad.capacity)).all())
+    weights = case(PRIORITY_WEIGHTS, value=Ticket.priority, else_=1)
+    loads = {
+        agent_id: (count, int(total or 0))
+        for agent_id, count, total in db.session.execute(
+            select(Ticket.agent_id, func.count(Ticket.id), func.sum(weights))
+            .where(Ticket.agent_id.isnot(None), Ticket.status.in_(OPEN_STATUSES))
+            .group_by(Ticket.agent_id)
+        ).all()
+    }
+    agents = set(db.session.execute(
+        select(User.id).where((User.is_agent == True) | (User.is_admin == True))
+    ).scalars()) | set(loads)
+    default_capacity = current_app.config.get('AGENT_DEFAULT_CAPACITY', 20)
+    db.session.execute(AgentLoad.__table__.delete())
+    rows = [dict(agent_id=agent_id, open_count=loads.get(agent_id, (0, 0))[0],
+                 weighted_load=loads.get(agent_id, (0, 0))[1],
+                 capacity=capacities.get(agent_id, default_capacity), version=0)
+            for agent_id in sorted(agents)]
+    if rows:
+        db.session.execute(insert(AgentLoad), rows)
+    return len(rows)
+
+
+def _agent_by_email(email):
+    agent = User.query.filter_by(email=email).first()
+    if agent is None or not (agent.is_agent or agent.is_admin):
+        raise click.ClickException(f"No agent with email {email}")
+    return agent
+
+
+@routing_cli.command('rebuild')
+def rebuild_command():
+    """Recompute agent loads from the ticket table."""
+    count = rebuild_agent_load()
+    db.session.commit()
+    click.echo(f"Rebuilt load for {count} agents.")
+
+
+@routing_cli.command('skills')
+@click.argument('email')
+@click.argument('categories', nargs=-1)
+def skills_command(email, categories):
+    """Set the categories an agent handles (none = every category)."""
+    agent = _agent_by_email(email)
+    known = [value for value, label in TicketForm.category.kwargs['choices']]
+    unknown = [category for category in categories if category not in known]
+    if unknown:
+        raise click.ClickException(f"Unknown categories: {', '.join(unknown)}. Choose from: {', '.join(known)}")
+    AgentSkill.query.filter_by(agent_id=agent.id).delete()
+    db.session.add_all(AgentSkill(agent_id=agent.id, category=category) for category in set(categories))
+    ensure_agent(agent.id)
+    db.session.commit()
+    click.echo(f"{agent.username}: {', '.join(sorted(set(categories))) or 'all categories'}")
+
+
+@routing_cli.command('capacity')
+@click.argument('email')
+@click.argument('capacity', type=click.IntRange(min=0))
+def capacity_command(email, capacity):
+    """Set how many open tickets routing gives an agent (0 pauses them)."""
+    agent = _agent_by_email(email)
+    ensure_agent(agent.id)
+    db.session.execute(update(AgentLoad).where(AgentLoad.agent_id == agent.id)
+                       .values(capacity=capacity, version=AgentLoad.version + 1))
+    db.session.commit()
+    click.echo(f"{agent.username}: capacity {capacity}")
+
+
+@routing_cli.command('show')
+def show_command():
+    """List agents with their load, capacity and skills."""
+    skills = {}
+    for agent_id, category in db.session.execute(select(AgentSkill.agent_id, AgentSkill.category)).all():
+        skills.setdefault(agent_id, []).append(category)
+    rows = db.session.execute(
+        select(User.id, User.username, AgentLoad.open_count, AgentLoad.weighted_load, AgentLoad.capacity)
+        .join(User, User.id == AgentLoad.agent_id).order_by(User.username)
+    ).all()
+    for agent_id, username, open_count, weighted_load, capacity in rows:
+        click.echo(f"{username:<20} {open_count:>4}/{capacity:<4} load {weighted_load:<5} "
+                   f"{', '.join(sorted(skills.get(agent_id, []))) or 'all categories'}")
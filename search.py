@@ -0,0 +1,216 @@
+import re
+from collections import namedtuple
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DDL, bindparam, event, text
+
+from extensions import db
+
+DEFAULT_PER_PAGE = 20
+
+# ticket_ids are ordered best match first; has_more says whether another
+# page exists (we fetch one extra row rather than counting).
+SearchResults = namedtuple('SearchResults', ['ticket_ids', 'has_more'])
+
+search_cli = AppGroup('search', help='Manage the ticket search index.')
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+# The FTS5 table isn't a mapped model, so have db.create_all() create it on
+# SQLite alongside the real tables. Existing databases get it from the
+# 1b8631d9826a migration.
+FTS5_TABLE_DDL = DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS ticket_search USING fts5("
+    "title, body, ticket_id UNINDEXED, response_id UNINDEXED, is_internal UNINDEXED, "
+    "tokenize = 'porter unicode61')"
+)
+event.listen(db.metadata, 'after_create', FTS5_TABLE_DDL.execute_if(dialect='sqlite'))
+
+
+def search_terms(query):
+    """Split free text into plain word terms, dropping any query syntax."""
+    return _TERM_RE.findall(query or '')
+
+
+def _visibility(viewer):
+    """
+    SQL conditions mirroring view_ticket(): admins see everything, everyone
+    else only tickets they wrote or are assigned to. Internal notes are only
+    searchable by agents/admins.
+    """
+    ticket_filter = '' if viewer.is_admin else 'AND (t.user_id = :viewer_id OR t.agent_id = :viewer_id)'
+    include_internal = viewer.is_agent or viewer.is_admin
+    return ticket_filter, include_internal
+
+
+class SearchBackend:
+    """
+    Interface for ticket search. Backends rank matches across a ticket's
+    title, description and responses, and return ticket ids best-first.
+    """
+    name = None
+
+    def index_ticket(self, ticket):
+        """Called after a ticket is added, inside the same transaction."""
+
+    def index_response(self, response):
+        """Called after a response is added, inside the same transaction."""
+
+    def move_responses(self, from_ticket_ids, to_ticket_id):
+        """Called after responses were moved to another ticket (merges), inside the same transaction."""
+
+    def remove_tickets(self, ticket_ids):
+        """Called after tickets and their responses were archived, inside the same transaction."""
+
+    def rebuild(self):
+        """Rebuild the whole index from the ticket tables."""
+
+    def search(self, query, viewer, page=1, per_page=DEFAULT_PER_PAGE):
+        raise NotImplementedError
+
+
+class MySQLFulltextBackend(SearchBackend):
+    """
+    Uses InnoDB FULLTEXT indexes on ticket(title, description) and
+    ticket_response(content). InnoDB keeps those indexes current itself, so
+    the index_* and remove_tickets hooks have nothing to do. Relevance is InnoDB's BM25-based
+    score in natural language mode.
+    """
+    name = 'mysql'
+
+    def search(self, query, viewer, page=1, per_page=DEFAULT_PER_PAGE):
+        terms = search_terms(query)
+        if not terms:
+            return SearchResults([], False)
+        ticket_filter, include_internal = _visibility(viewer)
+        internal_filter = '' if include_internal else 'AND (r.is_internal_note = 0 OR r.is_internal_note IS NULL)'
+        sql = text(f"""
+            SELECT m.ticket_id, MAX(m.score) AS score FROM (
+                SELECT t.id AS ticket_id,
+                       MATCH(t.title, t.description) AGAINST (:q IN NATURAL LANGUAGE MODE) AS score
+                FROM ticket t
+                WHERE MATCH(t.title, t.description) AGAINST (:q IN NATURAL LANGUAGE MODE)
+                UNION ALL
+                SELECT r.ticket_id, MATCH(r.content) AGAINST (:q IN NATURAL LANGUAGE MODE) AS score
+                FROM ticket_response r
+                WHERE MATCH(r.content) AGAINST (:q IN NATURAL LANGUAGE MODE) {internal_filter}
+            ) AS m
+            JOIN ticket t ON t.id = m.ticket_id
+            WHERE 1 = 1 {ticket_filter}
+            GROUP BY m.ticket_id
+            ORDER BY score DESC, m.ticket_id DESC
+            LIMIT :limit OFFSET :offset
+        """)
+        rows = db.session.execute(sql, {
+            'q': ' '.join(terms), 'viewer_id': viewer.id,
+            'limit': per_page + 1, 'offset': (page - 1) * per_page,
+        }).fetchall()
+        return SearchResults([row[0] for row in rows[:per_page]], len(rows) > per_page)
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """
+    An FTS5 inverted index living next to the ticket tables in the same
+    SQLite database. One document per ticket (title + description) and one
+    per response; results are ranked with FTS5's bm25(), title weighted up.
+    Used for local development and tests.
+    """
+    name = 'fts5'
+
+    def index_ticket(self, ticket):
+        db.session.execute(text(
+            "INSERT INTO ticket_search (title, body, ticket_id, response_id, is_internal) "
+            "VALUES (:title, :body, :ticket_id, NULL, 0)"
+        ), {'title': ticket.title, 'body': ticket.description, 'ticket_id': ticket.id})
+
+    def index_response(self, response):
+        db.session.execute(text(
+            "INSERT INTO ticket_search (title, body, ticket_id, response_id, is_internal) "
+            "VALUES ('', :body, :ticket_id, :response_id, :is_internal)"
+        ), {'body': response.content, 'ticket_id': response.ticket_id,
+            'response_id': response.id, 'is_internal': 1 if response.is_internal_note else 0})
+
+    def move_responses(self, from_ticket_ids, to_ticket_id):
+        db.session.execute(
+            text("UPDATE ticket_search SET ticket_id = :to_ticket_id "
+                 "WHERE ticket_id IN :from_ticket_ids AND response_id IS NOT NULL")
+            .bindparams(bindparam('from_ticket_ids', expanding=True)),
+            {'from_ticket_ids': list(from_ticket_ids), 'to_ticket_id': to_ticket_id})
+
+    def remove_tickets(self, ticket_ids):
+        db.session.execute(
+            text("DELETE FROM ticket_search WHERE ticket_id IN :ticket_ids")
+            .bindparams(bindparam('ticket_ids', expanding=True)),
+            {'ticket_ids': list(ticket_ids)})
+
+    def rebuild(self):
+        db.session.execute(text("DELETE FROM ticket_search"))
+        db.session.execute(text(
+            "INSERT INTO ticket_search (title, body, ticket_id, response_id, is_internal) "
+            "SELECT title, description, id, NULL, 0 FROM ticket"
+        ))
+        db.session.execute(text(
+            "INSERT INTO ticket_search (title, body, ticket_id, response_id, is_internal) "
+            "SELECT '', content, ticket_id, id, COALESCE(is_internal_note, 0) FROM ticket_response"
+        ))
+
+    def search(self, query, viewer, page=1, per_page=DEFAULT_PER_PAGE):
+        terms = search_terms(query)
+        if not terms:
+            return SearchResults([], False)
+        # Quote every term so user input can't inject FTS5 query syntax;
+        # space-separated phrases are ANDed together.
+        match = ' '.join('"%s"' % term for term in terms)
+        ticket_filter, include_internal = _visibility(viewer)
+        internal_filter = '' if include_internal else 'AND m.is_internal = 0'
+        # bm25() is lower-is-better and only works in the query that does the
+        # MATCH, so score in a materialized CTE and keep each ticket's best hit.
+        sql = text(f"""
+            WITH m AS MATERIALIZED (
+                SELECT ticket_id, is_internal, bm25(ticket_search, 10.0, 1.0) AS score
+                FROM ticket_search WHERE ticket_search MATCH :match
+            )
+            SELECT m.ticket_id, MIN(m.score) AS score FROM m
+            JOIN ticket t ON t.id = m.ticket_id
+            WHERE 1 = 1 {internal_filter} {ticket_filter}
+            GROUP BY m.ticket_id
+            ORDER BY score ASC, m.ticket_id DESC
+            LIMIT :limit OFFSET :offset
+        """)
+        rows = db.session.execute(sql, {
+            'match': match, 'viewer_id': viewer.id,
+            'limit': per_page + 1, 'offset': (page - 1) * per_page,
+        }).fetchall()
+        return SearchResults([row[0] for row in rows[:per_page]], len(rows) > per_page)
+
+
+BACKENDS = {
+    MySQLFulltextBackend.name: MySQLFulltextBackend,
+    SQLiteFTSBackend.name: SQLiteFTSBackend,
+}
+
+
+def get_search_backend():
+    """
+    Return the configured backend (SEARCH_BACKEND), defaulting to whatever
+    matches the database: FULLTEXT on MySQL, FTS5 on SQLite.
+    """
+    backend = current_app.extensions.get('search_backend')
+    if backend is None:
+        name = current_app.config.get('SEARCH_BACKEND')
+        if not name:
+            name = 'fts5' if db.engine.dialect.name == 'sqlite' else 'mysql'
+        backend = BACKENDS[name]()
+        current_app.extensions['search_backend'] = backend
+    return backend
+
+
+@search_cli.command('reindex')
+def reindex_command():
+    """Rebuild the search index from all tickets and responses."""
+    backend = get_search_backend()
+    backend.rebuild()
+    db.session.commit()
+    click.echo(f"Rebuilt {backend.name} search index.")
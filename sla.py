@@ -0,0 +1,251 @@
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select, update
+
+import audit
+import events
+import notifications
+import routing
+import stats
+from extensions import db
+from models import Ticket, User
+from replicas import replica_reads
+
+# Escalating a priority moves it one step up this list
+PRIORITY_ORDER = ('Low', 'Medium', 'High', 'Urgent')
+DEFAULT_POLICIES = {'Urgent': 4, 'High': 24, 'Medium': 72, 'Low': 168}
+DEFAULT_ESCALATIONS = ('notify', 'bump_priority', 'reassign')
+
+sla_cli = AppGroup('sla', help='SLA deadlines and escalations.')
+
+
+# --- Policies ---
+def policy_hours(priority, category=None, config=None):
+    """Hours a ticket of this priority/category may wait for staff."""
+    config = config if config is not None else current_app.config
+    overrides = config.get('SLA_CATEGORY_POLICIES', {})
+    if (category, priority) in overrides:
+        return overrides[(category, priority)]
+    policies = config.get('SLA_POLICIES', DEFAULT_POLICIES)
+    return policies.get(priority, policies.get('Low', DEFAULT_POLICIES['Low']))
+
+
+def due_at(priority, category, status, since, config=None):
+    """The deadline for a ticket whose clock started at `since` (None if closed)."""
+    if not routing.is_open(status):
+        return None
+    return since + timedelta(hours=policy_hours(priority, category, config))
+
+
+# --- Hooks called from routes.py, inside the same transaction as the change ---
+# Staff activity (a public reply, a status change) restarts the clock and
+# clears any escalation; customer replies don't buy the agent more time.
+def start(ticket, now=None):
+    """(Re)start the ticket's SLA clock at `now` (default: ticket.last_updated)."""
+    ticket.sla_due_at = due_at(ticket.priority, ticket.category, ticket.status,
+                               now or ticket.last_updated or datetime.utcnow())
+    ticket.sla_level = 0
+
+
+def record_response(response, by_staff):
+    if by_staff and not response.is_internal_note:
+        start(response.ticket)
+
+
+def record_status_change(ticket, old_status):
+    if old_status != ticket.status:
+        start(ticket)
+
+
+# --- Escalation ---
+def _bump_priority(ticket):
+    if ticket.priority not in PRIORITY_ORDER or ticket.priority == PRIORITY_ORDER[-1]:
+        return False
+    old_priority = ticket.priority
+    ticket.priority = PRIORITY_ORDER[PRIORITY_ORDER.index(old_priority) + 1]
+    stats.record_priority_change(old_priority, ticket.priority)
+    routing.record_priority_change(ticket, old_priority)
+    return True
+
+
+def _reassign(ticket):
+    previous_agent_id = ticket.agent_id
+    if routing.reroute_ticket(ticket) is None:
+        return False
+    stats.record_assignment(previous_agent_id, ticket.agent_id)
+    return True
+
+
+def escalate(ticket, now):
+    """
+    Apply the next escalation step to a ticket past its deadline and give it
+    a new one. Returns the action taken ('notify' when the step had nothing
+    to do, e.g. raising an Urgent ticket). Caller commits.
+    """
+    config = current_app.config
+    steps = config.get('SLA_ESCALATIONS', DEFAULT_ESCALATIONS)
+    level = ticket.sla_level + 1
+    missed = ticket.sla_due_at
+    # Past the last step we keep reminding, once per policy period
+    step = steps[level - 1] if level <= len(steps) else 'notify'
+    action = 'notify'
+    old_priority, old_agent_id = ticket.priority, ticket.agent_id
+    if step == 'bump_priority' and _bump_priority(ticket):
+        action = step
+        audit.record_change(ticket, None, 'priority', old_priority, ticket.priority, now)
+    elif step == 'reassign' and _reassign(ticket):
+        action = step
+        audit.record_change(ticket, None, 'agent', old_agent_id, ticket.agent_id, now)
+    if action != 'notify':
+        ticket.last_updated = now
+    ticket.sla_level = level
+    ticket.sla_due_at = due_at(ticket.priority, ticket.category, ticket.status, now, config)
+    # By id: ticket.agent may still be the agent we just moved it away from
+    agent = db.session.get(User, ticket.agent_id) if ticket.agent_id else None
+    recipients = [agent.email if agent else None] + list(config.get('SLA_ESCALATION_RECIPIENTS', []))
+    notifications.enqueue_sla_breach(ticket, recipients, level, action, missed)
+    return action
+
+
+def due_query(now, limit):
+    """The earliest `limit` deadlines at or before now, locked for escalating: a range scan on ix_ticket_sla_due_at."""
+    return (select(Ticket.id).where(Ticket.sla_due_at <= now)
+            .order_by(Ticket.sla_due_at).limit(limit).with_for_update(skip_locked=True))
+
+
+class SLAScheduler:
+    """
+    Fires escalations for tickets whose sla_due_at has passed. The queue is
+    the indexed sla_due_at column itself: each batch is an index range scan
+    for the earliest deadlines, claimed with SKIP LOCKED so several
+    schedulers can run side by side, and the loop sleeps until the next
+    deadline instead of polling the ticket table. `clock` and `sleep` are
+    injectable for tests.
+    """
+
+    def __init__(self, batch_size=500, poll_interval=60, clock=datetime.utcnow, sleep=time.sleep):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.sleep = sleep
+
+    def claim(self, now):
+        ids = db.session.execute(due_query(now, self.batch_size)).scalars().all()
+        if not ids:
+            return []
+        return Ticket.query.filter(Ticket.id.in_(ids)).order_by(Ticket.sla_due_at).all()
+
+    def run_batch(self):
+        """Escalate one batch and commit. Returns {ticket id: action}."""
+        now = self.clock()
+        tickets = self.claim(now)
+        previous_agents = {ticket.id: ticket.agent_id for ticket in tickets}
+        actions = {}
+        for ticket in tickets:
+            if routing.is_open(ticket.status):
+                actions[ticket.id] = escalate(ticket, now)
+            else:
+                ticket.sla_due_at = None # closed outside the hooks (e.g. a script)
+        db.session.commit()
+        for ticket in tickets:
+            if actions.get(ticket.id) == 'reassign':
+                events.publish_ticket_event(events.ASSIGNED, ticket, previous_agent_id=previous_agents[ticket.id])
+        return actions
+
+    def run_once(self):
+        """Escalate everything that is due now. Returns {ticket id: action}."""
+        actions = {}
+        while True:
+            batch = self.run_batch()
+            actions.update(batch)
+            if len(batch) < self.batch_size:
+                return actions
+
+    def seconds_until_next(self):
+        """Seconds until the earliest deadline, capped at poll_interval."""
+        next_due = db.session.execute(select(func.min(Ticket.sla_due_at))).scalar()
+        db.session.commit() # don't hold a snapshot while we sleep
+        if next_due is None:
+            return self.poll_interval
+        return max(0.0, min(self.poll_interval, (next_due - self.clock()).total_seconds()))
+
+    def run(self, iterations=None):
+        """Yield run_once() results, sleeping until the next deadline in between."""
+        while True:
+            yield self.run_once()
+            if iterations is not None:
+                iterations -= 1
+                if iterations <= 0:
+                    return
+            self.sleep(self.seconds_until_next())
+
+
+# --- Maintenance ---
+def rebuild_sla(batch_size=1000):
+    """
+    Recompute every open ticket's deadline from its last_updated, clearing
+    escalation levels; closed tickets get none. Walks the open tickets by
+    primary key, one executemany UPDATE per batch. Caller commits.
+    """
+    config = current_app.config
+    db.session.execute(
+        update(Ticket).where(Ticket.status.notin_(routing.OPEN_STATUSES), Ticket.sla_due_at.isnot(None))
+        .values(sla_due_at=None, sla_level=0).execution_options(synchronize_session=False)
+    )
+    last_id, count = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Ticket.id, Ticket.priority, Ticket.category, Ticket.status, Ticket.last_updated)
+            .where(Ticket.status.in_(routing.OPEN_STATUSES), Ticket.id > last_id)
+            .order_by(Ticket.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return count
+        db.session.execute(update(Ticket), [
+            {'id': row.id, 'sla_level': 0,
+             'sla_due_at': due_at(row.priority, row.category, row.status, row.last_updated, config)}
+            for row in rows
+        ])
+        last_id, count = rows[-1].id, count + len(rows)
+
+
+@sla_cli.command('run')
+@click.option('--once', is_flag=True, help='Escalate what is due now and exit.')
+@click.option('--batch-size', type=int, help='Tickets escalated per transaction.')
+@click.option('--poll-interval', type=float, default=60.0, show_default=True,
+              help='Longest sleep between checks; new tickets are never due sooner than their policy.')
+def run_command(once, batch_size, poll_interval):
+    """Fire SLA escalations as deadlines pass."""
+    if not current_app.config.get('SLA_ENABLED', True):
+        raise click.ClickException('SLA_ENABLED is off.')
+    scheduler = SLAScheduler(batch_size=batch_size or current_app.config.get('SLA_BATCH_SIZE', 500),
+                             poll_interval=poll_interval)
+    for actions in scheduler.run(iterations=1 if once else None):
+        if actions:
+            summary = {action: list(actions.values()).count(action) for action in set(actions.values())}
+            click.echo(f"escalated {len(actions)} tickets: "
+                       + ', '.join(f"{action} {count}" for action, count in sorted(summary.items())))
+
+
+@sla_cli.command('rebuild')
+def rebuild_command():
+    """Recompute SLA deadlines for every open ticket."""
+    count = rebuild_sla()
+    db.session.commit()
+    click.echo(f"Set SLA deadlines for {count} open tickets.")
+
+
+@sla_cli.command('breached')
+@click.option('--limit', type=int, default=50, show_default=True)
+def breached_command(limit):
+    """List escalated tickets, most escalated first."""
+    with replica_reads():
+        tickets = (Ticket.query.filter(Ticket.sla_level > 0, Ticket.status.in_(routing.OPEN_STATUSES))
+                   .order_by(Ticket.sla_level.desc(), Ticket.sla_due_at).limit(limit).all())
+    for ticket in tickets:
+        due = ticket.sla_due_at.strftime('%Y-%m-%d %H:%M') if ticket.sla_due_at else '-'
+        click.echo(f"#{ticket.id:<8} level {ticket.sla_level:<3} {ticket.priority:<7} next {due}  {ticket.title}")
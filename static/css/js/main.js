@@ -1,2 +0,0 @@
-// You can add interactive JavaScript here later
-console.log("main.js loaded");
\ No newline at end of file
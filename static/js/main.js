@@ -0,0 +1,214 @@
+// You can add interactive JavaScript here later
+console.log("main.js loaded");
+
+// --- "Load older responses" on the ticket page ---
+// The server renders only the newest responses. Each click fetches the page
+// before the oldest one shown (an HTML fragment) and puts it above the rest;
+// the X-Next-Url header says where the following page is, if any.
+(function () {
+    var button = document.querySelector('.load-older-responses');
+    if (!button || !window.fetch) {
+        return;
+    }
+    button.addEventListener('click', function () {
+        button.disabled = true;
+        fetch(button.dataset.url, {credentials: 'same-origin'})
+            .then(function (response) {
+                if (!response.ok) {
+                    throw new Error('HTTP ' + response.status);
+                }
+                return response.text().then(function (html) {
+                    return {html: html, next: response.headers.get('X-Next-Url')};
+                });
+            })
+            .then(function (page) {
+                button.insertAdjacentHTML('afterend', page.html);
+                if (page.next) {
+                    button.dataset.url = page.next;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            })
+            .catch(function () {
+                button.disabled = false;
+            });
+    });
+})();
+
+// --- Live ticket updates (server-sent events from /events) ---
+// Pages that want updates include <div id="live-updates" data-url="...">.
+// Dashboards patch the matching list items; the ticket page patches its
+// header and appends new responses. Nothing here re-fetches the page unless
+// the server tells us we missed events.
+(function () {
+    var marker = document.getElementById('live-updates');
+    if (!marker || !window.EventSource) {
+        return;
+    }
+
+    var STATUS_CLASSES = {
+        'Open': 'bg-secondary',
+        'In Progress': 'bg-info',
+        'Resolved': 'bg-success',
+        'Closed': 'bg-dark'
+    };
+
+    function formatDate(iso) {
+        // Matches strftime('%Y-%m-%d %H:%M') in the templates
+        return iso.replace('T', ' ').slice(0, 16);
+    }
+
+    function setStatus(badge, status) {
+        Object.keys(STATUS_CLASSES).forEach(function (key) {
+            badge.classList.remove(STATUS_CLASSES[key]);
+        });
+        if (STATUS_CLASSES[status]) {
+            badge.classList.add(STATUS_CLASSES[status]);
+        }
+        badge.textContent = status;
+    }
+
+    function patchTicket(root, ticket) {
+        root.querySelectorAll('.ticket-status').forEach(function (badge) {
+            setStatus(badge, ticket.status);
+        });
+        root.querySelectorAll('.ticket-agent').forEach(function (agent) {
+            agent.textContent = ticket.agent || 'Unassigned';
+        });
+        root.querySelectorAll('.ticket-last-updated').forEach(function (updated) {
+            updated.textContent = formatDate(ticket.last_updated);
+        });
+    }
+
+    function buildTicketItem(ticket) {
+        var item = document.createElement('a');
+        item.href = '/ticket/' + ticket.id;
+        item.className = 'list-group-item list-group-item-action mb-2';
+        item.dataset.ticketId = ticket.id;
+
+        var header = document.createElement('div');
+        header.className = 'd-flex w-100 justify-content-between';
+        var title = document.createElement('h5');
+        title.className = 'mb-1';
+        title.textContent = ticket.title;
+        var date = document.createElement('small');
+        date.className = 'text-muted';
+        date.textContent = formatDate(ticket.date_posted);
+        header.appendChild(title);
+        header.appendChild(date);
+
+        var status = document.createElement('p');
+        status.className = 'mb-1';
+        status.textContent = 'Status: ';
+        var badge = document.createElement('span');
+        badge.className = 'badge ticket-status';
+        setStatus(badge, ticket.status);
+        status.appendChild(badge);
+
+        var byline = document.createElement('small');
+        byline.className = 'text-muted';
+        byline.textContent = 'By: ' + ticket.author + ' | Assigned: ';
+        var agent = document.createElement('span');
+        agent.className = 'ticket-agent';
+        agent.textContent = ticket.agent || 'Unassigned';
+        byline.appendChild(agent);
+
+        item.appendChild(header);
+        item.appendChild(status);
+        item.appendChild(byline);
+        return item;
+    }
+
+    function onDashboardEvent(type, data) {
+        var items = document.querySelectorAll('[data-ticket-id="' + data.ticket.id + '"]');
+        if (items.length) {
+            items.forEach(function (item) { patchTicket(item, data.ticket); });
+            return;
+        }
+        // New tickets only belong at the top of the first page
+        if (type === 'ticket-created' && window.location.search.indexOf('cursor=') === -1) {
+            var list = document.querySelector('.ticket-list');
+            if (!list) {
+                window.location.reload();
+                return;
+            }
+            list.insertBefore(buildTicketItem(data.ticket), list.firstChild);
+        }
+    }
+
+    function buildResponseCard(response) {
+        var card = document.createElement('div');
+        card.className = 'card mb-3 ' + (response.is_internal_note ? 'bg-light border-warning' : 'border-primary');
+        card.dataset.responseId = response.id;
+        var body = document.createElement('div');
+        body.className = 'card-body';
+
+        var header = document.createElement('div');
+        header.className = 'd-flex w-100 justify-content-between';
+        var who = document.createElement('h6');
+        who.className = 'mb-1';
+        if (response.author_is_staff) {
+            var staff = document.createElement('span');
+            staff.className = 'badge bg-secondary';
+            staff.textContent = 'Agent';
+            who.appendChild(staff);
+            who.appendChild(document.createTextNode(' '));
+        }
+        who.appendChild(document.createTextNode(response.author));
+        if (response.is_internal_note) {
+            var note = document.createElement('span');
+            note.className = 'badge bg-warning text-dark';
+            note.textContent = 'Internal Note';
+            who.appendChild(document.createTextNode(' '));
+            who.appendChild(note);
+        }
+        var date = document.createElement('small');
+        date.className = 'text-muted';
+        date.textContent = formatDate(response.date_posted);
+        header.appendChild(who);
+        header.appendChild(date);
+
+        var content = document.createElement('p');
+        content.className = 'card-text';
+        content.textContent = response.content;
+
+        body.appendChild(header);
+        body.appendChild(content);
+        card.appendChild(body);
+        return card;
+    }
+
+    function onTicketEvent(type, data) {
+        patchTicket(document, data.ticket);
+        if (type === 'new-response') {
+            var responses = document.getElementById('responses');
+            if (!responses || responses.querySelector('[data-response-id="' + data.response.id + '"]')) {
+                return;
+            }
+            var empty = responses.querySelector('.no-responses');
+            if (empty) {
+                empty.remove();
+            }
+            responses.appendChild(buildResponseCard(data.response));
+        }
+    }
+
+    var onTicketPage = !!document.getElementById('responses');
+    var source = new EventSource(marker.dataset.url);
+    ['ticket-created', 'status-changed', 'assigned', 'new-response'].forEach(function (type) {
+        source.addEventListener(type, function (event) {
+            var data = JSON.parse(event.data);
+            if (onTicketPage) {
+                onTicketEvent(type, data);
+            } else {
+                onDashboardEvent(type, data);
+            }
+        });
+    });
+    // The server dropped events for us (we fell behind); start from fresh HTML
+    source.addEventListener('resync', function () {
+        source.close();
+        window.location.reload();
+    });
+})();
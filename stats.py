@@ -0,0 +1,179 @@
+from collections import defaultdict
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, case, func, insert, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Ticket, TicketArchive, TicketStat, User
+
+# Dimensions we keep counters for. 'agent' values are user ids as strings,
+# with UNASSIGNED standing in for tickets nobody has picked up yet.
+DIMENSIONS = ('status', 'priority', 'category', 'agent')
+UNASSIGNED = 'unassigned'
+
+stats_cli = AppGroup('stats', help='Maintain the materialized ticket counters.')
+
+
+def _agent_key(agent_id):
+    return str(agent_id) if agent_id is not None else UNASSIGNED
+
+
+def _empty_counts():
+    return {dimension: defaultdict(int) for dimension in DIMENSIONS}
+
+
+# --- Live aggregation ---
+def aggregate_ticket_counts():
+    """
+    Count tickets by status, priority, category and agent in a single grouped
+    query, archived tickets (ticket_archive) included. This is the source of
+    truth the materialized counters are rebuilt from; the dashboard itself
+    reads ticket_stats instead.
+    """
+    counts = _empty_counts()
+    tickets = union_all(
+        select(Ticket.status, Ticket.priority, Ticket.category, Ticket.agent_id),
+        select(TicketArchive.status, TicketArchive.priority, TicketArchive.category, TicketArchive.agent_id),
+    ).subquery()
+    rows = db.session.execute(
+        select(tickets.c.status, tickets.c.priority, tickets.c.category, tickets.c.agent_id, func.count())
+        .group_by(tickets.c.status, tickets.c.priority, tickets.c.category, tickets.c.agent_id)
+    ).all()
+    for status, priority, category, agent_id, count in rows:
+        counts['status'][status] += count
+        counts['priority'][priority] += count
+        counts['category'][category] += count
+        counts['agent'][_agent_key(agent_id)] += count
+    return counts
+
+
+def user_counts():
+    """Return (total users, agents incl. admins) in one round trip."""
+    total, agents = db.session.query(
+        func.count(User.id),
+        func.coalesce(func.sum(case(((User.is_agent == True) | (User.is_admin == True), 1), else_=0)), 0)
+    ).one()
+    return total, int(agents)
+
+
+# --- Materialized counters ---
+def rebuild_ticket_stats():
+    """Recompute ticket_stats from the ticket table. Caller commits."""
+    counts = aggregate_ticket_counts()
+    db.session.query(TicketStat).delete()
+    db.session.add_all(
+        TicketStat(dimension=dimension, value=value, count=count)
+        for dimension, values in counts.items()
+        for value, count in values.items()
+    )
+    return counts
+
+
+def read_ticket_stats():
+    """
+    Read every counter row in one query; counters without a row read as 0.
+    The table is seeded by its migration; after truncating it or loading
+    tickets behind the hooks' back, run `flask stats rebuild`.
+    """
+    counts = _empty_counts()
+    for row in TicketStat.query.all():
+        if row.dimension in counts:
+            counts[row.dimension][row.value] = row.count
+    return counts
+
+
+def _bump(dimension, value, delta):
+    # UPDATE ... SET count = count + delta is atomic in the database, so two
+    # workers bumping the same counter can't lose an increment.
+    result = db.session.execute(
+        update(TicketStat)
+        .where(TicketStat.dimension == dimension, TicketStat.value == value)
+        .values(count=TicketStat.count + delta)
+    )
+    if result.rowcount:
+        return
+    # First ticket with this value: create the row. Another worker may beat
+    # us to it, in which case fall back to the increment.
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(TicketStat).values(dimension=dimension, value=value, count=delta))
+    except IntegrityError:
+        db.session.execute(
+            update(TicketStat)
+            .where(TicketStat.dimension == dimension, TicketStat.value == value)
+            .values(count=TicketStat.count + delta)
+        )
+
+
+# --- Hooks called from routes.py, inside the same transaction as the change ---
+def record_ticket_created(ticket):
+    _bump('status', ticket.status, 1)
+    _bump('priority', ticket.priority, 1)
+    _bump('category', ticket.category, 1)
+    _bump('agent', _agent_key(ticket.agent_id), 1)
+
+
+def record_status_change(old_status, new_status):
+    if old_status == new_status:
+        return
+    _bump('status', old_status, -1)
+    _bump('status', new_status, 1)
+
+
+def record_priority_change(old_priority, new_priority):
+    if old_priority == new_priority:
+        return
+    _bump('priority', old_priority, -1)
+    _bump('priority', new_priority, 1)
+
+
+def record_assignment(old_agent_id, new_agent_id):
+    if old_agent_id == new_agent_id:
+        return
+    _bump('agent', _agent_key(old_agent_id), -1)
+    _bump('agent', _agent_key(new_agent_id), 1)
+
+
+def record_bulk_changes(changes):
+    """
+    The counters for many tickets at once (batch.py): `changes` are
+    (before, after) pairs of {'status', 'priority', 'agent_id'} values.
+    Deltas are summed first, and the existing counters are all bumped by a
+    single executemany UPDATE; only new ones go through _bump.
+    """
+    deltas = defaultdict(int)
+    for before, after in changes:
+        for dimension, field, key in (('status', 'status', str), ('priority', 'priority', str),
+                                      ('agent', 'agent_id', _agent_key)):
+            if before[field] != after[field]:
+                deltas[dimension, key(before[field])] -= 1
+                deltas[dimension, key(after[field])] += 1
+    deltas = {key: delta for key, delta in sorted(deltas.items()) if delta}
+    if not deltas:
+        return
+    existing = {tuple(row) for row in db.session.execute(
+        select(TicketStat.dimension, TicketStat.value)
+        .where(TicketStat.dimension.in_({dimension for dimension, value in deltas}))
+    )}
+    table = TicketStat.__table__
+    rows = [{'b_dimension': dimension, 'b_value': value, 'b_delta': delta}
+            for (dimension, value), delta in deltas.items() if (dimension, value) in existing]
+    if rows:
+        db.session.execute(
+            table.update()
+            .where(table.c.dimension == bindparam('b_dimension'), table.c.value == bindparam('b_value'))
+            .values(count=table.c.count + bindparam('b_delta')),
+            rows)
+    for (dimension, value), delta in deltas.items():
+        if (dimension, value) not in existing:
+            _bump(dimension, value, delta)
+
+
+@stats_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild ticket_stats from scratch."""
+    counts = rebuild_ticket_stats()
+    db.session.commit()
+    click.echo(f"Rebuilt ticket stats for {sum(counts['status'].values())} tickets.")
@@ -0,0 +1,126 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from flask.testing import FlaskClient
+from sqlalchemy import select
+
+from app import create_app
+from extensions import db as _db
+from models import Ticket, TicketResponse, User
+
+CATEGORIES = ('Technical Issue', 'Billing', 'Account Management', 'Feature Request', 'Other')
+PRIORITIES = ('Low', 'Medium', 'High', 'Urgent')
+STATUSES = ('Open', 'In Progress', 'Resolved', 'Closed')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: spawns fresh interpreters; deselect with -m "not slow"')
+
+
+class Clock:
+    """A settable stand-in for datetime.utcnow, for the `clock` parameters."""
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, **delta):
+        self.now += timedelta(**delta)
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+                     ROUTING_ENABLED=False)
+    with app.app_context():
+        _db.create_all()
+        yield app
+        _db.session.remove()
+
+
+@pytest.fixture
+def db(app):
+    return _db
+
+
+@pytest.fixture
+def users(db):
+    """An admin, two agents and two customers, by role."""
+    people = {
+        'admin': User(username='admin', email='admin@example.com', password='x', is_admin=True),
+        'agent': User(username='agent', email='agent@example.com', password='x', is_agent=True),
+        'other_agent': User(username='other', email='other@example.com', password='x', is_agent=True),
+        'customer': User(username='customer', email='customer@example.com', password='x'),
+        'other_customer': User(username='customer2', email='customer2@example.com', password='x'),
+    }
+    db.session.add_all(people.values())
+    db.session.commit()
+    return people
+
+
+def make_ticket(db, author, **values):
+    values.setdefault('title', 'Printer on floor 3 keeps jamming')
+    values.setdefault('description', 'Every print job jams after the first page since this morning.')
+    values.setdefault('category', 'Technical Issue')
+    ticket = Ticket(user_id=author.id, **values)
+    db.session.add(ticket)
+    db.session.flush()
+    return ticket
+
+
+def respond(db, ticket, author, content='Have you tried turning it off and on again?'):
+    response = TicketResponse(ticket_id=ticket.id, user_id=author.id, content=content)
+    db.session.add(response)
+    db.session.flush()
+    return response
+
+
+class RequestClient(FlaskClient):
+    """
+    Runs each request in its own app context, as in production. Otherwise it
+    would reuse the app fixture's, and with it flask.g (Flask-Login's cached
+    user) and the database session.
+    """
+
+    def open(self, *args, **kwargs):
+        with self.application.app_context():
+            return super().open(*args, **kwargs)
+
+
+def client_for(app, user):
+    """A test client logged in as `user`, without going through bcrypt."""
+    client = RequestClient(app, app.response_class, use_cookies=True)
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user.id)
+        session['_fresh'] = True
+    return client
+
+
+@pytest.fixture
+def seeded(db, users):
+    """
+    A few hundred customers and a few thousand tickets over a year with
+    every status, priority and assignment.
+    """
+    rng = random.Random(7)
+    start = datetime(2024, 1, 1)
+    db.session.execute(User.__table__.insert(), [
+        dict(username=f'seeded{i}', email=f'seeded{i}@example.com', password='x', is_agent=False, is_admin=False)
+        for i in range(500)])
+    agents = [users['agent'].id, users['other_agent'].id, None]
+    authors = [users['customer'].id, users['other_customer'].id] + list(db.session.execute(
+        select(User.id).where(User.username.like('seeded%'))).scalars())
+    rows = []
+    for _ in range(3000):
+        posted = start + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        status = rng.choice(STATUSES)
+        rows.append(dict(title='Seeded ticket', description='Seeded description', category=rng.choice(CATEGORIES),
+                         priority=rng.choice(PRIORITIES), status=status, user_id=rng.choice(authors),
+                         agent_id=rng.choice(agents), date_posted=posted, last_updated=posted,
+                         sla_due_at=posted + timedelta(days=1) if status in ('Open', 'In Progress') else None))
+    db.session.execute(Ticket.__table__.insert(), rows)
+    db.session.commit()
+    return users
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+
+import archive
+from models import Ticket, TicketArchive
+
+from conftest import make_ticket, respond
+
+
+def test_archive_and_restore_round_trip(db, users):
+    now = datetime(2025, 1, 1)
+    old = now - timedelta(days=400)
+    closed = make_ticket(db, users['customer'], status='Closed', date_posted=old, last_updated=old)
+    respond(db, closed, users['agent'], content='Fixed by replacing the fuser.')
+    still_open = make_ticket(db, users['customer'], date_posted=old, last_updated=old)
+    db.session.commit()
+    closed_id = closed.id
+
+    result = archive.archive_tickets(365, now=now)
+
+    assert (result.tickets, result.responses) == (1, 1)
+    assert db.session.get(Ticket, closed_id) is None
+    assert db.session.get(Ticket, still_open.id) is not None
+    view = archive.ticket_view(db.session.get(TicketArchive, closed_id), users['customer'])
+    assert [response.content for response in view.responses] == ['Fixed by replacing the fuser.']
+
+    assert archive.restore_tickets([closed_id], now=now) == [closed_id]
+
+    restored = db.session.get(Ticket, closed_id)
+    assert (restored.status, restored.last_updated) == ('Closed', now)
+    assert [response.content for response in restored.responses] == ['Fixed by replacing the fuser.']
+    assert db.session.get(TicketArchive, closed_id) is None
+
+
+def test_restore_ignores_tickets_that_are_not_archived(db, users):
+    ticket = make_ticket(db, users['customer'])
+    db.session.commit()
+
+    assert archive.restore_tickets([ticket.id, 12345]) == []
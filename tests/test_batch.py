@@ -0,0 +1,34 @@
+import pytest
+
+import batch
+from models import Ticket, TicketResponse
+
+from conftest import make_ticket, respond
+
+
+def test_merge_moves_responses_and_closes_duplicates(db, users):
+    canonical = make_ticket(db, users['customer'])
+    duplicate = make_ticket(db, users['customer'])
+    respond(db, duplicate, users['agent'])
+    db.session.commit()
+
+    result = batch.merge_tickets(canonical.id, [duplicate.id], users['agent'])
+
+    assert (result.changed, result.moved) == (1, 1)
+    merged = db.session.get(Ticket, duplicate.id)
+    assert (merged.status, merged.merged_into_id) == (batch.MERGED_STATUS, canonical.id)
+    assert TicketResponse.query.filter_by(ticket_id=canonical.id).count() == 1
+
+
+def test_merge_refuses_another_customers_ticket(db, users):
+    canonical = make_ticket(db, users['customer'])
+    other = make_ticket(db, users['other_customer'])
+    respond(db, other, users['other_customer'])
+    db.session.commit()
+
+    with pytest.raises(batch.BatchError):
+        batch.merge_tickets(canonical.id, [other.id], users['agent'])
+
+    db.session.rollback()
+    assert db.session.get(Ticket, other.id).merged_into_id is None
+    assert TicketResponse.query.filter_by(ticket_id=other.id).count() == 1
@@ -0,0 +1,51 @@
+from datetime import timedelta
+
+from flask import render_template_string
+from flask_login import login_user
+
+import events
+from fragment_cache import get_fragment_cache
+
+from conftest import make_ticket
+
+ROW = "{% call cached_fragment('row', ticket) %}{{ ticket.title }} for {{ current_user.username }}{% endcall %}"
+
+
+def render_row(app, ticket, viewer):
+    with app.test_request_context():
+        login_user(viewer)
+        return render_template_string(ROW, ticket=ticket)
+
+
+def test_row_is_rendered_again_once_last_updated_moves(app, db, users):
+    ticket = make_ticket(db, users['customer'], title='Printer jams')
+    db.session.commit()
+    assert render_row(app, ticket, users['admin']) == 'Printer jams for admin'
+
+    ticket.title = 'Printer on fire' # last_updated unchanged: still the cached row
+    assert render_row(app, ticket, users['admin']) == 'Printer jams for admin'
+
+    ticket.last_updated += timedelta(seconds=1)
+    assert render_row(app, ticket, users['admin']) == 'Printer on fire for admin'
+
+
+def test_rows_are_cached_per_viewer_role(app, db, users):
+    ticket = make_ticket(db, users['customer'])
+    db.session.commit()
+
+    assert render_row(app, ticket, users['admin']).endswith('for admin')
+    assert render_row(app, ticket, users['agent']).endswith('for agent')
+    # Same role, same entry: the agents share one rendering
+    assert render_row(app, ticket, users['other_agent']).endswith('for agent')
+    assert render_row(app, ticket, users['customer']).endswith('for customer')
+
+
+def test_published_event_drops_the_local_entry(app, db, users):
+    ticket = make_ticket(db, users['customer'], title='Printer jams')
+    db.session.commit()
+    render_row(app, ticket, users['admin'])
+    ticket.title = 'Printer on fire'
+
+    get_fragment_cache().on_event(events.STATUS_CHANGED, {'ticket': {'id': ticket.id}})
+
+    assert render_row(app, ticket, users['admin']) == 'Printer on fire for admin'
@@ -0,0 +1,133 @@
+import sys
+
+import pytest
+from sqlalchemy import text
+
+import identity_cache
+from identity_cache import DatabaseVersionStore, IdentityCache, LocalVersionStore, RedisVersionStore
+from models import User
+
+from conftest import client_for
+
+
+class FakeRedis:
+    """The two calls RedisVersionStore makes, for when redis isn't installed."""
+
+    counters = {}
+
+    @classmethod
+    def from_url(cls, url):
+        return cls()
+
+    def get(self, key):
+        value = self.counters.get(key)
+        return None if value is None else str(value).encode()
+
+    def incr(self, key):
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+
+
+@pytest.fixture(params=['local', 'database', 'redis'])
+def versions(request, db, monkeypatch):
+    if request.param == 'local':
+        return LocalVersionStore()
+    if request.param == 'database':
+        return DatabaseVersionStore()
+    monkeypatch.setattr(FakeRedis, 'counters', {})
+    monkeypatch.setitem(sys.modules, 'redis', type(sys)('redis'))
+    sys.modules['redis'].Redis = FakeRedis
+    return RedisVersionStore('redis://localhost:6379/0')
+
+
+def published(db, versions):
+    """The version another worker would read right now."""
+    if versions.transactional:
+        with db.engine.connect() as connection:
+            return connection.execute(
+                text('SELECT version FROM cache_version WHERE name = :name'), {'name': versions.name}
+            ).scalar() or 0
+    return versions.current()
+
+
+def next_request(db):
+    # Each request gets a fresh session; the cache must not lean on the identity map
+    db.session.remove()
+
+
+def test_bump_is_published_with_the_commit(db, users, versions):
+    cache = IdentityCache(versions, check_interval=0)
+    db.session.get(User, users['customer'].id).is_agent = True
+    cache.invalidate()
+
+    assert published(db, versions) == 0
+    assert identity_cache.PENDING_INVALIDATION in db.session.info
+
+    db.session.commit()
+
+    assert published(db, versions) == 1
+    assert identity_cache.PENDING_INVALIDATION not in db.session.info
+
+
+def test_rollback_does_not_bump(db, users, versions):
+    cache = IdentityCache(versions, check_interval=0)
+    db.session.get(User, users['customer'].id).is_agent = True
+    cache.invalidate()
+    db.session.rollback()
+    db.session.commit()
+
+    assert published(db, versions) == 0
+
+
+def test_savepoint_rollback_keeps_the_pending_bump(db, users, versions):
+    cache = IdentityCache(versions, check_interval=0)
+    db.session.get(User, users['customer'].id).is_agent = True
+    cache.invalidate()
+    with pytest.raises(RuntimeError):
+        with db.session.begin_nested():
+            raise RuntimeError
+    db.session.commit()
+
+    assert published(db, versions) == 1
+
+
+def test_stale_entry_is_dropped_after_another_worker_changes_a_role(db, users, versions):
+    mine, theirs = IdentityCache(versions, check_interval=0), IdentityCache(versions, check_interval=0)
+    customer_id = users['customer'].id
+    next_request(db)
+    assert mine.get_user(customer_id).is_agent is False
+    next_request(db)
+    assert mine.get_user(customer_id).is_agent is False # served from the cache
+
+    next_request(db)
+    db.session.get(User, customer_id).is_agent = True
+    theirs.invalidate()
+    db.session.commit()
+
+    next_request(db)
+    assert mine.get_user(customer_id).is_agent is True
+    assert (customer_id, 'customer') in mine.agent_choices()
+
+
+def test_entry_recached_before_the_commit_is_dropped(db, users):
+    cache = IdentityCache(LocalVersionStore(), check_interval=0)
+    customer_id = users['customer'].id
+    db.session.get(User, customer_id).is_agent = True
+    cache.invalidate()
+    cache.cache.set(('user', customer_id), 'stale') # a request that ran before the commit
+    db.session.commit()
+
+    assert cache.cache.get(('user', customer_id)) is None
+
+
+def test_role_change_is_seen_on_the_next_request(app, db, users):
+    agent = client_for(app, users['agent'])
+    admin = client_for(app, users['admin'])
+    assert agent.get('/agent_dashboard').status_code == 200
+
+    response = admin.post(f"/user/{users['agent'].id}/toggle_agent_status")
+    assert response.status_code == 302
+
+    response = agent.get('/agent_dashboard')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/home')
@@ -0,0 +1,109 @@
+import smtplib
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import notifications
+from models import OutboxMessage
+
+from conftest import Clock, make_ticket
+
+
+class FakeMailer:
+    """Stands in for SMTPMailer; `fail` makes every send raise."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def send(self, message):
+        if self.fail:
+            raise smtplib.SMTPServerDisconnected('gone')
+        self.sent.append(message)
+
+
+@pytest.fixture
+def ticket(db, users):
+    ticket = make_ticket(db, users['customer'], agent_id=users['agent'].id)
+    db.session.commit()
+    return ticket
+
+
+def worker(mailer, clock, **options):
+    return notifications.NotificationWorker(mailer, 'support@example.com', 'http://tickets.example.com',
+                                            clock=clock, **options)
+
+
+def later():
+    # Past NOTIFY_COALESCE_SECONDS, which enqueueing measures from the real clock
+    return Clock(datetime.utcnow() + timedelta(minutes=5))
+
+
+def enqueue(ticket, users, *statuses):
+    for status in statuses:
+        old_status, ticket.status = ticket.status, status
+        ticket.last_updated = datetime.utcnow() + timedelta(seconds=len(ticket.status))
+        notifications.enqueue_status_change(ticket, old_status, users['agent'])
+
+
+def test_updates_to_one_ticket_go_out_as_one_email(db, users, ticket):
+    enqueue(ticket, users, 'In Progress', 'Resolved')
+    db.session.commit()
+    mailer = FakeMailer()
+
+    assert worker(mailer, later()).run_once() == (1, 0)
+
+    [email] = mailer.sent
+    assert email['To'] == users['customer'].email
+    assert 'Status changed to Resolved' in email.get_content()
+    assert {message.status for message in OutboxMessage.query} == {'sent'}
+
+
+def test_the_same_change_is_only_queued_once(db, users, ticket):
+    # e.g. a retried request: same ticket, status and last_updated, same key
+    ticket.status, ticket.last_updated = 'In Progress', datetime(2025, 1, 6, 9, 0)
+    notifications.enqueue_status_change(ticket, 'Open', users['agent'])
+    db.session.commit()
+    notifications.enqueue_status_change(ticket, 'Open', users['agent'])
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+
+
+def test_claimed_messages_are_leased_until_they_expire(db, users, ticket):
+    enqueue(ticket, users, 'In Progress')
+    db.session.commit()
+    clock = later()
+    first = worker(FakeMailer(), clock, lease_seconds=300)
+
+    assert len(first.claim()) == 1
+    assert worker(FakeMailer(), clock).claim() == [] # still leased to the first worker
+
+    clock.advance(seconds=301) # the first worker died without sending
+    mailer = FakeMailer()
+    assert worker(mailer, clock).run_once() == (1, 0)
+    assert len(mailer.sent) == 1
+
+
+def test_failed_sends_back_off_then_give_up(db, users, ticket):
+    enqueue(ticket, users, 'In Progress')
+    db.session.commit()
+    clock = later()
+    failing = worker(FakeMailer(fail=True), clock, max_attempts=2, backoff_base=60)
+
+    assert failing.run_once() == (0, 1)
+    message = OutboxMessage.query.one()
+    assert (message.status, message.attempts) == ('pending', 1)
+    assert timedelta(seconds=48) <= message.available_at - clock.now <= timedelta(seconds=72)
+    assert failing.run_once() == (0, 0) # not due again yet
+
+    clock.advance(minutes=2)
+    assert failing.run_once() == (0, 1)
+    message = db.session.get(OutboxMessage, message.id)
+    assert (message.status, message.attempts, message.last_error) == ('failed', 2, 'gone')
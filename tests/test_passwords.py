@@ -0,0 +1,44 @@
+import time
+
+import pytest
+
+from passwords import HashingBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(rounds=4, pool_size=1, max_pending=2, timeout=0.2)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hash_round_trip_and_rehash(hasher):
+    hashed = hasher.hash('correct horse')
+
+    assert hasher.check(hashed, 'correct horse')
+    assert not hasher.check(hashed, 'wrong horse')
+    assert not hasher.needs_rehash(hashed)
+    assert PasswordHasher(rounds=5, pool_size=0).needs_rehash(hashed)
+
+
+def test_timed_out_hash_is_busy_and_keeps_its_slot_until_done(hasher):
+    hasher.warm()
+    with pytest.raises(HashingBusy):
+        hasher._run(time.sleep, 0.5) # running, so it can't be cancelled
+    assert hasher._slots.acquire(blocking=False) # max_pending=2: one slot left...
+    assert not hasher._slots.acquire(blocking=False) # ...the sleep still holds the other
+    hasher._slots.release()
+
+    time.sleep(0.5)
+    assert hasher.check(hasher.hash('x'), 'x')
+    assert hasher._slots.acquire(blocking=False) and hasher._slots.acquire(blocking=False)
+
+
+def test_login_answers_503_when_hashing_times_out(app, users, hasher):
+    app.extensions['password_hasher'] = hasher
+    hasher._executor().submit(time.sleep, 1) # the pool is backed up
+
+    response = app.test_client().post('/login', data={'email': 'customer@example.com', 'password': 'x'})
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
@@ -0,0 +1,24 @@
+import query_plans
+
+
+def test_hot_queries_use_indexes_without_sorting(seeded):
+    failures = [f"{name}: scans {scans}, sorts {sorts}, plan {plan}"
+                for name, plan, scans, sorts in query_plans.check_query_plans() if scans or sorts]
+    assert not failures, '\n'.join(failures)
+
+
+def test_every_hot_path_is_checked(app):
+    names = [name for name, statement in query_plans.dashboard_queries()]
+    for expected in ('user_dashboard', 'agent_dashboard (assigned)', 'agent_dashboard (unassigned)',
+                     'admin_dashboard', 'api delta sync', 'claim next', 'unassigned count', 'sla due tickets'):
+        assert expected in names
+
+
+def test_sorts_are_reported(seeded, db):
+    # An ORDER BY no index covers must be caught, or the check proves nothing
+    from sqlalchemy import select
+    from models import Ticket
+    with db.engine.connect() as connection:
+        plan = query_plans._explain(connection, select(Ticket.id).order_by(Ticket.title))
+    assert query_plans._sorts('sqlite', plan)
+    assert query_plans._full_scans('sqlite', plan) == ['ticket']
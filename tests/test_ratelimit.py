@@ -0,0 +1,66 @@
+import pytest
+
+from app import create_app
+from extensions import db
+from ratelimit import MemoryRateLimitBackend, get_rate_limiter
+
+
+class Ticker:
+    """A settable stand-in for time.monotonic."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_refills_at_the_rate():
+    ticker = Ticker()
+    backend = MemoryRateLimitBackend(clock=ticker)
+    bucket = [('login:ip:1.2.3.4', 3, 0.5)] # 3 at once, then one every 2 seconds
+
+    assert [backend.acquire(bucket) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert backend.acquire(bucket) == pytest.approx(2.0)
+    ticker.now += 1
+    assert backend.acquire(bucket) == pytest.approx(1.0)
+    ticker.now += 1
+    assert backend.acquire(bucket) == 0.0
+
+    ticker.now += 3600 # refills up to the capacity, no further
+    assert [backend.acquire(bucket) for _ in range(4)][-1] == pytest.approx(2.0)
+
+
+def test_an_empty_bucket_takes_no_token_from_the_others():
+    backend = MemoryRateLimitBackend(clock=Ticker())
+    account, ip = ('account', 1, 1 / 60), ('ip', 5, 5 / 60)
+    backend.acquire([account])
+
+    assert backend.acquire([account, ip]) == pytest.approx(60)
+    assert [backend.acquire([ip]) for _ in range(5)] == [0.0] * 5
+
+
+@pytest.fixture
+def limited_app(tmp_path):
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+                     RATE_LIMIT_ENABLED=True, RATE_LIMITS={'main.login': (('ip', 2, 60), ('account', 5, 60))})
+    ticker = Ticker()
+    with app.app_context():
+        db.create_all()
+        get_rate_limiter().backend = MemoryRateLimitBackend(clock=ticker)
+    return app, ticker
+
+
+def test_excess_logins_get_a_429_until_the_bucket_refills(limited_app):
+    app, ticker = limited_app
+    client = app.test_client()
+    login = {'email': 'nobody@example.com', 'password': 'guess'}
+
+    assert [client.post('/login', data=login).status_code for _ in range(2)] == [200, 200]
+    assert client.get('/login').status_code == 200 # rendering the form is never counted
+    response = client.post('/login', data=login)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '30'
+
+    ticker.now += 30
+    assert client.post('/login', data=login).status_code == 200
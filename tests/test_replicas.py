@@ -0,0 +1,90 @@
+import shutil
+import sqlite3
+
+import pytest
+
+from app import create_app
+from extensions import db
+from models import User
+
+from conftest import client_for
+
+
+class Lag:
+    """REPLICA_LAG_PROBE stand-in: the SQLite "replica" is as far behind as we say."""
+
+    def __init__(self):
+        self.seconds = 0.0
+
+    def __call__(self, connection):
+        return self.seconds
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    """
+    An app over two SQLite files, the second a copy of the first standing
+    in for a replica; each then gets one ticket the other hasn't, so a page
+    shows which database it was read from.
+    """
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    lag = Lag()
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI=f'sqlite:///{primary}',
+                     DATABASE_REPLICA_URLS=[f'sqlite:///{replica}'],
+                     REPLICA_LAG_PROBE=lag, REPLICA_LAG_CHECK_INTERVAL=0, ROUTING_ENABLED=False)
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', password='x', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        db.session.refresh(admin)
+        db.session.expunge(admin) # kept for client_for()
+        db.engine.dispose()
+    shutil.copy(primary, replica)
+    # Different ids, or the fragment cache would hand one's row to the other
+    for path, ticket_id, title in ((primary, 1, 'Only on the primary'), (replica, 2, 'Only on the replica')):
+        with sqlite3.connect(path) as connection:
+            connection.execute(
+                "INSERT INTO ticket (id, title, description, status, priority, category, user_id,"
+                " date_posted, last_updated, sla_level)"
+                " VALUES (?, ?, 'd', 'Open', 'Low', 'Other', ?, '2026-01-01', '2026-01-01', 0)",
+                (ticket_id, title, admin.id))
+        connection.close()
+    yield app, admin, lag
+    # init_app() registered a MetaData for the replica bind on the shared db;
+    # later apps have no such engine, and their create_all() would look for it
+    db.metadatas.pop('replica_0', None)
+
+
+def read_from(client):
+    html = client.get('/admin_dashboard').get_data(as_text=True)
+    return [name for name in ('primary', 'replica') if f'Only on the {name}' in html]
+
+
+def test_dashboard_reads_from_a_current_replica(replicated):
+    app, admin, lag = replicated
+    assert read_from(client_for(app, admin)) == ['replica']
+
+
+def test_reads_stay_on_the_primary_after_a_write(replicated):
+    app, admin, lag = replicated
+    client = client_for(app, admin)
+
+    response = client.post('/ticket/1/status', data={'status': 'In Progress'})
+    assert response.status_code == 302
+
+    assert read_from(client) == ['primary']
+    assert read_from(client_for(app, admin)) == ['replica'] # other sessions are unaffected
+
+
+@pytest.mark.parametrize('seconds', [60.0, None]) # too far behind; replication broken
+def test_lagging_replica_falls_back_to_the_primary(replicated, seconds):
+    app, admin, lag = replicated
+    client = client_for(app, admin)
+    lag.seconds = seconds
+    assert read_from(client) == ['primary']
+
+    lag.seconds = 0.0
+    assert read_from(client) == ['replica']
+
+
@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import routing
+from models import Ticket
+
+from conftest import client_for, make_ticket
+
+
+def test_claim_takes_most_urgent_then_oldest_open_ticket(db, users):
+    start = datetime(2024, 1, 1)
+    make_ticket(db, users['customer'], priority='High', status='Closed', date_posted=start)
+    make_ticket(db, users['customer'], priority='Low', date_posted=start)
+    older = make_ticket(db, users['customer'], priority='High', date_posted=start + timedelta(hours=1))
+    newer = make_ticket(db, users['customer'], priority='High', date_posted=start + timedelta(hours=2))
+    db.session.commit()
+
+    claimed = [routing.claim_next(users['agent']).id for _ in range(2)]
+
+    assert claimed == [older.id, newer.id]
+    assert db.session.get(Ticket, older.id).agent_id == users['agent'].id
+
+
+def test_claim_skips_assigned_and_closed_tickets(db, users):
+    make_ticket(db, users['customer'], agent_id=users['other_agent'].id)
+    make_ticket(db, users['customer'], status='Closed')
+    db.session.commit()
+
+    assert routing.claim_next(users['agent']) is None
+    assert routing.queue_size() == 0
+
+
+def test_dashboard_reuses_the_unassigned_count_briefly(app, db, users):
+    make_ticket(db, users['customer'])
+    db.session.commit()
+    agent = client_for(app, users['agent'])
+    assert '1 unassigned ticket<' in agent.get('/agent_dashboard').get_data(as_text=True)
+
+    make_ticket(db, users['customer'])
+    db.session.commit()
+    assert '1 unassigned ticket<' in agent.get('/agent_dashboard').get_data(as_text=True)
+
+    app.extensions['routing_queue_size'].clear() # as when ROUTING_QUEUE_SIZE_TTL runs out
+    assert '2 unassigned tickets<' in agent.get('/agent_dashboard').get_data(as_text=True)
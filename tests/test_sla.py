@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import routing
+import sla
+from models import OutboxMessage, Ticket, TicketResponse
+
+from conftest import Clock, make_ticket
+
+START = datetime(2025, 1, 6, 9, 0)
+
+
+def open_ticket(db, users, priority='Urgent', **values):
+    values.setdefault('agent_id', users['agent'].id)
+    ticket = make_ticket(db, users['customer'], priority=priority, date_posted=START, last_updated=START, **values)
+    sla.start(ticket)
+    db.session.commit()
+    return ticket
+
+
+def test_due_query_takes_earliest_deadlines_first(db, users):
+    low = open_ticket(db, users, priority='Low') # 168h
+    urgent = open_ticket(db, users, priority='Urgent') # 4h
+    high = open_ticket(db, users, priority='High') # 24h
+    open_ticket(db, users, status='Closed') # no deadline
+
+    due = db.session.execute(sla.due_query(START + timedelta(days=2), 10)).scalars().all()
+
+    assert due == [urgent.id, high.id]
+    assert db.session.execute(sla.due_query(START + timedelta(days=8), 1)).scalars().all() == [urgent.id]
+    assert low.sla_due_at == START + timedelta(hours=168)
+
+
+def test_escalation_steps_notify_then_bump_priority_then_reassign(app, db, users):
+    app.config['ROUTING_ENABLED'] = True
+    routing.ensure_agent(users['agent'].id)
+    routing.ensure_agent(users['other_agent'].id)
+    clock = Clock(START)
+    ticket = open_ticket(db, users, priority='High')
+    scheduler = sla.SLAScheduler(clock=clock)
+
+    actions = []
+    for _ in range(3):
+        clock.advance(hours=25)
+        actions.extend(scheduler.run_once().values())
+
+    ticket = db.session.get(Ticket, ticket.id)
+    assert actions == ['notify', 'bump_priority', 'reassign']
+    assert (ticket.priority, ticket.agent_id, ticket.sla_level) == ('Urgent', users['other_agent'].id, 3)
+    assert ticket.sla_due_at == clock.now + timedelta(hours=4)
+
+
+def test_nothing_is_due_before_the_deadline(db, users):
+    clock = Clock(START + timedelta(hours=3))
+    open_ticket(db, users)
+
+    assert sla.SLAScheduler(clock=clock).run_once() == {}
+
+
+def test_staff_reply_restarts_the_clock_and_customer_reply_does_not(db, users):
+    ticket = open_ticket(db, users)
+    ticket.sla_level = 2
+
+    def reply(author, **values):
+        response = TicketResponse(ticket=ticket, user_id=author.id, content='Any news?', **values)
+        db.session.add(response)
+        sla.record_response(response, by_staff=author.is_agent)
+
+    later = START + timedelta(hours=3)
+    reply(users['customer'])
+    assert (ticket.sla_due_at, ticket.sla_level) == (START + timedelta(hours=4), 2)
+
+    ticket.last_updated = later
+    reply(users['agent'])
+    assert (ticket.sla_due_at, ticket.sla_level) == (later + timedelta(hours=4), 0)
+
+    ticket.last_updated = later + timedelta(hours=1)
+    reply(users['agent'], is_internal_note=True)
+    assert ticket.sla_due_at == later + timedelta(hours=4)
+
+
+def test_breach_after_staff_activity_escalates_again(db, users):
+    clock = Clock(START)
+    ticket = open_ticket(db, users)
+    scheduler = sla.SLAScheduler(clock=clock)
+
+    clock.advance(hours=5)
+    assert scheduler.run_once() == {ticket.id: 'notify'}
+
+    # Staff move it along: the clock restarts at level 0
+    ticket.status, ticket.last_updated = 'In Progress', clock.now
+    sla.record_status_change(ticket, 'Open')
+    db.session.commit()
+
+    clock.advance(hours=5)
+    assert scheduler.run_once() == {ticket.id: 'notify'}
+    assert db.session.get(Ticket, ticket.id).sla_level == 1
+    assert OutboxMessage.query.filter_by(event='sla_breached', ticket_id=ticket.id).count() == 2
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from benchmarks import startup
+
+# Loaded CI machines can raise the budget rather than skip: STARTUP_BUDGET_MS=3000
+BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 1500))
+
+
+@pytest.mark.slow
+def test_cold_start_is_within_budget():
+    samples, _ = startup.measure(runs=3)
+    failures = startup.failures(samples, BUDGET_MS)
+    assert not failures, '\n'.join(failures)
+
+
+def test_failures_are_reported():
+    sample = {'first_200_s': 2.0, 'status': 500, 'modules': ['app', 'pandas']}
+    assert startup.failures([sample], 1500) == [
+        'median time to first 200 2000.0 ms > budget 1500 ms',
+        'serving path imported pandas',
+        'GET /login answered [500]',
+    ]
+    assert startup.failures([dict(sample, first_200_s=0.2, status=200, modules=['app'])], 1500) == []